@@ -0,0 +1,43 @@
+import os
+from sqlalchemy.engine import make_url, URL
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine, AsyncSession
+
+
+def async_database_url(url: str) -> URL:
+    """postgresql:// (or +psycopg2) URLs from .env -> the asyncpg driver."""
+    parsed = make_url(url)
+    if parsed.drivername in ("postgresql", "postgres", "postgresql+psycopg2"):
+        parsed = parsed.set(drivername="postgresql+asyncpg")
+    return parsed
+
+
+def create_db_engine(url: str = None) -> AsyncEngine:
+    """
+    Async (asyncpg) engine with an explicitly sized pool:
+
+    DB_POOL_SIZE / DB_MAX_OVERFLOW   persistent and burst connections
+    DB_POOL_TIMEOUT                  seconds to wait for a free connection
+    DB_POOL_RECYCLE                  reconnect connections older than this
+    DB_POOL_PRE_PING                 check connections on checkout (1 = on)
+    DB_STATEMENT_CACHE_SIZE          prepared statements cached per connection
+                                     (0 behind PgBouncer in transaction mode)
+    """
+    statement_cache = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 100))
+    url = async_database_url(url or os.getenv("DATABASE_URL"))
+    # SQLAlchemy's own prepared statement cache for the asyncpg dialect
+    url = url.update_query_dict({"prepared_statement_cache_size": str(statement_cache)})
+    return create_async_engine(
+        url,
+        pool_size=int(os.getenv("DB_POOL_SIZE", 10)),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", 20)),
+        pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", 30)),
+        pool_recycle=int(os.getenv("DB_POOL_RECYCLE", 1800)),
+        pool_pre_ping=os.getenv("DB_POOL_PRE_PING", "1") != "0",
+        # asyncpg's statement cache
+        connect_args={"statement_cache_size": statement_cache},
+    )
+
+
+def create_session_maker(engine: AsyncEngine) -> async_sessionmaker:
+    # Rows stay readable after commit, the API serialises them afterwards
+    return async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False, autoflush=False)
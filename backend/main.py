@@ -2,18 +2,26 @@ import os
 import json
 import asyncio
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import List, Optional
 
 
-from websockets.exceptions import ConnectionClosedError
 from fastapi import FastAPI, Query, HTTPException, Depends, WebSocket, WebSocketDisconnect
-from sqlalchemy import create_engine, func, desc, text
-from sqlalchemy.orm import sessionmaker, Session
-from redis import Redis
+from sqlalchemy import select, func, desc, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from redis.asyncio import Redis as AsyncRedis
 
 from services.alerting import AlertService
+from services.alert_rules import load_rules, rule_windows
+from services.emotion_backfill import EmotionBackfill
+from services.fanout import ConnectionManager
+from services.rollups import read_rollups, truncate, PERIOD_STEPS
+from services.windows import SlidingWindowCounters
+from services.leader import LeaderElection
+from services.response_cache import ResponseCache
+from services.pagination import encode_cursor, decode_cursor, keyset_after, estimate_count, InvalidCursor
 from models import Base, SocialMediaPost, SentimentAnalysis, SentimentAlert
+from database import create_db_engine, create_session_maker
 
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -24,13 +32,12 @@ from fastapi.middleware.cors import CORSMiddleware
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("BackendAPI")
 
-# 2. Initialize Database Engine FIRST
-DATABASE_URL = os.getenv("DATABASE_URL")
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# 2. Initialize the async (asyncpg) Database Engine FIRST; its pool is
+# configured through the DB_POOL_* variables (see database.py)
+engine = create_db_engine()
+SessionLocal = create_session_maker(engine)
 
-# 3. NOW Create Tables (This must come AFTER engine is defined)
-Base.metadata.create_all(bind=engine)
+# 3. Tables are created in startup_event, which has an event loop
 
 # 4. Initialize FastAPI and Redis
 app = FastAPI(title="SentiStream API")
@@ -44,121 +51,137 @@ app.add_middleware(
 )
 
 
-redis_client = Redis(host=os.getenv("REDIS_HOST", "redis"), port=6379, decode_responses=True)
+# Published by the worker for every newly analysed post
+EVENTS_CHANNEL = os.getenv("SENTIMENT_EVENTS_CHANNEL", "sentiment_events")
+# Capped stream the worker keeps the same events in, for WebSocket resume
+EVENTS_STREAM = os.getenv("SENTIMENT_EVENTS_STREAM", f"{EVENTS_CHANNEL}:log")
+async_redis_client = AsyncRedis(host=os.getenv("REDIS_HOST", "redis"), port=6379, decode_responses=True)
+
+# Emotions the worker skipped (EMOTION_POLICY) are computed here on first use
+emotion_backfill = EmotionBackfill(async_redis_client)
 
 # ... (rest of your code: ConnectionManager, get_db, endpoints, etc.) ...
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 # --- 4.2 WebSocket Connection Manager ---
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        # 1. Accept the connection FIRST
-        await websocket.accept()
-        
-        # 2. Add to list
-        self.active_connections.append(websocket)
-        
-        # 3. Try to send the welcome message, but catch errors if they disconnect immediately
-        try:
-            await websocket.send_json({
-                "type": "connected",
-                "message": "Connected to sentiment stream",
-                "timestamp": datetime.utcnow().isoformat()
-            })
-        except Exception as e:
-            logger.error(f"Error sending welcome message: {e}")
-            self.disconnect(websocket)
+# One Redis subscription per process fans out to every socket (services/fanout.py)
+manager = ConnectionManager()
 
+# Analytics responses, invalidated by the worker's data version bumps (services/response_cache.py)
+response_cache = ResponseCache(async_redis_client)
 
-manager = ConnectionManager()
+# --- 4.2 Live counts ---
+# Trailing windows of the live feed, per label and source (services/windows.py);
+# the metrics broadcaster and the alert service read these instead of Postgres
+METRIC_WINDOWS = {"last_minute": 60, "last_hour": 3600, "last_24_hours": 86400}
+# Alert rules from ALERT_RULES (services/alert_rules.py), each with its own windows
+alert_rules = load_rules()
+live_counts = SlidingWindowCounters({**METRIC_WINDOWS, **rule_windows(alert_rules)})
+alert_service = AlertService(SessionLocal, live_counts, alert_rules)
+
+# The leader's metrics reach every replica's WebSocket clients through this channel
+METRICS_CHANNEL = os.getenv("SENTIMENT_METRICS_CHANNEL", "sentiment_metrics")
+
+def on_live_event(raw):
+    """Every worker event from the live feed: count it, then let the alert rules see it.
+    Followers keep their counters warm for a failover but only the leader alerts."""
+    live_counts.record_event(raw)
+    if leader.is_leader:
+        alert_service.observe(raw)
 
 # --- 4.2 Periodic Metrics Task (FIXED NEATLY) ---
 async def metrics_broadcaster():
-    """Background loop to calculate and broadcast metrics every 30 seconds."""
+    """Leader-only loop: publish the live counts every METRICS_INTERVAL_SECONDS (1) when they change."""
+    interval = float(os.getenv("METRICS_INTERVAL_SECONDS", 1))
+    last = None
     while True:
-        await asyncio.sleep(30)
-        # Using 'with' ensures the session is closed even if the loop crashes
-        with SessionLocal() as db:
-            try:
-                now = datetime.utcnow()
-                timeframes = {
-                    "last_minute": now - timedelta(minutes=1),
-                    "last_hour": now - timedelta(hours=1),
-                    "last_24_hours": now - timedelta(hours=24)
-                }
-                
-                metrics = {}
-                for timeframe_key, threshold in timeframes.items():
-                    counts = db.query(
-                        SentimentAnalysis.sentiment_label, 
-                        func.count(SentimentAnalysis.id)
-                    ).join(SocialMediaPost, SocialMediaPost.post_id == SentimentAnalysis.post_id)\
-                    .filter(SocialMediaPost.created_at >= threshold)\
-                    .group_by(SentimentAnalysis.sentiment_label).all()
-                    
-                    mapping = {row[0]: row[1] for row in counts}
-                    metrics[timeframe_key] = {
-                        "positive": mapping.get("positive", 0),
-                        "negative": mapping.get("negative", 0),
-                        "neutral": mapping.get("neutral", 0),
-                        "total": sum(mapping.values())
-                    }
-
-                await manager.broadcast({
-                    "type": "metrics_update",
-                    "data": metrics,
-                    "timestamp": datetime.utcnow().isoformat()
-                })
-            except Exception as e:
-                logger.error(f"Metrics broadcast error: {e}")
+        await asyncio.sleep(interval)
+        try:
+            metrics = {window: live_counts.counts(window) for window in METRIC_WINDOWS}
+            if metrics != last:
+                # Every replica's subscriber hands it to broadcast_metrics
+                await async_redis_client.publish(METRICS_CHANNEL, json.dumps(metrics))
+                last = metrics
+        except Exception as e:
+            logger.error(f"Metrics broadcast error: {e}")
+
+# --- Singleton background jobs ---
+# One API process across all replicas holds the Redis lease and runs these
+leader = LeaderElection(async_redis_client, [metrics_broadcaster, alert_service.run_monitoring_loop])
 
 @app.on_event("startup")
 async def startup_event():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
     # # Run the broadcaster in the current event loop
     # asyncio.create_task(metrics_broadcaster())
-    # 1. Initialize the Alert Service using the DB session maker
-    alert_service = AlertService(SessionLocal)
+    # Seed the live windows before the feed starts adding to them
+    try:
+        async with SessionLocal() as db:
+            await live_counts.backfill(db)
+    except Exception as e:
+        logger.error(f"Sliding window backfill failed, starting empty: {e}")
     
-    # 2. Start the background tasks
-    asyncio.create_task(metrics_broadcaster())
-    # This is the new part:
-    asyncio.create_task(alert_service.run_monitoring_loop())
+    # 2. Start the background tasks (metrics and alerts only on the elected leader)
+    app.state.leader = asyncio.create_task(leader.run())
+    # The only sentiment_events subscription in this process
+    app.state.subscriber = asyncio.create_task(manager.run_subscriber(
+        async_redis_client, EVENTS_CHANNEL, on_event=on_live_event, metrics_channel=METRICS_CHANNEL
+    ))
+    # Coalesced new_posts frames for subscribed clients
+    app.state.ticker = asyncio.create_task(manager.run_ticker())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    app.state.subscriber.cancel()
+    app.state.ticker.cancel()
+    # Stops the jobs and releases the lease so another replica takes over at once
+    app.state.leader.cancel()
+    try:
+        await app.state.leader
+    except asyncio.CancelledError:
+        pass
+    await engine.dispose()
+    await async_redis_client.aclose()
 
 # --- Endpoint 1: Health Check ---
 @app.get("/api/health")
-async def health_check(db: Session = Depends(get_db)):
+async def health_check(db: AsyncSession = Depends(get_db)):
     status = "healthy"
     services = {"database": "connected", "redis": "connected"}
     try:
-        db.execute(text("SELECT 1"))
+        await db.execute(text("SELECT 1"))
     except:
         services["database"] = "disconnected"
         status = "unhealthy"
     try:
-        redis_client.ping()
+        await async_redis_client.ping()
     except:
         services["redis"] = "disconnected"
         status = "unhealthy"
 
-    total_posts = db.query(SocialMediaPost).count()
+    total_posts = await db.scalar(select(func.count(SocialMediaPost.id)))
     one_hour_ago = datetime.utcnow() - timedelta(hours=1)
-    recent_posts = db.query(SocialMediaPost).filter(SocialMediaPost.created_at >= one_hour_ago).count()
+    recent_posts = await db.scalar(select(func.count(SocialMediaPost.id)).where(SocialMediaPost.created_at >= one_hour_ago))
+
+    # Latest consumer-group lag report published by the workers
+    try:
+        stream_lag = await async_redis_client.hgetall(f"sentistream:lag:{os.getenv('REDIS_STREAM_NAME', 'social_posts_stream')}") or None
+    except Exception:
+        stream_lag = None
 
     response = {
         "status": status,
         "timestamp": datetime.utcnow().isoformat(),
         "services": services,
+        "stream_lag": stream_lag,
+        "background_jobs": leader.status(),
         "stats": {
             "total_posts": total_posts,
-            "total_analyses": db.query(SentimentAnalysis).count(),
+            "total_analyses": await db.scalar(select(func.count(SentimentAnalysis.id))),
             "recent_posts_1h": recent_posts
         }
     }
@@ -170,17 +193,62 @@ async def health_check(db: Session = Depends(get_db)):
 async def get_posts(
     limit: int = Query(50, ge=1, le=100),
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
     source: Optional[str] = None,
     sentiment: Optional[str] = None,
-    db: Session = Depends(get_db)
+    total: str = Query("estimate", regex="^(exact|estimate|none)$"),
+    db: AsyncSession = Depends(get_db)
 ):
-    query = db.query(SocialMediaPost, SentimentAnalysis).join(
+    """
+    Newest posts first. Page with `cursor` (the previous page's next_cursor):
+    a keyset seek on (created_at, id) that costs the same on every page.
+    `offset` still works for old clients but gets slower the deeper it goes.
+    `total` is the planner's estimate by default; `exact` counts the whole
+    join and `none` skips it. The first page is served from the response cache.
+    """
+    if cursor or offset:
+        return await fetch_posts(db, limit, offset, cursor, source, sentiment, total)
+
+    async def compute():
+        async with SessionLocal() as session:
+            return await fetch_posts(session, limit, 0, None, source, sentiment, total)
+    params = {"limit": limit, "source": source, "sentiment": sentiment, "total": total}
+    result, _ = await response_cache.get("posts", params, compute, source=source)
+    return result
+
+async def fetch_posts(db: AsyncSession, limit: int, offset: int, cursor: Optional[str],
+                      source: Optional[str], sentiment: Optional[str], total: str):
+    query = select(SocialMediaPost, SentimentAnalysis).join(
         SentimentAnalysis, SocialMediaPost.post_id == SentimentAnalysis.post_id
     )
-    if source: query = query.filter(SocialMediaPost.source == source)
-    if sentiment: query = query.filter(SentimentAnalysis.sentiment_label == sentiment)
-    total = query.count()
-    results = query.order_by(desc(SocialMediaPost.created_at)).offset(offset).limit(limit).all()
+    if source: query = query.where(SocialMediaPost.source == source)
+    if sentiment: query = query.where(SentimentAnalysis.sentiment_label == sentiment)
+
+    count = None
+    if total == "exact":
+        count = await db.scalar(select(func.count()).select_from(query.subquery()))
+    elif total == "estimate":
+        count = await estimate_count(db, query)
+
+    page = query.order_by(desc(SocialMediaPost.created_at), desc(SocialMediaPost.id), desc(SentimentAnalysis.id))
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        page = page.where(keyset_after(SocialMediaPost.created_at, SocialMediaPost.id, SentimentAnalysis.id, after))
+    elif offset:
+        page = page.offset(offset)
+    # One extra row tells whether there is a next page
+    results = (await db.execute(page.limit(limit + 1))).all()
+    has_more = len(results) > limit
+    results = results[:limit]
+    await emotion_backfill.fill(db, [(s, p.content) for p, s in results])
+
+    next_cursor = None
+    if has_more:
+        p, s = results[-1]
+        next_cursor = encode_cursor(p.created_at, p.id, s.id)
 
     return {
         "posts": [{
@@ -191,48 +259,55 @@ async def get_posts(
                 "emotion": s.emotion, "model_name": s.model_name
             }
         } for p, s in results],
-        "total": total, "limit": limit, "offset": offset,
+        "total": count, "total_is_estimate": total == "estimate",
+        "limit": limit, "offset": offset, "next_cursor": next_cursor,
         "filters": {"source": source, "sentiment": sentiment}
     }
 
 # --- Endpoint 3: Aggregate Sentiment ---
+# Window used when no start is given, per period
+DEFAULT_AGGREGATE_SPAN = {"minute": timedelta(hours=1), "hour": timedelta(hours=24), "day": timedelta(days=30)}
+MAX_AGGREGATE_BUCKETS = int(os.getenv("MAX_AGGREGATE_BUCKETS", 2000))
+
 @app.get("/api/sentiment/aggregate")
 async def get_sentiment_aggregate(
     period: str = Query(..., regex="^(minute|hour|day)$"),
-    db: Session = Depends(get_db)
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    source: Optional[str] = None
 ):
-    trunc = func.date_trunc(period, SocialMediaPost.created_at)
-    results = db.query(
-        trunc.label("ts"), SentimentAnalysis.sentiment_label,
-        func.count(SentimentAnalysis.id).label("count"),
-        func.avg(SentimentAnalysis.confidence_score).label("avg_conf")
-    ).join(SentimentAnalysis, SocialMediaPost.post_id == SentimentAnalysis.post_id)\
-     .group_by("ts", SentimentAnalysis.sentiment_label).order_by("ts").all()
-
-    data_map = {}
-    for ts, label, count, avg_conf in results:
-        ts_iso = ts.isoformat()
-        if ts_iso not in data_map:
-            data_map[ts_iso] = {"timestamp": ts_iso, "pos": 0, "neg": 0, "neu": 0, "conf_sum": 0, "count": 0}
-        if "pos" in label: data_map[ts_iso]["pos"] += count
-        elif "neg" in label: data_map[ts_iso]["neg"] += count
-        else: data_map[ts_iso]["neu"] += count
-        data_map[ts_iso]["count"] += count
-        data_map[ts_iso]["conf_sum"] += (avg_conf * count)
-
-    final_data = []
-    for item in data_map.values():
-        total = item["count"]
-        final_data.append({
-            "timestamp": item["timestamp"], "positive_count": item["pos"],
-            "negative_count": item["neg"], "neutral_count": item["neu"],
-            "total_count": total, "positive_percentage": round((item["pos"]/total)*100, 2),
-            "average_confidence": round(item["conf_sum"]/total, 2)
-        })
-    # return {"period": period, "data": final_data}
-    # Find the return line at the end of @app.get("/api/sentiment/aggregate")
+    """Trend buckets from the rollup tables the worker maintains; O(buckets), not O(posts).
+    Served from the response cache; without `end` the window ends at the time of computing,
+    and a cached response is only reused within the same bucket."""
+    aggregate_window(period, start, end)
+
+    async def compute():
+        window_start, window_end = aggregate_window(period, start, end)
+        async with SessionLocal() as db:
+            return await aggregate_response(db, period, window_start, window_end, source)
+    params = {"period": period, "start": start, "end": end, "source": source}
+    if end is None:
+        # An open window moves with the clock: a new bucket starts a new entry
+        params["bucket"] = truncate(datetime.utcnow(), period)
+    result, _ = await response_cache.get("aggregate", params, compute, source=source)
+    return result
+
+def aggregate_window(period: str, start: Optional[datetime], end: Optional[datetime]):
+    """Validated (start, end) as naive UTC, like created_at and the rollup buckets."""
+    start, end = [ts.astimezone(timezone.utc).replace(tzinfo=None) if ts and ts.tzinfo else ts for ts in (start, end)]
+    end = end or datetime.utcnow()
+    start = start or end - DEFAULT_AGGREGATE_SPAN[period]
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    if (end - start) / PERIOD_STEPS[period] > MAX_AGGREGATE_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"Range too large for period '{period}' (max {MAX_AGGREGATE_BUCKETS} buckets)")
+    return start, end
+
+async def aggregate_response(db: AsyncSession, period: str, start: datetime, end: datetime, source: Optional[str]):
+    final_data = await read_rollups(db, period, start, end, source)
     return {
-        "period": period, 
+        "period": period,
+        "start": start.isoformat(), "end": end.isoformat(), "source": source,
         "data": final_data,
         "summary": {
             "total_posts": sum(item["total_count"] for item in final_data),
@@ -244,72 +319,61 @@ async def get_sentiment_aggregate(
 
 # --- Endpoint 4: Sentiment Distribution ---
 @app.get("/api/sentiment/distribution")
-async def get_sentiment_distribution(hours: int = 24, db: Session = Depends(get_db)):
-    cache_key = f"dist_{hours}"
-    cached = redis_client.get(cache_key)
-    if cached: return {**json.loads(cached), "cached": True}
-
+async def get_sentiment_distribution(hours: int = 24):
+    async def compute():
+        async with SessionLocal() as db:
+            return await fetch_distribution(db, hours)
+    result, cached = await response_cache.get("distribution", {"hours": hours}, compute)
+    return {**result, "cached": cached}
+
+async def fetch_distribution(db: AsyncSession, hours: int):
     threshold = datetime.utcnow() - timedelta(hours=hours)
-    dist_query = db.query(
-        SentimentAnalysis.sentiment_label, func.count(SentimentAnalysis.id)
-    ).join(SocialMediaPost, SocialMediaPost.post_id == SentimentAnalysis.post_id)\
-     .filter(SocialMediaPost.created_at >= threshold)\
-     .group_by(SentimentAnalysis.sentiment_label).all()
+    dist_query = (await db.execute(
+        select(SentimentAnalysis.sentiment_label, func.count(SentimentAnalysis.id))
+        .join(SocialMediaPost, SocialMediaPost.post_id == SentimentAnalysis.post_id)
+        .where(SocialMediaPost.created_at >= threshold)
+        .group_by(SentimentAnalysis.sentiment_label)
+    )).all()
     
     dist = {label: count for label, count in dist_query}
     total = sum(dist.values()) or 1
     
-    emotions = db.query(SentimentAnalysis.emotion, func.count(SentimentAnalysis.id))\
-        .filter(SentimentAnalysis.post_id.in_(
-            db.query(SocialMediaPost.post_id).filter(SocialMediaPost.created_at >= threshold)
-        ))\
-        .group_by(SentimentAnalysis.emotion).order_by(desc(func.count(SentimentAnalysis.id))).limit(5).all()
+    # Only emotions the worker already computed; posts it skipped (see
+    # EMOTION_POLICY) are reported as pending instead of being inferred here
+    in_window = SentimentAnalysis.post_id.in_(
+        select(SocialMediaPost.post_id).where(SocialMediaPost.created_at >= threshold)
+    )
+    emotions = (await db.execute(
+        select(SentimentAnalysis.emotion, func.count(SentimentAnalysis.id))
+        .where(in_window, SentimentAnalysis.emotion.isnot(None))
+        .group_by(SentimentAnalysis.emotion).order_by(desc(func.count(SentimentAnalysis.id))).limit(5)
+    )).all()
+    pending = await db.scalar(
+        select(func.count(SentimentAnalysis.id)).where(in_window, SentimentAnalysis.emotion.is_(None))
+    )
 
-    result = {
+    return {
         "timeframe_hours": hours, "distribution": dist, "total": total,
-        "top_emotions": {e: c for e, c in emotions}, "cached": False
+        "top_emotions": {e: c for e, c in emotions},
+        "emotion_pending": pending or 0
     }
-    redis_client.setex(cache_key, 60, json.dumps(result, default=str))
-    return result
 
 
 
 # --- WebSocket Endpoint ---
 @app.websocket("/ws/sentiment")
-async def websocket_endpoint(websocket: WebSocket):
+async def websocket_endpoint(websocket: WebSocket, last_event_id: Optional[str] = None):
     await manager.connect(websocket) # This now handles accept()
-    
-    pubsub = redis_client.pubsub()
-    pubsub.subscribe("sentiment_events")
-    
     try:
+        # Reconnecting dashboards pass the last event they saw: replay the
+        # gap from the event log (or send a snapshot) instead of re-fetching
+        if last_event_id:
+            await manager.resume(websocket, async_redis_client, EVENTS_STREAM, last_event_id)
+        # Events are pushed by the manager's sender task; this only waits
+        # (without polling) for subscribe messages or the client going away
         while True:
-            # Check for messages from Redis
-            message = pubsub.get_message(ignore_subscribe_messages=True)
-            if message:
-                raw_data = json.loads(message['data'])
-                await websocket.send_json({
-                    "type": "new_post",
-                    "data": {
-                        "post_id": raw_data['post_id'],
-                        "content": raw_data['content'][:100],
-                        "source": raw_data.get('source', 'unknown'),
-                        "sentiment_label": raw_data['sentiment'],
-                        "confidence_score": raw_data.get('confidence', 0.99),
-                        "emotion": raw_data['emotion'],
-                        "timestamp": datetime.utcnow().isoformat()
-                    }
-                })
-            
-            # Check if the client is still there by receiving (non-blocking-ish)
-            # This prevents the "ConnectionClosedError" by reacting to client drops
-            try:
-                await asyncio.wait_for(websocket.receive_text(), timeout=0.01)
-            except asyncio.TimeoutError:
-                pass # This is normal, just means no message from client
-                
-            await asyncio.sleep(0.01) 
-    except (WebSocketDisconnect, ConnectionClosedError):
-        manager.disconnect(websocket)
+            manager.handle_client_message(websocket, await websocket.receive_text())
+    except WebSocketDisconnect:
+        pass
     finally:
-        pubsub.unsubscribe("sentiment_events")
\ No newline at end of file
+        manager.disconnect(websocket)
@@ -88,9 +88,46 @@ class SentimentAlert(Base):
     # Required: JSON (Using JSONB for PostgreSQL efficiency)
     details = Column(JSONB, nullable=False)
 
+class RollupColumns:
+    """
+    Per-bucket counts for one source and label, maintained by the worker's
+    batch writes (services/rollups.py) so trend queries never scan posts.
+    """
+    # Start of the bucket (date_trunc of the post's created_at)
+    bucket = Column(DateTime, primary_key=True)
+    source = Column(String(50), primary_key=True)
+    sentiment_label = Column(String(20), primary_key=True)
+    post_count = Column(Integer, nullable=False, default=0)
+    # Sum, not average, so concurrent upserts can simply add
+    confidence_sum = Column(Float, nullable=False, default=0.0)
+
+
+class SentimentRollupMinute(RollupColumns, Base):
+    __tablename__ = 'sentiment_rollup_minute'
+
+
+class SentimentRollupHour(RollupColumns, Base):
+    __tablename__ = 'sentiment_rollup_hour'
+
+
+class SentimentRollupDay(RollupColumns, Base):
+    __tablename__ = 'sentiment_rollup_day'
+
+
+ROLLUP_MODELS = {
+    "minute": SentimentRollupMinute,
+    "hour": SentimentRollupHour,
+    "day": SentimentRollupDay,
+}
+
 # Explicitly defining indexes as per requirements
 Index('idx_post_id', SocialMediaPost.post_id)
 Index('idx_source', SocialMediaPost.source)
 Index('idx_created_at', SocialMediaPost.created_at)
+# Keyset pagination of /api/posts seeks on (created_at, id)
+idx_created_at_id = Index('idx_created_at_id', SocialMediaPost.created_at, SocialMediaPost.id)
 Index('idx_analyzed_at', SentimentAnalysis.analyzed_at)
-Index('idx_triggered_at', SentimentAlert.triggered_at)
\ No newline at end of file
+Index('idx_triggered_at', SentimentAlert.triggered_at)
+# One analysis per post and model, so redelivered stream messages can be
+# inserted with ON CONFLICT DO NOTHING
+uq_analysis_post_model = Index('uq_analysis_post_model', SentimentAnalysis.post_id, SentimentAnalysis.model_name, unique=True)
\ No newline at end of file
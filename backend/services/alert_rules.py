@@ -0,0 +1,251 @@
+import os
+import json
+import math
+import time
+import logging
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger("AlertRules")
+
+
+class AlertRule:
+    """
+    One configured condition, evaluated on the live sliding-window counts.
+
+    scope: a fixed `source`, every source separately (`per_source`), or all
+    posts together (the default). The rule fires when its value reaches
+    `threshold` and re-arms only after the value has dropped below `clear`
+    (hysteresis); `cooldown_seconds` is the least time between two firings
+    for the same scope.
+    """
+    kind = None
+
+    def __init__(self, name: str, threshold: float, clear: float = None, source: str = None,
+                 per_source: bool = False, window_minutes: float = 5, min_posts: int = 10,
+                 cooldown_seconds: float = None, **options):
+        if options:
+            raise ValueError(f"Unknown options for alert rule {name}: {sorted(options)}")
+        self.name = name
+        self.threshold = float(threshold)
+        hysteresis = float(os.getenv("ALERT_HYSTERESIS", 0.8))
+        self.clear = float(clear) if clear is not None else self.threshold * hysteresis
+        self.source = source
+        self.per_source = per_source
+        self.window_minutes = window_minutes
+        self.min_posts = int(min_posts)
+        self.cooldown = float(cooldown_seconds if cooldown_seconds is not None else os.getenv("ALERT_COOLDOWN_SECONDS", 60))
+
+    @property
+    def window(self) -> str:
+        return f"rule:{self.name}"
+
+    def windows(self) -> Dict[str, int]:
+        """Sliding windows (name -> seconds) this rule reads."""
+        return {self.window: int(self.window_minutes * 60)}
+
+    def scopes(self, source: str) -> List[Optional[str]]:
+        """Scopes an event from `source` can change; None is the global scope."""
+        if self.source:
+            return [self.source] if source == self.source else []
+        return [source] if self.per_source else [None]
+
+    def measure(self, counters, scope: Optional[str], now: float) -> Optional[Tuple[float, Dict]]:
+        """(value, details) for the scope, or None while there is too little data."""
+        raise NotImplementedError
+
+
+class RatioRule(AlertRule):
+    """negative / positive posts in the window (the original alert)."""
+    kind = "ratio"
+
+    def measure(self, counters, scope, now):
+        counts = counters.counts(self.window, source=scope)
+        if counts["total"] < self.min_posts:
+            return None
+        # Avoid division by zero
+        ratio = counts["negative"] / (counts["positive"] or 0.1)
+        return ratio, {
+            "positive_count": counts["positive"], "negative_count": counts["negative"],
+            "neutral_count": counts["neutral"], "total_count": counts["total"]
+        }
+
+
+class VolumeSpikeRule(AlertRule):
+    """Post rate in the window compared with the rate over a longer baseline."""
+    kind = "volume_spike"
+
+    def __init__(self, name, threshold, baseline_minutes: float = 60, **kwargs):
+        kwargs.setdefault("window_minutes", 1)
+        super().__init__(name, threshold, **kwargs)
+        self.baseline_minutes = baseline_minutes
+
+    def windows(self):
+        return {self.window: int(self.window_minutes * 60), f"{self.window}:baseline": int(self.baseline_minutes * 60)}
+
+    def measure(self, counters, scope, now):
+        current = counters.counts(self.window, source=scope)["total"]
+        baseline = counters.counts(f"{self.window}:baseline", source=scope)["total"]
+        if current < self.min_posts:
+            return None
+        rate = current / self.window_minutes
+        baseline_rate = max(baseline / self.baseline_minutes, 1.0 / self.baseline_minutes)
+        return rate / baseline_rate, {
+            "total_count": current, "rate_per_minute": round(rate, 2),
+            "baseline_per_minute": round(baseline / self.baseline_minutes, 2)
+        }
+
+
+class ZScoreRule(AlertRule):
+    """
+    Deviation of a per-bucket metric (negative share or volume) from its
+    EWMA baseline, in standard deviations. The baseline learns from every
+    closed bucket of `bucket_seconds` and only alerts after `warmup` buckets.
+    """
+    kind = "zscore"
+
+    def __init__(self, name, threshold, metric: str = "negative_share", bucket_seconds: int = 60,
+                 alpha: float = 0.1, warmup: int = 10, **kwargs):
+        kwargs.setdefault("min_posts", 5)
+        kwargs.setdefault("window_minutes", bucket_seconds / 60)
+        super().__init__(name, threshold, **kwargs)
+        if metric not in ("negative_share", "volume"):
+            raise ValueError(f"Unknown zscore metric for alert rule {name}: {metric}")
+        self.metric = metric
+        self.bucket_seconds = int(bucket_seconds)
+        self.alpha = float(alpha)
+        self.warmup = int(warmup)
+        # scope -> [last bucket, mean, variance, buckets seen, last z]
+        self.baselines: Dict[Optional[str], list] = {}
+
+    def measure(self, counters, scope, now):
+        bucket = int(now // self.bucket_seconds)
+        state = self.baselines.setdefault(scope, [bucket, 0.0, 0.0, 0, None])
+        if bucket > state[0]:
+            # The window now covers the bucket that just closed
+            counts = counters.counts(self.window, source=scope)
+            if self.metric == "volume":
+                x = float(counts["total"])
+            elif counts["total"] >= self.min_posts:
+                x = counts["negative"] / counts["total"]
+            else:
+                x = None
+            state[0] = bucket
+            if x is not None:
+                _, mean, var, seen, _ = state
+                std = math.sqrt(var)
+                state[4] = (x - mean) / std if seen >= self.warmup and std > 0 else None
+                # EWMA mean and variance
+                diff = x - mean if seen else 0.0
+                mean = mean + self.alpha * diff if seen else x
+                var = (1 - self.alpha) * (var + self.alpha * diff * diff)
+                state[1:4] = [mean, var, seen + 1]
+        if state[4] is None:
+            return None
+        return state[4], {"metric": self.metric, "mean": round(state[1], 4), "std": round(math.sqrt(state[2]), 4)}
+
+
+RULE_TYPES = {rule.kind: rule for rule in (RatioRule, VolumeSpikeRule, ZScoreRule)}
+
+
+def load_rules(raw: str = None) -> List[AlertRule]:
+    """
+    Rules from ALERT_RULES, a JSON list such as
+    [{"name": "neg_ratio", "type": "ratio", "threshold": 2.0, "per_source": true},
+     {"name": "volume", "type": "volume_spike", "threshold": 3.0, "baseline_minutes": 60},
+     {"name": "neg_share", "type": "zscore", "threshold": 3.0, "bucket_seconds": 60}].
+    Without it, the single global ratio rule from ALERT_NEGATIVE_RATIO_THRESHOLD.
+    """
+    raw = raw if raw is not None else os.getenv("ALERT_RULES", "")
+    if not raw.strip():
+        return [RatioRule(
+            "high_negative_ratio",
+            threshold=float(os.getenv("ALERT_NEGATIVE_RATIO_THRESHOLD", 2.0)),
+            window_minutes=int(os.getenv("ALERT_WINDOW_MINUTES", 5)),
+            min_posts=int(os.getenv("ALERT_MIN_POSTS", 10)),
+        )]
+    rules = []
+    for config in json.loads(raw):
+        config = dict(config)
+        kind = config.pop("type", "ratio")
+        if kind not in RULE_TYPES:
+            raise ValueError(f"Unknown alert rule type: {kind}")
+        rules.append(RULE_TYPES[kind](**config))
+    if len({rule.name for rule in rules}) != len(rules):
+        raise ValueError("Alert rule names must be unique")
+    return rules
+
+
+def rule_windows(rules: List[AlertRule]) -> Dict[str, int]:
+    windows = {}
+    for rule in rules:
+        windows.update(rule.windows())
+    return windows
+
+
+class RuleState:
+    def __init__(self):
+        self.active = False
+        self.last_fired = None
+
+
+class AlertEngine:
+    """
+    Evaluates every rule for the scopes an incoming result touches
+    (observe) and for all known scopes on a timer (tick), using only the
+    in-memory sliding windows. Fired alerts collect in `pending` until
+    the alert service writes them.
+    """
+    def __init__(self, rules: List[AlertRule], counters, clock=time.time):
+        self.rules = rules
+        self.counters = counters
+        self.clock = clock
+        self.states: Dict[Tuple[str, Optional[str]], RuleState] = {}
+        self.pending: List[Dict] = []
+
+    def observe(self, raw: Dict):
+        source = raw.get("source") or "unknown"
+        now = self.clock()
+        for rule in self.rules:
+            for scope in rule.scopes(source):
+                self._evaluate(rule, scope, now)
+
+    def tick(self):
+        """Re-check every scope seen so far, so alerts clear and z-score buckets close without traffic."""
+        now = self.clock()
+        for rule in self.rules:
+            scopes = {scope for name, scope in self.states if name == rule.name}
+            if not rule.per_source:
+                scopes.add(rule.source)
+            for scope in scopes:
+                self._evaluate(rule, scope, now)
+
+    def drain(self) -> List[Dict]:
+        alerts, self.pending = self.pending, []
+        return alerts
+
+    def _evaluate(self, rule: AlertRule, scope: Optional[str], now: float):
+        state = self.states.setdefault((rule.name, scope), RuleState())
+        result = rule.measure(self.counters, scope, now)
+        if result is None:
+            # Too little data left in the window to keep an alert open
+            state.active = False
+            return
+        value, details = result
+        if state.active:
+            if value < rule.clear:
+                state.active = False
+                logger.info(f"✅ Alert {rule.name} cleared for {scope or 'all sources'} ({value:.2f})")
+            return
+        if value >= rule.threshold and (state.last_fired is None or now - state.last_fired >= rule.cooldown):
+            state.active = True
+            state.last_fired = now
+            self.pending.append({
+                "alert_type": rule.name,
+                "rule_type": rule.kind,
+                "source": scope,
+                "threshold": rule.threshold,
+                "actual_value": round(value, 4),
+                "window_minutes": rule.window_minutes,
+                "metrics": details,
+                "triggered_at": now,
+            })
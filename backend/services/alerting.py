@@ -2,97 +2,87 @@ import os
 import asyncio
 import logging
 from datetime import datetime, timedelta
-from typing import Optional
-from sqlalchemy.orm import Session
-from models import SocialMediaPost, SentimentAnalysis, SentimentAlert
+from typing import List
+from models import SentimentAlert
+from services.alert_rules import AlertEngine, load_rules
 
 logger = logging.getLogger("AlertService")
 
 class AlertService:
-    def __init__(self, db_session_maker):
+    """
+    Streaming alerts: the rules (services/alert_rules.py) are evaluated on
+    every incoming result through observe(), and on a one-second timer so
+    alerts also clear when traffic stops. Fired alerts are written to
+    sentiment_alerts in one transaction per flush instead of one each.
+    """
+    def __init__(self, db_session_maker, counters, rules=None):
+        # async_sessionmaker from database.create_session_maker
         self.SessionLocal = db_session_maker
+        # SlidingWindowCounters that include every rule's windows (see rule_windows)
+        self.engine = AlertEngine(rules if rules is not None else load_rules(), counters)
         # Load configs from Env
-        self.threshold = float(os.getenv("ALERT_NEGATIVE_RATIO_THRESHOLD", 2.0))
-        self.window = int(os.getenv("ALERT_WINDOW_MINUTES", 5))
-        self.min_posts = int(os.getenv("ALERT_MIN_POSTS", 10))
+        self.interval = float(os.getenv("ALERT_CHECK_INTERVAL", 1))
+        self.batch_size = int(os.getenv("ALERT_BATCH_SIZE", 100))
+        # Alerts kept for retry when the database is unavailable
+        self.max_backlog = int(os.getenv("ALERT_MAX_BACKLOG", 1000))
+        self.backlog: List[dict] = []
 
-    async def check_thresholds(self) -> Optional[dict]:
-        with self.SessionLocal() as db:
-            now = datetime.utcnow()
-            start_time = now - timedelta(minutes=self.window)
+    def observe(self, raw: dict):
+        """One worker event from the live feed, after it was added to the counters."""
+        self.engine.observe(raw)
 
-            # 1. Fetch metrics in the window
-            results = db.query(SentimentAnalysis.sentiment_label).join(
-                SocialMediaPost, SocialMediaPost.post_id == SentimentAnalysis.post_id
-            ).filter(SocialMediaPost.created_at >= start_time).all()
-
-            if len(results) < self.min_posts:
-                return None # Not enough data
-
-            counts = {"positive": 0, "negative": 0, "neutral": 0}
-            for res in results:
-                label = res[0].lower()
-                if "pos" in label: counts["positive"] += 1
-                elif "neg" in label: counts["negative"] += 1
-                else: counts["neutral"] += 1
-
-            total = len(results)
-            # Avoid division by zero
-            pos_count = counts["positive"] if counts["positive"] > 0 else 0.1
-            ratio = counts["negative"] / pos_count
-
-            # 2. Trigger Logic
-            if ratio > self.threshold:
-                return {
-                    "alert_triggered": True,
-                    "alert_type": "high_negative_ratio",
-                    "threshold": self.threshold,
-                    "actual_ratio": round(ratio, 2),
-                    "window_minutes": self.window,
-                    "metrics": {
-                        "positive_count": counts["positive"],
-                        "negative_count": counts["negative"],
-                        "neutral_count": counts["neutral"],
-                        "total_count": total
-                    },
-                    "timestamp": datetime.utcnow().isoformat()
-                }
-            return None
-
-    async def save_alert(self, alert_data: dict) -> int:
-        with self.SessionLocal() as db:
+    async def save_alerts(self, alerts: List[dict]) -> List[int]:
+        async with self.SessionLocal() as db:
             try:
-                now = datetime.utcnow()
-                new_alert = SentimentAlert(
-                    alert_type=alert_data["alert_type"],
-                    threshold_value=float(alert_data["threshold"]),
-                    actual_value=float(alert_data["actual_ratio"]),
-                    window_minutes=int(alert_data["window_minutes"]),
-                    window_start=now - timedelta(minutes=alert_data["window_minutes"]),
-                    window_end=now,
-                    post_count=int(alert_data["metrics"]["total_count"]),
-                    triggered_at=now,
-                    details=alert_data["metrics"] # This goes into your JSONB column
-                )
-                db.add(new_alert)
-                db.commit()
-                db.refresh(new_alert)
-                logger.info(f"✅ Alert saved to database. ID: {new_alert.id}")
-                return new_alert.id
+                rows = []
+                for alert_data in alerts:
+                    triggered_at = datetime.utcfromtimestamp(alert_data["triggered_at"])
+                    rows.append(SentimentAlert(
+                        alert_type=alert_data["alert_type"],
+                        threshold_value=float(alert_data["threshold"]),
+                        actual_value=float(alert_data["actual_value"]),
+                        window_minutes=max(1, round(alert_data["window_minutes"])),
+                        window_start=triggered_at - timedelta(minutes=alert_data["window_minutes"]),
+                        window_end=triggered_at,
+                        post_count=int(alert_data["metrics"].get("total_count", 0)),
+                        triggered_at=triggered_at,
+                        # This goes into your JSONB column
+                        details={**alert_data["metrics"], "rule_type": alert_data["rule_type"], "source": alert_data["source"]}
+                    ))
+                db.add_all(rows)
+                await db.commit()
+                ids = [row.id for row in rows]
+                logger.info(f"✅ {len(ids)} alert(s) saved to database. IDs: {ids}")
+                return ids
             except Exception as e:
-                db.rollback()
-                logger.error(f"❌ Failed to save alert: {e}")
+                await db.rollback()
+                logger.error(f"❌ Failed to save alerts: {e}")
                 raise e
 
+    async def flush(self):
+        self.backlog.extend(self.engine.drain())
+        while self.backlog:
+            batch = self.backlog[:self.batch_size]
+            try:
+                await self.save_alerts(batch)
+            except Exception:
+                # Keep the newest alerts for the next flush
+                self.backlog = self.backlog[-self.max_backlog:]
+                return
+            del self.backlog[:len(batch)]
+            for alert_data in batch:
+                logger.warning(
+                    f"🚨 ALERT TRIGGERED! {alert_data['alert_type']} ({alert_data['source'] or 'all sources'}) "
+                    f"| Value: {alert_data['actual_value']} >= {alert_data['threshold']}"
+                )
+
     async def run_monitoring_loop(self):
-        logger.info("📢 Alert Monitoring Loop Started")
+        logger.info(f"📢 Alert Monitoring Loop Started ({len(self.engine.rules)} rules)")
         while True:
             try:
-                alert_data = await self.check_thresholds()
-                if alert_data:
-                    alert_id = await self.save_alert(alert_data)
-                    logger.warning(f"🚨 ALERT TRIGGERED! ID: {alert_id} | Ratio: {alert_data['actual_ratio']}")
+                self.engine.tick()
+                await self.flush()
             except Exception as e:
                 logger.error(f"Alert Loop Error: {e}")
-            
-            await asyncio.sleep(60) # Check every minute
\ No newline at end of file
+
+            await asyncio.sleep(self.interval)
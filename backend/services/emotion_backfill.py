@@ -0,0 +1,88 @@
+import os
+import asyncio
+import logging
+from typing import List, Tuple
+from sqlalchemy import select
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import SentimentAnalysis
+from services.inference_cache import InferenceCache
+
+logger = logging.getLogger("EmotionBackfill")
+
+
+class EmotionBackfill:
+    """
+    Fills in emotions the worker skipped at ingest (see EMOTION_POLICY) for
+    the posts an endpoint actually returns. Aggregates never backfill, they
+    report skipped posts as pending. Results are written back to the
+    analysis rows, so each post is only ever computed once, and repeated
+    texts are served from the shared inference cache.
+    """
+    def __init__(self, redis_client=None, limit: int = None):
+        # redis_client: redis.asyncio client for the shared inference cache tier
+        self.cache = InferenceCache(redis_client)
+        # Upper bound on rows computed per request
+        self.limit = limit or int(os.getenv("EMOTION_BACKFILL_LIMIT", 200))
+        self._analyzer = None
+        # Created on first use, inside the server's event loop
+        self._lock = None
+
+    async def _get_analyzer(self):
+        if self._analyzer is None:
+            # Imported here so the API only pays for transformers when it is needed
+            from services.sentiment_analyzer import SentimentAnalyzer
+            model_type = os.getenv("SENTIMENT_MODEL_TYPE", "local").lower()
+            if model_type == "onnx":
+                # ONNX Runtime is a worker-only dependency; the API backfills with PyTorch
+                model_type = "local"
+            if model_type == "local":
+                # Only the emotion model; loading is slow and creates no asyncio state, keep it off the loop
+                loop = asyncio.get_running_loop()
+                self._analyzer = await loop.run_in_executor(
+                    None, lambda: SentimentAnalyzer(model_type=model_type, cache=self.cache, load_sentiment=False)
+                )
+            else:
+                # The external LLM client's locks and semaphores belong to this loop
+                self._analyzer = SentimentAnalyzer(model_type=model_type, cache=self.cache)
+        return self._analyzer
+
+    async def _still_missing(self, db: AsyncSession, pending: List[Tuple[SentimentAnalysis, str]]):
+        """
+        The pending pairs whose row still has no emotion in the database.
+        Another request may have filled them while we waited for the lock;
+        those take the stored value instead of being computed again.
+        """
+        stored = dict((await db.execute(
+            select(SentimentAnalysis.id, SentimentAnalysis.emotion)
+            .where(SentimentAnalysis.id.in_([a.id for a, _ in pending]))
+        )).all())
+        missing = []
+        for a, content in pending:
+            if stored.get(a.id) is None:
+                missing.append((a, content))
+            else:
+                set_committed_value(a, "emotion", stored[a.id])
+        return missing
+
+    async def fill(self, db: AsyncSession, rows: List[Tuple[SentimentAnalysis, str]]) -> int:
+        """Compute and store emotions for (analysis, content) pairs that have none."""
+        pending = [(a, content) for a, content in rows if a.emotion is None][:self.limit]
+        if not pending:
+            return 0
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # One backfill at a time, concurrent requests mostly want the same rows
+        async with self._lock:
+            pending = await self._still_missing(db, pending)
+            if not pending:
+                return 0
+            analyzer = await self._get_analyzer()
+            emotions = await analyzer.batch_analyze_emotion([content for _, content in pending])
+            for (analysis, _), emotion in zip(pending, emotions):
+                analysis.emotion = emotion["emotion"]
+            await db.commit()
+
+        logger.info(f"Backfilled emotion for {len(pending)} posts")
+        return len(pending)
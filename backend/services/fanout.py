@@ -0,0 +1,414 @@
+import os
+import json
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import WebSocket
+
+logger = logging.getLogger("ConnectionManager")
+
+# WebSocket close code for "try again later", sent to dropped slow clients
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+
+def new_post_message(raw: Dict, event_id: str = None) -> Dict:
+    """Turn a worker event from sentiment_events into the dashboard's new_post frame."""
+    return {
+        "type": "new_post",
+        "data": {
+            "event_id": event_id or raw.get('event_id'),
+            "post_id": raw['post_id'],
+            "content": raw['content'][:100],
+            "source": raw.get('source', 'unknown'),
+            "sentiment_label": raw['sentiment'],
+            "confidence_score": raw.get('confidence', 0.99),
+            "emotion": raw.get('emotion'),
+            "timestamp": datetime.utcnow().isoformat()
+        }
+    }
+
+
+def parse_event_id(event_id) -> Optional[Tuple[int, int]]:
+    """Redis stream id '1700000000000-3' -> (1700000000000, 3); None if malformed."""
+    try:
+        ms, _, seq = str(event_id).partition("-")
+        return int(ms), int(seq or 0)
+    except ValueError:
+        return None
+
+
+def _as_set(value) -> Optional[frozenset]:
+    if value in (None, "", []):
+        return None
+    values = value if isinstance(value, (list, tuple, set)) else [value]
+    return frozenset(str(v).lower() for v in values)
+
+
+class SubscriptionFilter:
+    """Server-side event filter sent by a client in its subscribe message."""
+    def __init__(self, sources=None, sentiments=None, min_confidence: float = None, emotions=None):
+        self.sources = _as_set(sources)
+        self.sentiments = _as_set(sentiments)
+        self.min_confidence = float(min_confidence) if min_confidence is not None else None
+        self.emotions = _as_set(emotions)
+
+    @classmethod
+    def from_message(cls, filters: Dict) -> "SubscriptionFilter":
+        filters = filters or {}
+        return cls(
+            sources=filters.get("source"),
+            sentiments=filters.get("sentiment"),
+            min_confidence=filters.get("min_confidence"),
+            emotions=filters.get("emotion"),
+        )
+
+    def key(self) -> Tuple:
+        return (self.sources, self.sentiments, self.min_confidence, self.emotions)
+
+    def matches(self, data: Dict) -> bool:
+        if self.sources is not None and str(data.get("source", "")).lower() not in self.sources:
+            return False
+        if self.sentiments is not None and str(data.get("sentiment_label", "")).lower() not in self.sentiments:
+            return False
+        if self.min_confidence is not None and (data.get("confidence_score") or 0.0) < self.min_confidence:
+            return False
+        if self.emotions is not None and str(data.get("emotion") or "").lower() not in self.emotions:
+            return False
+        return True
+
+    def as_dict(self) -> Dict:
+        return {
+            "source": sorted(self.sources) if self.sources else None,
+            "sentiment": sorted(self.sentiments) if self.sentiments else None,
+            "min_confidence": self.min_confidence,
+            "emotion": sorted(self.emotions) if self.emotions else None,
+        }
+
+
+def metrics_delta(previous: Optional[Dict], current: Dict) -> Dict:
+    """Counters in `current` that differ from `previous`, nested by timeframe."""
+    if previous is None:
+        return current
+    delta = {}
+    for timeframe, counters in current.items():
+        before = previous.get(timeframe, {})
+        changed = {k: v for k, v in counters.items() if before.get(k) != v}
+        if changed:
+            delta[timeframe] = changed
+    return delta
+
+
+class ClientConnection:
+    """One dashboard socket with its own bounded outbox and sender task."""
+    def __init__(self, websocket: WebSocket, queue_size: int):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.task: Optional[asyncio.Task] = None
+        # Set by a subscribe message; unsubscribed clients get one new_post frame per event
+        self.filter: Optional[SubscriptionFilter] = None
+        # Events waiting for the next tick's batched frame
+        self.pending: List[Dict] = []
+        self.overflow = 0
+        # metrics_update as full snapshots or only the counters that changed
+        self.delta_metrics = False
+        self.last_metrics: Optional[Dict] = None
+        # Live events held back while missed ones are replayed (None = live)
+        self.backlog: Optional[List[Dict]] = None
+
+
+class ConnectionManager:
+    """
+    Fans events out to every connected WebSocket.
+
+    A single async pub/sub subscriber per process (run_subscriber) feeds
+    publish_event(), and broadcast() serialises each message once and drops
+    it into every client's bounded queue. Each client has its own sender
+    task, so one slow browser never delays the others; a client whose
+    queue is full is disconnected instead of buffering without limit.
+    Idle sockets cost nothing: nobody polls.
+
+    Clients may send {"type": "subscribe", "filters": {...}, "metrics": "delta"}.
+    Their events are then filtered server-side and coalesced into one
+    new_posts frame per tick (run_ticker), and metrics_update frames only
+    carry the counters that changed since the last one they received.
+
+    The worker also keeps every event in a capped stream (the event log).
+    A client reconnecting with the last event_id it saw gets the missed
+    events replayed before the live tail (resume), or a snapshot of the
+    latest events and metrics when the gap is too large to replay.
+    """
+    def __init__(self, queue_size: int = None, tick_ms: int = None, max_batch: int = None, replay_limit: int = None):
+        self.queue_size = queue_size or int(os.getenv("WS_CLIENT_QUEUE_SIZE", 256))
+        # Coalescing interval for subscribed clients, kept within 50 ms - 1 s
+        self.tick_ms = max(50, min(1000, tick_ms or int(os.getenv("WS_TICK_MS", 200))))
+        # Most events in one batched frame; older ones beyond it are dropped and counted
+        self.max_batch = max_batch or int(os.getenv("WS_MAX_EVENTS_PER_FRAME", 500))
+        # Gaps longer than this many events get a snapshot instead of a replay
+        self.replay_limit = replay_limit or int(os.getenv("WS_REPLAY_LIMIT", 1000))
+        # Last metrics snapshot, sent to clients that resync
+        self.metrics: Optional[Dict] = None
+        self.clients: Dict[WebSocket, ClientConnection] = {}
+        self.dropped = 0
+
+    @property
+    def active_connections(self):
+        return list(self.clients)
+
+    async def connect(self, websocket: WebSocket):
+        # 1. Accept the connection FIRST
+        await websocket.accept()
+
+        # 2. Register it with its own outbox and sender
+        client = ClientConnection(websocket, self.queue_size)
+        client.task = asyncio.create_task(self._sender(client))
+        self.clients[websocket] = client
+
+        # 3. Queue the welcome message like any other frame
+        self.send(websocket, {
+            "type": "connected",
+            "message": "Connected to sentiment stream",
+            "timestamp": datetime.utcnow().isoformat()
+        })
+
+    def disconnect(self, websocket: WebSocket):
+        client = self.clients.pop(websocket, None)
+        if client is not None and client.task is not None and client.task is not asyncio.current_task():
+            client.task.cancel()
+
+    def send(self, websocket: WebSocket, message) -> bool:
+        """Queue a message (dict or pre-serialised JSON) for one client; drops the client if it is too slow."""
+        client = self.clients.get(websocket)
+        if client is None:
+            return False
+        text = message if isinstance(message, str) else json.dumps(message, default=str)
+        try:
+            client.queue.put_nowait(text)
+            return True
+        except asyncio.QueueFull:
+            self._drop(client)
+            return False
+
+    async def broadcast(self, message):
+        """Queue a message for every client, serialised once."""
+        text = message if isinstance(message, str) else json.dumps(message, default=str)
+        for websocket in list(self.clients):
+            self.send(websocket, text)
+
+    def subscribe(self, websocket: WebSocket, message: Dict):
+        client = self.clients.get(websocket)
+        if client is None:
+            return
+        try:
+            client.filter = SubscriptionFilter.from_message(message.get("filters"))
+        except (TypeError, ValueError) as e:
+            self.send(websocket, {"type": "error", "message": f"Invalid filters: {e}"})
+            return
+        client.pending, client.overflow = [], 0
+        client.delta_metrics = message.get("metrics") == "delta"
+        self.send(websocket, {
+            "type": "subscribed", "filters": client.filter.as_dict(),
+            "tick_ms": self.tick_ms, "metrics": "delta" if client.delta_metrics else "full"
+        })
+
+    def handle_client_message(self, websocket: WebSocket, text: str):
+        """Messages from the browser: currently only subscribe."""
+        try:
+            message = json.loads(text)
+        except ValueError:
+            return
+        if isinstance(message, dict) and message.get("type") == "subscribe":
+            self.subscribe(websocket, message)
+
+    def publish_event(self, frame: Dict):
+        """Route one new_post frame: straight out to unsubscribed clients,
+        into the next batch of subscribed clients whose filter matches."""
+        data = frame["data"]
+        text = None
+        matches = {}
+        for websocket, client in list(self.clients.items()):
+            if client.backlog is not None:
+                client.backlog.append(frame)
+                continue
+            if client.filter is None:
+                text = text or json.dumps(frame, default=str)
+                self.send(websocket, text)
+                continue
+            key = client.filter.key()
+            if key not in matches:
+                matches[key] = client.filter.matches(data)
+            if matches[key]:
+                self._queue_event(client, data)
+
+    def _queue_event(self, client: ClientConnection, data: Dict):
+        client.pending.append(data)
+        if len(client.pending) > self.max_batch:
+            client.pending.pop(0)
+            client.overflow += 1
+
+    async def resume(self, websocket: WebSocket, redis_client, stream: str, last_event_id: str):
+        """
+        Replay the events a reconnecting client missed after `last_event_id`,
+        then switch it to the live tail. Live events arriving meanwhile are
+        held in the client's backlog and released without duplicates.
+        """
+        client = self.clients.get(websocket)
+        if client is None:
+            return
+        client.backlog = []
+        last = parse_event_id(last_event_id)
+        try:
+            entries = []
+            if last is not None:
+                # Exclusive start: everything strictly after the last seen event
+                entries = await redis_client.xrange(stream, min=f"({last_event_id}", count=self.replay_limit + 1)
+                oldest = await redis_client.xrange(stream, count=1)
+            if last is None or len(entries) > self.replay_limit or (oldest and parse_event_id(oldest[0][0]) > last):
+                # Unknown id, trimmed out of the log or too far behind
+                last = await self._send_snapshot(websocket, redis_client, stream)
+                return
+            events = [new_post_message(json.loads(fields["event"]), event_id)["data"] for event_id, fields in entries]
+            if client.filter is not None:
+                events = [e for e in events if client.filter.matches(e)]
+            self.send(websocket, {"type": "replay", "data": events, "count": len(events), "timestamp": datetime.utcnow().isoformat()})
+            if entries:
+                last = parse_event_id(entries[-1][0])
+        except Exception as e:
+            logger.error(f"WebSocket replay failed: {e}")
+            self.send(websocket, {"type": "snapshot", "data": {"recent": [], "metrics": self.metrics}, "event_id": None})
+        finally:
+            self._go_live(client, last)
+
+    async def _send_snapshot(self, websocket: WebSocket, redis_client, stream: str, recent: int = 10):
+        """Latest events (newest first) and metrics; returns the newest event id it covers."""
+        entries = await redis_client.xrevrange(stream, count=recent)
+        events = [new_post_message(json.loads(fields["event"]), event_id)["data"] for event_id, fields in entries]
+        self.send(websocket, {
+            "type": "snapshot",
+            "data": {"recent": events, "metrics": self.metrics},
+            "event_id": entries[0][0] if entries else None,
+            "timestamp": datetime.utcnow().isoformat()
+        })
+        return parse_event_id(entries[0][0]) if entries else None
+
+    def _go_live(self, client: ClientConnection, last: Optional[Tuple[int, int]]):
+        backlog, client.backlog = client.backlog or [], None
+        for frame in backlog:
+            event_id = parse_event_id(frame["data"].get("event_id"))
+            if last is not None and event_id is not None and event_id <= last:
+                continue
+            if client.filter is None:
+                self.send(client.websocket, frame)
+            elif client.filter.matches(frame["data"]):
+                self._queue_event(client, frame["data"])
+
+    def flush(self):
+        """Send every subscribed client its coalesced events as one frame."""
+        now = datetime.utcnow().isoformat()
+        for websocket, client in list(self.clients.items()):
+            if not client.pending:
+                continue
+            frame = {"type": "new_posts", "data": client.pending, "count": len(client.pending), "timestamp": now}
+            if client.overflow:
+                frame["dropped"] = client.overflow
+            client.pending, client.overflow = [], 0
+            self.send(websocket, frame)
+
+    async def run_ticker(self):
+        while True:
+            await asyncio.sleep(self.tick_ms / 1000)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"WebSocket flush error: {e}")
+
+    async def broadcast_metrics(self, metrics: Dict):
+        """metrics_update for everyone: full snapshots, or deltas for clients that asked."""
+        self.metrics = metrics
+        now = datetime.utcnow().isoformat()
+        full = json.dumps({"type": "metrics_update", "data": metrics, "timestamp": now}, default=str)
+        # Clients that got the same previous snapshot share one serialised delta
+        deltas = {}
+        for websocket, client in list(self.clients.items()):
+            if not client.delta_metrics:
+                self.send(websocket, full)
+                continue
+            previous = client.last_metrics
+            if id(previous) not in deltas:
+                delta = metrics_delta(previous, metrics)
+                deltas[id(previous)] = json.dumps({
+                    "type": "metrics_update", "delta": previous is not None, "data": delta, "timestamp": now
+                }, default=str) if delta else None
+            client.last_metrics = metrics
+            if deltas[id(previous)] is not None:
+                self.send(websocket, deltas[id(previous)])
+
+    def _drop(self, client: ClientConnection):
+        self.dropped += 1
+        logger.warning(f"Dropping slow WebSocket client ({client.queue.qsize()} frames behind)")
+        self.disconnect(client.websocket)
+        asyncio.create_task(self._close(client.websocket))
+
+    @staticmethod
+    async def _close(websocket: WebSocket):
+        try:
+            await websocket.close(code=SLOW_CONSUMER_CLOSE_CODE)
+        except Exception:
+            pass
+
+    async def _sender(self, client: ClientConnection):
+        try:
+            while True:
+                text = await client.queue.get()
+                await client.websocket.send_text(text)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.info(f"WebSocket send failed, disconnecting: {e}")
+            self.disconnect(client.websocket)
+
+    async def run_subscriber(self, redis_client, channel: str, on_event=None, metrics_channel: str = None):
+        """The process's only subscription to `channel`; reconnects with backoff.
+        `on_event` also gets every decoded worker event (e.g. live counters).
+        Metrics published on `metrics_channel` go out through broadcast_metrics."""
+        delay = 1.0
+        while True:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            try:
+                channels = [channel] + ([metrics_channel] if metrics_channel else [])
+                await pubsub.subscribe(*channels)
+                logger.info(f"📡 Subscribed to {', '.join(channels)}")
+                delay = 1.0
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    if metrics_channel and message.get("channel") == metrics_channel:
+                        try:
+                            await self.broadcast_metrics(json.loads(message["data"]))
+                        except ValueError as e:
+                            logger.error(f"Bad metrics on {metrics_channel}: {e}")
+                        continue
+                    try:
+                        raw = json.loads(message["data"])
+                        frame = new_post_message(raw)
+                    except (ValueError, KeyError, TypeError) as e:
+                        logger.error(f"Bad event on {channel}: {e}")
+                        continue
+                    if on_event is not None:
+                        try:
+                            on_event(raw)
+                        except Exception as e:
+                            logger.error(f"Event hook failed: {e}")
+                    self.publish_event(frame)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Subscriber error on {channel}, retrying in {delay:.0f}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
@@ -0,0 +1,87 @@
+import os
+import json
+import hashlib
+import logging
+import unicodedata
+from collections import OrderedDict
+from typing import List, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceCache:
+    """
+    Two-tier cache for model results, keyed by model name + a hash of the
+    normalised text: a bounded in-process LRU in front of a shared Redis
+    tier with a TTL, so repeats (retweets, copypasta, bot spam) skip
+    inference in every worker.
+    """
+    def __init__(self, redis_client=None, max_size: int = None, ttl_seconds: int = None, prefix: str = None):
+        # redis_client is a redis.asyncio client with decode_responses=True, or None for LRU only
+        self.redis = redis_client
+        self.max_size = max_size or int(os.getenv("INFERENCE_CACHE_SIZE", 10000))
+        self.ttl = ttl_seconds or int(os.getenv("INFERENCE_CACHE_TTL", 86400))
+        self.prefix = prefix or os.getenv("REDIS_CACHE_PREFIX", "sentiment_cache")
+        self._lru = OrderedDict()
+        self.counters = {"local_hits": 0, "redis_hits": 0, "misses": 0}
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        # Only whitespace and unicode form, the emotion model is case sensitive
+        return " ".join(unicodedata.normalize("NFKC", str(text)).split())
+
+    def key(self, model_name: str, text: str) -> str:
+        digest = hashlib.sha1(self.normalize(text).encode("utf-8")).hexdigest()
+        return f"{self.prefix}:{model_name}:{digest}"
+
+    def _remember(self, key: str, value: Dict):
+        self._lru[key] = value
+        self._lru.move_to_end(key)
+        if len(self._lru) > self.max_size:
+            self._lru.popitem(last=False)
+
+    async def get_many(self, model_name: str, texts: List[str]) -> List[Optional[Dict]]:
+        """Cached result per text, or None for a miss."""
+        keys = [self.key(model_name, t) for t in texts]
+        results = []
+        for k in keys:
+            hit = self._lru.get(k)
+            if hit is not None:
+                self._lru.move_to_end(k)
+                self.counters["local_hits"] += 1
+            results.append(hit)
+
+        missing = [i for i, r in enumerate(results) if r is None]
+        if missing and self.redis is not None:
+            try:
+                raw = await self.redis.mget([keys[i] for i in missing])
+            except Exception as e:
+                logger.warning(f"Inference cache Redis read failed: {e}")
+                raw = [None] * len(missing)
+            for i, value in zip(missing, raw):
+                if value is not None:
+                    results[i] = json.loads(value)
+                    self._remember(keys[i], results[i])
+                    self.counters["redis_hits"] += 1
+
+        self.counters["misses"] += sum(1 for r in results if r is None)
+        return results
+
+    async def set_many(self, model_name: str, texts: List[str], values: List[Dict]):
+        keys = [self.key(model_name, t) for t in texts]
+        for k, v in zip(keys, values):
+            self._remember(k, v)
+
+        if self.redis is not None and keys:
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                for k, v in zip(keys, values):
+                    pipe.set(k, json.dumps(v), ex=self.ttl)
+                await pipe.execute()
+            except Exception as e:
+                logger.warning(f"Inference cache Redis write failed: {e}")
+
+    def stats(self) -> Dict:
+        hits = self.counters["local_hits"] + self.counters["redis_hits"]
+        total = hits + self.counters["misses"]
+        return {**self.counters, "size": len(self._lru), "hit_rate": round(hits / total, 4) if total else 0.0}
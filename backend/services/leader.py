@@ -0,0 +1,97 @@
+import os
+import time
+import uuid
+import socket
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger("LeaderElection")
+
+# Extend / drop the lease only while we still hold it
+RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class LeaderElection:
+    """
+    Runs the scheduled jobs in exactly one API process across all replicas.
+
+    Every process competes for a Redis lease (SET NX PX). The holder renews
+    it every LEADER_LEASE_TTL / 3 seconds and runs `jobs`; everybody else
+    retries at the same pace, so when the leader dies another process takes
+    over within one TTL. A leader that cannot renew (lost the key, or Redis
+    unreachable for a whole TTL) cancels its jobs before anyone else can
+    hold the lease. The lease is released on shutdown for a quick handover.
+    """
+    def __init__(self, redis_client, jobs: List[Callable[[], Awaitable]], key: str = None,
+                 ttl: float = None, instance_id: str = None, clock=time.monotonic):
+        self.redis = redis_client
+        self.jobs = jobs
+        self.key = key or os.getenv("LEADER_LOCK_KEY", "sentistream:leader")
+        self.ttl = ttl or float(os.getenv("LEADER_LEASE_TTL", 15))
+        self.renew_interval = self.ttl / 3
+        self.instance_id = instance_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.clock = clock
+        self._renew = redis_client.register_script(RENEW_SCRIPT)
+        self._release = redis_client.register_script(RELEASE_SCRIPT)
+        self.tasks: List[asyncio.Task] = []
+        self.renewed_at: Optional[float] = None
+
+    @property
+    def is_leader(self) -> bool:
+        return bool(self.tasks)
+
+    async def step(self):
+        """One acquire-or-renew round; starts or stops the jobs on a change."""
+        ttl_ms = int(self.ttl * 1000)
+        try:
+            if self.is_leader:
+                held = bool(await self._renew(keys=[self.key], args=[self.instance_id, ttl_ms]))
+            else:
+                held = bool(await self.redis.set(self.key, self.instance_id, nx=True, px=ttl_ms))
+            if held:
+                self.renewed_at = self.clock()
+        except Exception as e:
+            logger.error(f"Leader lease check failed: {e}")
+            # Keep leading only while the last renewal is certainly still valid
+            held = self.is_leader and self.clock() - self.renewed_at < self.ttl - self.renew_interval
+
+        if held and not self.is_leader:
+            logger.info(f"👑 {self.instance_id} is now the leader, starting {len(self.jobs)} background jobs")
+            self.tasks = [asyncio.create_task(job()) for job in self.jobs]
+        elif not held and self.is_leader:
+            logger.warning(f"⚠️ {self.instance_id} lost the leader lease, stopping background jobs")
+            self._stop_jobs()
+
+    async def run(self):
+        try:
+            while True:
+                await self.step()
+                await asyncio.sleep(self.renew_interval)
+        finally:
+            was_leader = self.is_leader
+            self._stop_jobs()
+            if was_leader:
+                try:
+                    await self._release(keys=[self.key], args=[self.instance_id])
+                except Exception:
+                    pass
+
+    def _stop_jobs(self):
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+
+    def status(self) -> Dict:
+        return {"instance": self.instance_id, "leader": self.is_leader}
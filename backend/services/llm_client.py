@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+from typing import List, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+
+LABELS = {
+    "sentiment": ["positive", "negative", "neutral"],
+    "emotion": ["joy", "sadness", "anger", "fear", "surprise", "disgust", "neutral"],
+}
+
+# Retried with backoff; anything else fails the pack straight away
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class TokenBucket:
+    """Async token bucket: `rate` requests per second with bursts up to `capacity`."""
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class LLMClient:
+    """
+    Batched client for an OpenAI-compatible chat completions API.
+
+    Texts are packed `batch_size` at a time into one numbered prompt that
+    asks for a JSON array back, so a worker batch costs a handful of
+    requests instead of one per text. In-flight requests are capped by a
+    semaphore, request starts by a token bucket, and 429/5xx responses are
+    retried with backoff (honouring Retry-After). One pooled HTTP/2 client
+    is reused for every call; pass `transport` to point it at a stub.
+    """
+    def __init__(self, api_url: str = None, api_key: str = None, model: str = None,
+                 batch_size: int = None, max_concurrency: int = None, requests_per_second: float = None,
+                 max_retries: int = None, timeout: float = 30.0, transport: httpx.AsyncBaseTransport = None):
+        self.api_url = api_url or os.getenv("EXTERNAL_LLM_API_URL", DEFAULT_API_URL)
+        self.api_key = api_key or os.getenv("EXTERNAL_LLM_API_KEY")
+        self.model = model or os.getenv("EXTERNAL_LLM_MODEL", "llama-3.1-8b-instant")
+        # Texts per request
+        self.batch_size = batch_size or int(os.getenv("LLM_BATCH_SIZE", 20))
+        self.max_concurrency = max_concurrency or int(os.getenv("LLM_MAX_CONCURRENCY", 4))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("LLM_MAX_RETRIES", 4))
+
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._bucket = TokenBucket(requests_per_second or float(os.getenv("LLM_REQUESTS_PER_SECOND", 5)))
+        self.client = httpx.AsyncClient(
+            timeout=timeout,
+            # HTTP/2 multiplexes the concurrent requests over one connection
+            http2=transport is None and _http2_available(),
+            limits=httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency),
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            transport=transport
+        )
+        self.counters = {"requests": 0, "retries": 0, "failures": 0}
+
+    async def classify(self, task: str, texts: List[str]) -> List[Dict]:
+        """Label every text for 'sentiment' or 'emotion'; failed items get the fallback result."""
+        packs = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        parts = await asyncio.gather(*[self._classify_pack(task, pack) for pack in packs])
+        return [r for part in parts for r in part]
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def _classify_pack(self, task: str, texts: List[str]) -> List[Dict]:
+        payload = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": self._prompt(task, texts)}],
+            "response_format": {"type": "json_object"},
+            "temperature": 0.1
+        }
+        try:
+            data = await self._post(payload)
+            return self._parse(task, data['choices'][0]['message']['content'], len(texts))
+        except Exception as e:
+            self.counters["failures"] += 1
+            logger.error(f"External API Error for a pack of {len(texts)}: {e}")
+            return [self._fallback(task) for _ in texts]
+
+    async def _post(self, payload: Dict) -> Dict:
+        for attempt in range(self.max_retries + 1):
+            async with self._semaphore:
+                await self._bucket.acquire()
+                self.counters["requests"] += 1
+                response = await self.client.post(self.api_url, json=payload)
+
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                response.raise_for_status()
+                return response.json()
+
+            # Sleep outside the semaphore so other packs can use the slot
+            self.counters["retries"] += 1
+            delay = self._retry_delay(response, attempt)
+            logger.warning(f"External API returned {response.status_code}, retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _retry_delay(response: httpx.Response, attempt: int) -> float:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return max(0.0, float(retry_after))
+            except ValueError:
+                pass
+        # Exponential backoff with full jitter, capped at 30s
+        return random.uniform(0, min(30.0, 0.5 * 2 ** attempt))
+
+    @staticmethod
+    def _prompt(task: str, texts: List[str]) -> str:
+        numbered = "\n".join(f"{i}. {json.dumps(t)}" for i, t in enumerate(texts, 1))
+        return (
+            f"Classify the {task} of each numbered text below. "
+            f"Allowed labels: {', '.join(LABELS[task])}. "
+            'Return ONLY a JSON object of the form {"results": [{"id": 1, "label": "...", "confidence": 0.0}]} '
+            f"with exactly one entry per text, where confidence is between 0 and 1.\n\n{numbered}"
+        )
+
+    def _parse(self, task: str, content: str, n: int) -> List[Dict]:
+        """Map the model's results back onto the pack by id; missing or invalid entries fall back."""
+        parsed = json.loads(content)
+        entries = parsed.get("results", []) if isinstance(parsed, dict) else parsed
+
+        results: List[Optional[Dict]] = [None] * n
+        for entry in entries:
+            try:
+                idx = int(entry["id"]) - 1
+                label = str(entry["label"]).lower()
+                confidence = min(1.0, max(0.0, float(entry.get("confidence", 0.5))))
+            except (KeyError, TypeError, ValueError):
+                continue
+            if 0 <= idx < n and label in LABELS[task]:
+                results[idx] = {self._key(task): label, "confidence_score": round(confidence, 4), "model_name": self.model}
+        return [r or self._fallback(task) for r in results]
+
+    @staticmethod
+    def _key(task: str) -> str:
+        return "sentiment_label" if task == "sentiment" else "emotion"
+
+    def _fallback(self, task: str) -> Dict:
+        return {self._key(task): "neutral", "confidence_score": 0.0, "model_name": "fallback"}
@@ -0,0 +1,196 @@
+import os
+import sys
+import tempfile
+import inspect
+import logging
+from typing import List, Dict, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ONNX_DIR = os.path.join(os.path.expanduser("~"), ".cache", "huggingface", "sentistream-onnx")
+
+
+def _write_atomically(path: str, write):
+    """
+    Run write(tmp_path) on a temporary file next to `path`, then rename it
+    into place. Replicas and supervised children export the same files
+    concurrently; this way none of them ever loads a half-written model,
+    and a concurrent writer simply replaces the file with an equal one.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-", suffix=".onnx")
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def export_onnx(model_id: str, out_dir: str = None, quantize: bool = True) -> str:
+    """
+    Export a HuggingFace sequence-classification model to ONNX once and
+    return the file to load. With quantize=True a dynamic int8 copy is
+    produced next to the fp32 export and returned instead.
+    """
+    out_dir = out_dir or os.getenv("ONNX_CACHE_DIR", DEFAULT_ONNX_DIR)
+    target = os.path.join(out_dir, model_id.replace("/", "__"))
+    fp32_path = os.path.join(target, "model.onnx")
+
+    if not os.path.exists(fp32_path):
+        import torch
+        from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+        class _LogitsOnly(torch.nn.Module):
+            """Positional inputs in, logits out, whatever the model's forward signature."""
+            def __init__(self, model, names):
+                super().__init__()
+                self.model = model
+                self.names = names
+
+            def forward(self, *inputs):
+                return self.model(**dict(zip(self.names, inputs))).logits
+
+        logger.info(f"Exporting {model_id} to ONNX at {fp32_path}")
+        os.makedirs(target, exist_ok=True)
+        tokenizer = AutoTokenizer.from_pretrained(model_id)
+        model = AutoModelForSequenceClassification.from_pretrained(model_id).eval()
+
+        dummy = tokenizer(["a short example", "another one"], padding=True, return_tensors="pt")
+        accepted = inspect.signature(model.forward).parameters
+        input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in dummy and n in accepted]
+        dynamic_axes = {n: {0: "batch", 1: "sequence"} for n in input_names}
+        dynamic_axes["logits"] = {0: "batch"}
+
+        export_kwargs = {}
+        if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+            # The TorchScript exporter handles dynamic_axes for these models
+            export_kwargs["dynamo"] = False
+        def write(path):
+            with torch.no_grad():
+                torch.onnx.export(
+                    _LogitsOnly(model, input_names), tuple(dummy[n] for n in input_names), path,
+                    input_names=input_names, output_names=["logits"],
+                    dynamic_axes=dynamic_axes, opset_version=14, **export_kwargs
+                )
+        _write_atomically(fp32_path, write)
+
+    if not quantize:
+        return fp32_path
+
+    int8_path = os.path.join(target, "model.int8.onnx")
+    if not os.path.exists(int8_path):
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        logger.info(f"Quantizing {model_id} to int8 at {int8_path}")
+        _write_atomically(int8_path, lambda path: quantize_dynamic(fp32_path, path, weight_type=QuantType.QInt8))
+    return int8_path
+
+
+class OnnxTextClassifier:
+    """
+    Drop-in replacement for a HuggingFace "text-classification" pipeline on
+    ONNX Runtime (CPU): called with a text or a list of texts, it returns
+    [{'label': ..., 'score': ...}] just like the PyTorch pipeline.
+    """
+    def __init__(self, model_id: str, quantize: bool = True, out_dir: str = None, max_length: int = 512, threads: int = None):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer, AutoConfig
+
+        self.model_id = model_id
+        self.quantize = quantize
+        self.max_length = max_length
+        self.tokenizer = AutoTokenizer.from_pretrained(model_id)
+        self.id2label = AutoConfig.from_pretrained(model_id).id2label
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(
+            export_onnx(model_id, out_dir, quantize), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    @property
+    def name(self) -> str:
+        return f"{self.model_id}-onnx{'-int8' if self.quantize else ''}"
+
+    def logits(self, features: Dict) -> np.ndarray:
+        """Raw logits for already tokenised, padded numpy features."""
+        feed = {k: np.asarray(v, dtype=np.int64) for k, v in features.items() if k in self.input_names}
+        return self.session.run(["logits"], feed)[0]
+
+    def __call__(self, texts: Union[str, List[str]], batch_size: int = None, **_) -> List[Dict]:
+        if isinstance(texts, str):
+            texts = [texts]
+        batch_size = batch_size or len(texts) or 1
+
+        results = []
+        for start in range(0, len(texts), batch_size):
+            features = self.tokenizer(
+                texts[start:start + batch_size], padding=True, truncation=True,
+                max_length=self.max_length, return_tensors="np"
+            )
+            logits = self.logits(features)
+            # Stable softmax
+            exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+            probs = exp / exp.sum(axis=-1, keepdims=True)
+            for row in probs:
+                idx = int(row.argmax())
+                results.append({"label": self.id2label[idx], "score": float(row[idx])})
+        return results
+
+
+def parity_check(model_id: str, texts: List[str], quantize: bool = True) -> Dict:
+    """Compare the ONNX classifier against the PyTorch pipeline on the same texts."""
+    from transformers import pipeline
+
+    reference = pipeline("text-classification", model=model_id, device=-1)(texts, batch_size=len(texts), truncation=True)
+    candidate = OnnxTextClassifier(model_id, quantize=quantize)(texts)
+
+    agree = sum(1 for r, c in zip(reference, candidate) if r['label'] == c['label'])
+    deltas = [abs(r['score'] - c['score']) for r, c in zip(reference, candidate)]
+    disagreements = [
+        {"text": t, "torch": r['label'], "onnx": c['label']}
+        for t, r, c in zip(texts, reference, candidate) if r['label'] != c['label']
+    ]
+    return {
+        "model": model_id,
+        "quantized": quantize,
+        "samples": len(texts),
+        "label_agreement": round(agree / len(texts), 4) if texts else 1.0,
+        "max_score_delta": round(max(deltas), 4) if deltas else 0.0,
+        "mean_score_delta": round(sum(deltas) / len(deltas), 4) if deltas else 0.0,
+        "disagreements": disagreements
+    }
+
+
+PARITY_SAMPLES = [
+    "I absolutely love the new iPhone 16!", "This Tesla Model 3 is amazing!",
+    "Highly recommend the new ChatGPT.", "Just tried Netflix.", "Received Amazon Prime today.",
+    "Using PlayStation 5 for the first time.", "Very disappointed with Netflix.",
+    "Terrible experience with Tesla Model 3.", "I hate the new iPhone 16 update.",
+    "The battery is great but the screen scratches way too easily.",
+    "Not bad at all, honestly better than I expected.", "I am so angry about this outage",
+    "Wow, did not see that coming at all!", "I'm scared this update will break my phone.",
+    "Feeling a bit sad that the show got cancelled.",
+]
+
+
+if __name__ == "__main__":
+    # Run from the worker dir before switching a deployment to model_type='onnx':
+    #   python -m services.onnx_backend [min_agreement]
+    logging.basicConfig(level=logging.INFO)
+    min_agreement = float(sys.argv[1]) if len(sys.argv) > 1 else 0.95
+    quantize = os.getenv("ONNX_QUANTIZE", "1") == "1"
+    ok = True
+    for model_id in (
+        os.getenv("HUGGINGFACE_MODEL", "distilbert-base-uncased-finetuned-sst-2-english"),
+        os.getenv("EMOTION_MODEL", "j-hartmann/emotion-english-distilroberta-base"),
+    ):
+        report = parity_check(model_id, PARITY_SAMPLES, quantize=quantize)
+        logger.info(f"Parity {report}")
+        ok = ok and report["label_agreement"] >= min_agreement
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,58 @@
+import json
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import text, tuple_, and_, or_
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at: datetime, post_pk: int, analysis_pk: int) -> str:
+    """Opaque, URL-safe cursor for the row a page ended on."""
+    raw = json.dumps([created_at.isoformat(), post_pk, analysis_pk], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, post_pk, analysis_pk = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(post_pk), int(analysis_pk)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}") from e
+
+
+def keyset_after(created_at_col, post_pk_col, analysis_pk_col, after: Tuple[datetime, int, int]):
+    """
+    WHERE clause for the rows after cursor `after`, in
+    (created_at, post id, analysis id) descending order.
+
+    The seek is on (created_at, post id) only, both columns of
+    idx_created_at_id, so Postgres can start an index range scan at the
+    cursor. The analysis id only breaks the tie between the analyses of
+    the post the previous page ended in.
+    """
+    created_at, post_pk, analysis_pk = after
+    post_key = tuple_(created_at_col, post_pk_col)
+    return and_(
+        post_key <= (created_at, post_pk),
+        or_(post_key < (created_at, post_pk), analysis_pk_col < analysis_pk),
+    )
+
+
+async def estimate_count(db, query) -> Optional[int]:
+    """
+    Row count the planner expects for `query`, from table statistics.
+
+    Costs one EXPLAIN instead of scanning the whole join like COUNT(*);
+    only as accurate as the last ANALYZE.
+    """
+    sql = query.compile(dialect=db.bind.dialect, compile_kwargs={"literal_binds": True})
+    conn = await db.connection()
+    plan = (await conn.execute(text("EXPLAIN (FORMAT JSON) " + str(sql).replace(":", r"\:")))).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
@@ -0,0 +1,120 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from typing import Awaitable, Callable, Dict, Tuple
+
+logger = logging.getLogger("ResponseCache")
+
+# INCRed by the worker for every batch that stored new results (see worker.process_batch)
+DATA_VERSION_KEY = os.getenv("DATA_VERSION_KEY", "sentistream:data_version")
+
+
+def data_version_key(source: str = None) -> str:
+    """Global version, or the version of one source's data."""
+    return f"{DATA_VERSION_KEY}:{source}" if source else DATA_VERSION_KEY
+
+
+def _default(value):
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+class ResponseCache:
+    """
+    Async cache for analytics responses, shared by all API replicas through Redis.
+
+    Every entry records the data version it was computed from. While the
+    worker has not written anything since (same version) and the entry is
+    younger than RESPONSE_CACHE_TTL, it is served as is. Once the data moved
+    on, the old entry is still served (stale-while-revalidate, up to
+    RESPONSE_CACHE_STALE_TTL) while one request recomputes it in the
+    background. Recomputation is single-flight: one task per key in this
+    process, and a short Redis lock across replicas. Entries younger than
+    RESPONSE_CACHE_MIN_AGE count as fresh, so a burst of writes does not
+    cause a burst of recomputes.
+    """
+    def __init__(self, redis_client, ttl: float = None, stale_ttl: float = None, min_age: float = None,
+                 lock_ttl: float = None, prefix: str = None, clock=time.time):
+        self.redis = redis_client
+        self.ttl = ttl or float(os.getenv("RESPONSE_CACHE_TTL", 30))
+        self.stale_ttl = stale_ttl or float(os.getenv("RESPONSE_CACHE_STALE_TTL", 600))
+        self.min_age = min_age if min_age is not None else float(os.getenv("RESPONSE_CACHE_MIN_AGE", 1))
+        self.lock_ttl = lock_ttl or float(os.getenv("RESPONSE_CACHE_LOCK_TTL", 10))
+        self.prefix = prefix or os.getenv("RESPONSE_CACHE_PREFIX", "response_cache")
+        self.clock = clock
+        self.inflight: Dict[str, asyncio.Task] = {}
+        self.counters = {"fresh": 0, "stale": 0, "misses": 0, "recomputes": 0}
+
+    def key(self, name: str, params: Dict) -> str:
+        digest = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+        return f"{self.prefix}:{name}:{digest}"
+
+    async def get(self, name: str, params: Dict, compute: Callable[[], Awaitable], source: str = None) -> Tuple[object, bool]:
+        """(response, served_from_cache). `compute` must open its own DB session,
+        it may outlive the request that triggered it."""
+        key = self.key(name, params)
+        version_key = data_version_key(source)
+        try:
+            version, raw = await self.redis.mget(version_key, key)
+        except Exception as e:
+            logger.error(f"Response cache unavailable, computing {name}: {e}")
+            return await compute(), False
+        version = version or "0"
+        entry = json.loads(raw) if raw else None
+
+        if entry is not None:
+            age = self.clock() - entry["at"]
+            if age < self.min_age or (entry["version"] == version and age < self.ttl):
+                self.counters["fresh"] += 1
+                return entry["value"], True
+            if age < self.stale_ttl:
+                self.counters["stale"] += 1
+                self._refresh(key, version, compute, background=True)
+                return entry["value"], True
+
+        self.counters["misses"] += 1
+        # Shielded: a client going away does not cancel the computation for the others
+        value = await asyncio.shield(self._refresh(key, version, compute))
+        if value is None:
+            # Joined a background refresh that gave up, or the entry expired meanwhile
+            value = await compute()
+        return value, False
+
+    def _refresh(self, key: str, version: str, compute, background: bool = False) -> asyncio.Task:
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._recompute(key, version, compute, background))
+            self.inflight[key] = task
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        return task
+
+    async def _recompute(self, key: str, version: str, compute, background: bool):
+        lock_key = f"{key}:lock"
+        locked = await self.redis.set(lock_key, "1", nx=True, px=int(self.lock_ttl * 1000))
+        if not locked:
+            # Another replica is already computing this entry
+            if background:
+                return None
+            deadline = self.clock() + self.lock_ttl
+            while self.clock() < deadline:
+                await asyncio.sleep(0.05)
+                raw = await self.redis.get(key)
+                if raw:
+                    return json.loads(raw)["value"]
+        try:
+            self.counters["recomputes"] += 1
+            # `version` was read before computing, so writes landing meanwhile leave the entry stale
+            value = await compute()
+            entry = json.dumps({"version": version, "at": self.clock(), "value": value}, default=_default)
+            await self.redis.set(key, entry, ex=int(self.stale_ttl))
+            return json.loads(entry)["value"]
+        except Exception as e:
+            if background:
+                logger.error(f"Background refresh of {key} failed: {e}")
+                return None
+            raise
+        finally:
+            if locked:
+                await self.redis.delete(lock_key)
@@ -1,123 +1,269 @@
 import os
-import json
 import asyncio
-import httpx
 import logging
+import hashlib
 from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
 from transformers import pipeline
+from services.lexicon import LexiconScorer
+from services.batching import TokenBudgetBatcher
+from services.llm_client import LLMClient
 
 logger = logging.getLogger(__name__)
 
+# Shorter texts (after stripping) get the static neutral emotion
+MIN_EMOTION_CHARS = 10
+
 class SentimentAnalyzer:
     """
     Unified interface for sentiment analysis using local Transformers or External LLMs.
     """
-    def __init__(self, model_type: str = 'local', model_name: str = None):
+    def __init__(self, model_type: str = 'local', model_name: str = None, engine=None, cache=None, cascade: bool = None, emotion_policy: str = None,
+                 load_sentiment: bool = True):
         self.model_type = model_type.lower()
         self.device = -1  # Default to CPU
-        self.model_name = model_name or "distilbert-base-uncased-finetuned-sst-2-english"
-        if self.model_type == 'local':
-            # Load Sentiment Model
+        # Optional InferenceEngine: when set, local models run in its
+        # process-pool replicas instead of in this process
+        self.engine = engine
+        # Optional InferenceCache: repeated texts skip inference entirely
+        self.cache = cache
+
+        # Optional cascade: a cheap lexicon scorer decides the unambiguous
+        # posts and only the doubtful ones reach the sentiment model
+        self.cascade = cascade if cascade is not None else os.getenv("SENTIMENT_CASCADE", "0") == "1"
+        self.cascade_min_confidence = float(os.getenv("CASCADE_MIN_CONFIDENCE", 0.8))
+        self.lexicon = LexiconScorer() if self.cascade else None
+        # How many texts each stage decided, for tuning the threshold
+        self.stage_counts = {"lexicon": 0, "model": 0}
+
+        # Which texts analyze_full runs the emotion model on:
+        #   'always'      - every text
+        #   'non_neutral' - only texts whose sentiment is non-neutral and confident
+        #   'sampled'     - a stable, content-hashed EMOTION_SAMPLE_RATE share of texts
+        # Skipped texts get emotion=None, to be filled in on demand later
+        self.emotion_policy = (emotion_policy or os.getenv("EMOTION_POLICY", "always")).lower()
+        self.emotion_sample_rate = float(os.getenv("EMOTION_SAMPLE_RATE", 0.1))
+        self.emotion_min_confidence = float(os.getenv("EMOTION_MIN_SENTIMENT_CONFIDENCE", 0.75))
+
+        # 'local' runs the PyTorch pipelines, 'onnx' the same models on ONNX Runtime
+        self.is_local = self.model_type in ('local', 'onnx')
+        if self.is_local:
             sent_model = model_name or os.getenv("HUGGINGFACE_MODEL", "distilbert-base-uncased-finetuned-sst-2-english")
-            self.sentiment_pipe = pipeline("text-classification", model=sent_model, device=self.device)
-            
-            # Load Emotion Model
             emot_model = os.getenv("EMOTION_MODEL", "j-hartmann/emotion-english-distilroberta-base")
-            self.emotion_pipe = pipeline("text-classification", model=emot_model, device=self.device)
-            logger.info(f"Local models loaded on device: {self.device}")
-            
+            self.onnx_quantize = os.getenv("ONNX_QUANTIZE", "1") == "1"
+            # Recorded in results, so ONNX outputs stay distinguishable in the DB and cache
+            self.sentiment_model_name = self._backend_model_name(sent_model)
+            self.emotion_model_name = self._backend_model_name(emot_model)
+
+            if self.engine is None:
+                # Load Sentiment Model (emotion-only users, like the API's
+                # emotion backfill, skip it with load_sentiment=False)
+                self.sentiment_pipe = self._load_classifier(sent_model) if load_sentiment else None
+
+                # Load Emotion Model
+                self.emotion_pipe = self._load_classifier(emot_model)
+
+                # Token-budget, length-bucketed batching with token truncation
+                self.sentiment_batcher = TokenBudgetBatcher(self.sentiment_pipe) if load_sentiment else None
+                self.emotion_batcher = TokenBudgetBatcher(self.emotion_pipe)
+
+                # One thread per model: the two models run side by side in
+                # analyze_full, but each model only ever runs one batch at a time
+                self._executors = {
+                    "sentiment": ThreadPoolExecutor(max_workers=1, thread_name_prefix="sentiment"),
+                    "emotion": ThreadPoolExecutor(max_workers=1, thread_name_prefix="emotion")
+                }
+                logger.info(f"Local {self.model_type} models loaded on device: {self.device}")
+            else:
+                logger.info(f"Local inference delegated to {self.engine.replicas} engine replicas")
+
         else:
-            # External LLM Setup (Groq example)
-            self.api_key = os.getenv("EXTERNAL_LLM_API_KEY")
-            self.api_url = "https://api.groq.com/openai/v1/chat/completions"
-            self.llm_model = os.getenv("EXTERNAL_LLM_MODEL", "llama-3.1-8b-instant")
-            self.client = httpx.AsyncClient(timeout=30.0)
+            # External LLM Setup (Groq by default, any OpenAI-compatible API)
+            self.llm_client = LLMClient()
+            self.llm_model = self.llm_client.model
             logger.info(f"External LLM configured using model: {self.llm_model}")
 
     async def analyze_sentiment(self, text: str) -> Dict:
         """Analyze text sentiment: returns positive, negative, or neutral."""
-        # THE BULLETPROOF CHECK
-        if text is None:
-            return {"sentiment_label": "neutral", "confidence_score": 0.0, "model_name": self.model_name}
-        
-        clean_text = str(text).strip()
-        if not clean_text:
-            return {"sentiment_label": "neutral", "confidence_score": 0.0, "model_name": self.model_name}
-
-        if self.model_type == 'local':
-            # Local Inference
-            result = self.sentiment_pipe(clean_text[:512])[0]
-            label = result['label'].lower()
-            mapped_label = "positive" if "pos" in label else "negative" if "neg" in label else "neutral"
-            return {
-                "sentiment_label": mapped_label,
-                "confidence_score": round(result['score'], 4),
-                "model_name": self.sentiment_pipe.model.config._name_or_path
-            }
-        else:
-            return await self._call_external_llm(clean_text, task="sentiment")
+        return (await self.batch_analyze([text]))[0]
 
     async def analyze_emotion(self, text: str) -> Dict:
         """Detect primary emotion: joy, sadness, anger, fear, surprise, neutral."""
-        # Bulletproof check for None or Short text
-        if text is None or len(str(text).strip()) < 10:
-            return {"emotion": "neutral", "confidence_score": 0.0, "model_name": "emotion-model"}
-
-        if self.model_type == 'local':
-            result = self.emotion_pipe(str(text)[:512])[0]
-            return {
-                "emotion": result['label'].lower(),
-                "confidence_score": round(result['score'], 4),
-                "model_name": self.emotion_pipe.model.config._name_or_path
-            }
-        else:
-            return await self._call_external_llm(str(text), task="emotion")
-
+        return (await self.batch_analyze_emotion([text]))[0]
 
     async def batch_analyze(self, texts: List[str]) -> List[Dict]:
         """Process multiple texts efficiently."""
-        if not texts:
-            return []
-            
-        if self.model_type == 'local':
-            # Pipelines handle lists natively and efficiently
-            results = self.sentiment_pipe(texts, batch_size=len(texts))
-            return [
-                {
-                    "sentiment_label": "positive" if "pos" in r['label'].lower() else "negative",
-                    "confidence_score": round(r['score'], 4),
-                    "model_name": "batch_local"
-                } for r in results
+        return await self._sentiment_for([self._clean(t) for t in texts or []])
+
+    async def batch_analyze_emotion(self, texts: List[str]) -> List[Dict]:
+        """Batched counterpart of analyze_emotion, results keep the input order."""
+        return await self._emotion_for([self._clean(t) for t in texts or []])
+
+    async def analyze_full(self, texts: List[str]) -> List[Dict]:
+        """
+        Sentiment and emotion for a whole batch in one call. Preprocessing and
+        guards are shared and both models run concurrently (except under the
+        'non_neutral' emotion policy); each text gets one combined record, with
+        the emotion fields None when the policy skipped the text:
+        {sentiment_label, confidence_score, model_name, emotion, emotion_confidence, emotion_model_name}
+        """
+        clean = [self._clean(t) for t in texts or []]
+        if self.emotion_policy == "non_neutral":
+            # Emotion depends on the sentiment result, so the models run one after the other
+            sentiments = await self._sentiment_for(clean)
+            wanted = [
+                s["sentiment_label"] != "neutral" and s["confidence_score"] >= self.emotion_min_confidence
+                for s in sentiments
             ]
+            emotions = await self._emotion_for(clean, wanted)
         else:
-            # Concurrent API calls for External LLM
-            tasks = [self.analyze_sentiment(t) for t in texts]
-            return await asyncio.gather(*tasks)
-
-    async def _call_external_llm(self, text: str, task: str) -> Dict:
-        """Helper to handle External API calls with structured prompts."""
-        prompt = f"Analyze the following text and return ONLY a JSON object with 'label' and 'confidence' (0-1). Task: {task}. Text: {text}"
-        
-        try:
-            payload = {
-                "model": self.llm_model,
-                "messages": [{"role": "user", "content": prompt}],
-                "response_format": {"type": "json_object"},
-                "temperature": 0.1
-            }
-            headers = {"Authorization": f"Bearer {self.api_key}"}
-            
-            response = await self.client.post(self.api_url, json=payload, headers=headers)
-            response.raise_for_status()
-            data = response.json()
-            content = json.loads(data['choices'][0]['message']['content'])
-            
-            key = "sentiment_label" if task == "sentiment" else "emotion"
-            return {
-                key: content.get('label', 'neutral').lower(),
-                "confidence_score": content.get('confidence', 0.5),
-                "model_name": self.llm_model
-            }
-        except Exception as e:
-            logger.error(f"External API Error: {e}")
-            return {"sentiment_label": "neutral", "confidence_score": 0.0, "model_name": "fallback"}
\ No newline at end of file
+            wanted = [self._sampled(t) for t in clean] if self.emotion_policy == "sampled" else None
+            sentiments, emotions = await asyncio.gather(self._sentiment_for(clean), self._emotion_for(clean, wanted))
+        return [
+            {
+                **sentiment,
+                "emotion": emotion["emotion"],
+                "emotion_confidence": emotion["confidence_score"],
+                "emotion_model_name": emotion["model_name"]
+            } for sentiment, emotion in zip(sentiments, emotions)
+        ]
+
+    @staticmethod
+    def _clean(text) -> str:
+        """Shared preprocessing: None, non-strings and padding all become a stripped str."""
+        return "" if text is None else str(text).strip()
+
+    async def _sentiment_for(self, clean: List[str]) -> List[Dict]:
+        # Empty texts are neutral without touching a model
+        results = [
+            {"sentiment_label": "neutral", "confidence_score": 0.0, "model_name": "static_rule"}
+            for _ in clean
+        ]
+        keep = [i for i, t in enumerate(clean) if t]
+        if keep:
+            preds = await self._classify_sentiment([clean[i] for i in keep])
+            for i, r in zip(keep, preds):
+                results[i] = r
+        return results
+
+    def _sampled(self, text: str) -> bool:
+        # Hash-based, so a redelivered post gets the same decision
+        bucket = int(hashlib.sha1(text.encode("utf-8")).hexdigest()[:8], 16) / 0xFFFFFFFF
+        return bucket < self.emotion_sample_rate
+
+    async def _emotion_for(self, clean: List[str], wanted: List[bool] = None) -> List[Dict]:
+        results = []
+        for i, t in enumerate(clean):
+            if len(t) < MIN_EMOTION_CHARS:
+                # Too little text to read an emotion from
+                results.append({"emotion": "neutral", "confidence_score": 1.0, "model_name": "static_rule"})
+            elif wanted is not None and not wanted[i]:
+                # Skipped by the emotion policy
+                results.append({"emotion": None, "confidence_score": None, "model_name": None})
+            else:
+                results.append(None)
+        keep = [i for i, r in enumerate(results) if r is None]
+        if keep:
+            preds = await self._infer("emotion", [clean[i] for i in keep])
+            for i, r in zip(keep, preds):
+                results[i] = r
+        return results
+
+    async def _classify_sentiment(self, texts: List[str]) -> List[Dict]:
+        """Sentiment for validated texts, through the lexicon stage first when cascading."""
+        if self.lexicon is None:
+            self.stage_counts["model"] += len(texts)
+            return await self._infer("sentiment", texts)
+
+        results = [self.lexicon.analyze(t) for t in texts]
+        doubtful = [i for i, r in enumerate(results) if r["confidence_score"] < self.cascade_min_confidence]
+        self.stage_counts["lexicon"] += len(texts) - len(doubtful)
+        self.stage_counts["model"] += len(doubtful)
+        if doubtful:
+            preds = await self._infer("sentiment", [texts[i] for i in doubtful])
+            for i, r in zip(doubtful, preds):
+                results[i] = r
+        return results
+
+    async def _infer(self, task: str, texts: List[str]) -> List[Dict]:
+        """Model results for already-validated texts, served from the cache where possible."""
+        if self.cache is None:
+            return await self._run_model(task, texts)
+
+        model_name = self._cache_model_name(task)
+        results = await self.cache.get_many(model_name, texts)
+
+        # Identical texts inside one batch only go through the model once
+        pending = {}
+        for i, r in enumerate(results):
+            if r is None:
+                pending.setdefault(self.cache.normalize(texts[i]), []).append(i)
+        if not pending:
+            return results
+
+        groups = list(pending.values())
+        fresh = await self._run_model(task, [texts[idx[0]] for idx in groups])
+        # Never cache the error fallback of the external API
+        cacheable = [(texts[idx[0]], r) for idx, r in zip(groups, fresh) if r.get("model_name") != "fallback"]
+        await self.cache.set_many(model_name, [t for t, _ in cacheable], [r for _, r in cacheable])
+        for idx, r in zip(groups, fresh):
+            for i in idx:
+                results[i] = r
+        return results
+
+    def _cache_model_name(self, task: str) -> str:
+        if self.is_local:
+            return self.sentiment_model_name if task == "sentiment" else self.emotion_model_name
+        return f"{self.llm_model}:{task}"
+
+    async def _run_model(self, task: str, texts: List[str]) -> List[Dict]:
+        if self.is_local:
+            return await self._run_local(task, texts)
+        # Packed, rate-limited API calls for External LLM
+        return await self.llm_client.classify(task, texts)
+
+    def _load_classifier(self, model_id: str):
+        if self.model_type == 'onnx':
+            from services.onnx_backend import OnnxTextClassifier
+            threads = int(os.getenv("ONNX_THREADS", 0)) or None
+            return OnnxTextClassifier(model_id, quantize=self.onnx_quantize, threads=threads)
+        return pipeline("text-classification", model=model_id, device=self.device)
+
+    def _backend_model_name(self, model_id: str) -> str:
+        if self.model_type == 'onnx':
+            return f"{model_id}-onnx{'-int8' if self.onnx_quantize else ''}"
+        return model_id
+
+    async def _run_local(self, task: str, texts: List[str]) -> List[Dict]:
+        """Run a local model batch without blocking the event loop."""
+        if self.engine is not None:
+            return await self.engine.predict(task, texts)
+
+        predict = self._predict_sentiment if task == "sentiment" else self._predict_emotion
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executors[task], predict, texts)
+
+    def _predict_sentiment(self, texts: List[str]) -> List[Dict]:
+        """Blocking batched sentiment inference on already-validated texts."""
+        preds = self.sentiment_batcher(texts)
+        results = []
+        for r in preds:
+            label = r['label'].lower()
+            # Map labels (DistilBERT uses 'POSITIVE'/'NEGATIVE')
+            results.append({
+                "sentiment_label": "positive" if "pos" in label else "negative" if "neg" in label else "neutral",
+                "confidence_score": round(r['score'], 4),
+                "model_name": self.sentiment_model_name
+            })
+        return results
+
+    def _predict_emotion(self, texts: List[str]) -> List[Dict]:
+        """Blocking batched emotion inference on already-validated texts."""
+        preds = self.emotion_batcher(texts)
+        return [
+            {
+                "emotion": r['label'].lower(),
+                "confidence_score": round(r['score'], 4),
+                "model_name": self.emotion_model_name
+            } for r in preds
+        ]
@@ -0,0 +1,166 @@
+import os
+import time
+import logging
+from collections import Counter, deque
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import select, func
+
+from models import SocialMediaPost, SentimentAnalysis, SentimentRollupMinute
+
+logger = logging.getLogger("SlidingWindows")
+
+LABELS = ("positive", "negative", "neutral")
+
+
+def normalise_label(label: str) -> str:
+    label = (label or "").lower()
+    if "pos" in label:
+        return "positive"
+    if "neg" in label:
+        return "negative"
+    return "neutral"
+
+
+def _epoch(ts: datetime) -> float:
+    """Naive UTC datetime (as stored in created_at) -> unix seconds."""
+    return (ts - datetime(1970, 1, 1)).total_seconds()
+
+
+class RingCounter:
+    """
+    Ring of fixed-width buckets of (source, label) counts, plus a running
+    total per named window. Adding an event or moving the clock touches
+    only the buckets that enter or leave a window, so reading a window's
+    totals never depends on how many events it holds.
+    """
+    def __init__(self, resolution: int, windows: Dict[str, int]):
+        # Bucket width in seconds; window name -> number of buckets
+        self.resolution = resolution
+        self.windows = windows
+        self.size = max(windows.values())
+        self.buckets: deque = deque()  # (index, Counter), oldest first
+        self.totals = {name: Counter() for name in windows}
+        self.head: Optional[int] = None
+
+    def advance(self, now: float):
+        index = int(now // self.resolution)
+        if self.head is None:
+            self.head = index
+            return
+        if index <= self.head:
+            return
+        for name, length in self.windows.items():
+            # Buckets that were in (head - length, head] but not in (index - length, index]
+            for bucket_index, counts in self.buckets:
+                if bucket_index > index - length:
+                    break
+                if bucket_index > self.head - length:
+                    self.totals[name].subtract(counts)
+            self.totals[name] = +self.totals[name]
+        while self.buckets and self.buckets[0][0] <= index - self.size:
+            self.buckets.popleft()
+        self.head = index
+
+    def add(self, ts: float, key: Tuple[str, str], n: int = 1):
+        index = int(ts // self.resolution)
+        if self.head is None or index > self.head:
+            self.advance(ts)
+        if index <= self.head - self.size:
+            return  # older than the longest window
+        # Events arrive roughly in order, so the bucket is almost always the last one
+        position = len(self.buckets)
+        while position and self.buckets[position - 1][0] > index:
+            position -= 1
+        if position and self.buckets[position - 1][0] == index:
+            counts = self.buckets[position - 1][1]
+        else:
+            counts = Counter()
+            self.buckets.insert(position, (index, counts))
+        counts[key] += n
+        for name, length in self.windows.items():
+            if index > self.head - length:
+                self.totals[name][key] += n
+
+
+class SlidingWindowCounters:
+    """
+    Live sentiment counts over named trailing windows, per label and source.
+
+    Short windows (up to WINDOW_SECOND_BUCKETS seconds) are counted in
+    per-second buckets, longer ones in per-minute buckets. Fed with every
+    event from the live feed (record_event), seeded once from the database
+    on start (backfill), and read by the metrics broadcaster and the alert
+    service without touching Postgres.
+    """
+    def __init__(self, windows: Dict[str, int], second_buckets: int = None, clock=time.time):
+        self.clock = clock
+        second_buckets = second_buckets or int(os.getenv("WINDOW_SECOND_BUCKETS", 300))
+        short = {name: seconds for name, seconds in windows.items() if seconds <= second_buckets}
+        long = {name: -(-seconds // 60) for name, seconds in windows.items() if seconds > second_buckets}
+        self.seconds = RingCounter(1, short) if short else None
+        self.minutes = RingCounter(60, long) if long else None
+        self.rings = {name: self.seconds if name in short else self.minutes for name in windows}
+        self.events = 0
+
+    def add(self, source: str, label: str, ts: float = None, n: int = 1):
+        now = self.clock()
+        # Posts stamped in the future (clock skew) count as now
+        ts = now if ts is None else min(ts, now)
+        key = (source or "unknown", normalise_label(label))
+        for ring in (self.seconds, self.minutes):
+            if ring is not None:
+                ring.add(ts, key, n)
+        self.events += n
+
+    def record_event(self, raw: Dict):
+        """One worker event from the live feed (see worker.event_payload)."""
+        ts = None
+        if raw.get("created_at"):
+            try:
+                ts = _epoch(datetime.fromisoformat(str(raw["created_at"]).replace("Z", "")))
+            except ValueError:
+                pass
+        self.add(raw.get("source"), raw.get("sentiment"), ts)
+
+    def counts(self, window: str, source: str = None) -> Dict[str, int]:
+        ring = self.rings[window]
+        ring.advance(self.clock())
+        counts = {label: 0 for label in LABELS}
+        for (key_source, label), n in ring.totals[window].items():
+            if source is None or key_source == source:
+                counts[label] += n
+        counts["total"] = sum(counts[label] for label in LABELS)
+        return counts
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        return {window: self.counts(window) for window in self.rings}
+
+    async def backfill(self, db):
+        """
+        Seed the windows after a start: per-second counts from the posts of
+        the last few minutes, per-minute counts from the minute rollups.
+        """
+        now = datetime.utcfromtimestamp(self.clock())
+        if self.seconds is not None:
+            since = now - timedelta(seconds=self.seconds.size)
+            bucket = func.date_trunc("second", SocialMediaPost.created_at)
+            rows = (await db.execute(
+                select(bucket, SocialMediaPost.source, SentimentAnalysis.sentiment_label, func.count(SentimentAnalysis.id))
+                .join(SentimentAnalysis, SocialMediaPost.post_id == SentimentAnalysis.post_id)
+                .where(SocialMediaPost.created_at >= since)
+                .group_by(bucket, SocialMediaPost.source, SentimentAnalysis.sentiment_label)
+            )).all()
+            for ts, source, label, n in rows:
+                self.seconds.add(min(_epoch(ts), self.clock()), (source, normalise_label(label)), n)
+        if self.minutes is not None:
+            since = now - timedelta(minutes=self.minutes.size)
+            rows = (await db.execute(
+                select(SentimentRollupMinute.bucket, SentimentRollupMinute.source,
+                       SentimentRollupMinute.sentiment_label, SentimentRollupMinute.post_count)
+                .where(SentimentRollupMinute.bucket >= since)
+            )).all()
+            for ts, source, label, n in rows:
+                self.minutes.add(min(_epoch(ts), self.clock()), (source, normalise_label(label)), n)
+        logger.info(f"📈 Sliding windows seeded: {self.snapshot()}")
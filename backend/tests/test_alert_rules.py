@@ -0,0 +1,106 @@
+import json
+
+import pytest
+from services.alert_rules import AlertEngine, RatioRule, VolumeSpikeRule, ZScoreRule, load_rules, rule_windows
+from services.windows import SlidingWindowCounters
+from fakes import FakeClock
+
+
+def make_engine(rules, clock):
+    counters = SlidingWindowCounters(rule_windows(rules), clock=clock)
+    return counters, AlertEngine(rules, counters, clock=clock)
+
+
+def feed(counters, engine, source, label, n=1):
+    for _ in range(n):
+        event = {"source": source, "sentiment": label}
+        counters.record_event(event)
+        engine.observe(event)
+
+
+def test_ratio_rule_fires_once_then_clears_with_hysteresis():
+    clock = FakeClock()
+    rule = RatioRule("neg", threshold=2.0, clear=1.0, window_minutes=1, min_posts=4, cooldown_seconds=0)
+    counters, engine = make_engine([rule], clock)
+
+    feed(counters, engine, "reddit", "positive", 2)
+    feed(counters, engine, "reddit", "negative", 6)
+    alerts = engine.drain()
+    assert len(alerts) == 1
+    assert alerts[0]["alert_type"] == "neg" and alerts[0]["source"] is None
+    assert alerts[0]["actual_value"] == 2.0
+
+    # Still above the clear level: no new alert, stays active
+    feed(counters, engine, "reddit", "positive", 1)
+    assert engine.drain() == []
+    # Below clear, then above threshold again: fires again
+    feed(counters, engine, "reddit", "positive", 6)
+    feed(counters, engine, "reddit", "negative", 14)
+    assert len(engine.drain()) == 1
+
+
+def test_cooldown_and_per_source_scopes():
+    clock = FakeClock()
+    rule = RatioRule("neg", threshold=2.0, clear=1.0, window_minutes=1, min_posts=3, per_source=True, cooldown_seconds=300)
+    counters, engine = make_engine([rule], clock)
+
+    feed(counters, engine, "reddit", "negative", 3)
+    feed(counters, engine, "twitter", "positive", 3)
+    assert [a["source"] for a in engine.drain()] == ["reddit"]
+
+    # The window empties and the reddit alert clears, but the cooldown holds the next one back
+    clock.now += 61
+    engine.tick()
+    feed(counters, engine, "reddit", "negative", 3)
+    assert engine.drain() == []
+    clock.now += 300
+    engine.tick()
+    feed(counters, engine, "reddit", "negative", 3)
+    assert len(engine.drain()) == 1
+
+
+def test_volume_spike_against_baseline():
+    clock = FakeClock()
+    rule = VolumeSpikeRule("spike", threshold=3.0, window_minutes=1, baseline_minutes=10, min_posts=5)
+    counters, engine = make_engine([rule], clock)
+    for _ in range(9):
+        feed(counters, engine, "reddit", "neutral", 2)
+        clock.now += 60
+    assert engine.drain() == []
+    feed(counters, engine, "reddit", "neutral", 30)
+    alerts = engine.drain()
+    assert len(alerts) == 1 and alerts[0]["metrics"]["total_count"] >= 5
+
+
+def test_zscore_rule_learns_baseline_then_flags_outlier():
+    # 10 s into a minute bucket
+    clock = FakeClock(now=1_699_999_990.0)
+    rule = ZScoreRule("share", threshold=3.0, bucket_seconds=60, alpha=0.2, warmup=5, min_posts=5)
+    counters, engine = make_engine([rule], clock)
+
+    def close_bucket():
+        clock.now += 55
+        engine.tick()
+        clock.now += 5
+
+    for i in range(8):
+        feed(counters, engine, "reddit", "negative", 2 + i % 2)
+        feed(counters, engine, "reddit", "positive", 8)
+        close_bucket()
+    assert engine.drain() == []
+    feed(counters, engine, "reddit", "negative", 20)
+    close_bucket()
+    alerts = engine.drain()
+    assert len(alerts) == 1 and alerts[0]["rule_type"] == "zscore"
+
+
+def test_load_rules_from_json_and_default():
+    rules = load_rules(json.dumps([
+        {"name": "a", "type": "ratio", "threshold": 2},
+        {"name": "b", "type": "volume_spike", "threshold": 4, "source": "reddit"},
+    ]))
+    assert [type(r) for r in rules] == [RatioRule, VolumeSpikeRule]
+    assert rules[1].scopes("reddit") == ["reddit"] and rules[1].scopes("twitter") == []
+    assert load_rules("")[0].name == "high_negative_ratio"
+    with pytest.raises(ValueError):
+        load_rules(json.dumps([{"name": "a", "type": "median", "threshold": 1}]))
@@ -0,0 +1,80 @@
+import pytest
+from services.sentiment_analyzer import SentimentAnalyzer
+from fakes import FakeEngine
+
+TEXTS = ["A good phone, really", "A bad update again", "Just an ordinary day", "ok", "   "]
+
+
+def analyzer(policy, engine=None):
+    return SentimentAnalyzer(model_type='local', engine=engine or FakeEngine(), cascade=False, emotion_policy=policy)
+
+
+def emotion_calls(engine):
+    return [texts for task, texts in engine.calls if task == "emotion"]
+
+
+@pytest.mark.asyncio
+async def test_merged_record_fields():
+    engine = FakeEngine()
+    good, bad, ordinary, short, empty = await analyzer("always", engine).analyze_full(TEXTS)
+
+    assert good == {
+        "sentiment_label": "positive", "confidence_score": 0.9, "model_name": "fake-sentiment",
+        "emotion": "joy", "emotion_confidence": 0.8, "emotion_model_name": "fake-emotion",
+    }
+    assert bad["sentiment_label"] == "negative" and ordinary["sentiment_label"] == "neutral"
+    # Too short for the emotion model: the static neutral emotion, fully confident
+    assert short["model_name"] == "fake-sentiment"
+    assert (short["emotion"], short["emotion_confidence"], short["emotion_model_name"]) == ("neutral", 1.0, "static_rule")
+    # Empty after stripping: neither model runs
+    assert empty == {
+        "sentiment_label": "neutral", "confidence_score": 0.0, "model_name": "static_rule",
+        "emotion": "neutral", "emotion_confidence": 1.0, "emotion_model_name": "static_rule",
+    }
+    assert ("sentiment", ["A good phone, really", "A bad update again", "Just an ordinary day", "ok"]) in engine.calls
+    assert emotion_calls(engine) == [["A good phone, really", "A bad update again", "Just an ordinary day"]]
+
+
+@pytest.mark.asyncio
+async def test_always_runs_the_emotion_model_on_every_long_enough_text():
+    results = await analyzer("always").analyze_full(TEXTS[:3])
+    assert [r["emotion"] for r in results] == ["joy", "joy", "joy"]
+
+
+@pytest.mark.asyncio
+async def test_non_neutral_skips_neutral_posts():
+    engine = FakeEngine()
+    results = await analyzer("non_neutral", engine).analyze_full(TEXTS)
+    assert [r["emotion"] for r in results] == ["joy", "joy", None, "neutral", "neutral"]
+    skipped = results[2]
+    assert skipped["sentiment_label"] == "neutral"
+    assert (skipped["emotion_confidence"], skipped["emotion_model_name"]) == (None, None)
+    assert emotion_calls(engine) == [["A good phone, really", "A bad update again"]]
+
+
+@pytest.mark.asyncio
+async def test_non_neutral_skips_unconfident_sentiment(monkeypatch):
+    monkeypatch.setenv("EMOTION_MIN_SENTIMENT_CONFIDENCE", "0.95")
+    engine = FakeEngine()
+    results = await analyzer("non_neutral", engine).analyze_full(TEXTS[:2])
+    assert [r["emotion"] for r in results] == [None, None]
+    assert emotion_calls(engine) == []
+
+
+@pytest.mark.asyncio
+async def test_sampled_follows_the_rate(monkeypatch):
+    monkeypatch.setenv("EMOTION_SAMPLE_RATE", "0")
+    assert [r["emotion"] for r in await analyzer("sampled").analyze_full(TEXTS)] == [None, None, None, "neutral", "neutral"]
+    monkeypatch.setenv("EMOTION_SAMPLE_RATE", "1")
+    assert [r["emotion"] for r in await analyzer("sampled").analyze_full(TEXTS)] == ["joy", "joy", "joy", "neutral", "neutral"]
+
+
+@pytest.mark.asyncio
+async def test_sampled_decisions_are_stable_per_text(monkeypatch):
+    monkeypatch.setenv("EMOTION_SAMPLE_RATE", "0.5")
+    texts = [f"post number {i} about nothing" for i in range(40)]
+    first = [r["emotion"] for r in await analyzer("sampled").analyze_full(texts)]
+    # A redelivered batch, in another worker, gets the same decisions
+    again = [r["emotion"] for r in await analyzer("sampled").analyze_full(list(reversed(texts)))]
+    assert first == list(reversed(again))
+    assert 0 < first.count("joy") < len(texts)
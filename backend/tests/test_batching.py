@@ -0,0 +1,52 @@
+import numpy as np
+from services.batching import TokenBudgetBatcher
+
+
+class FakeTokenizer:
+    """One token per word plus [CLS]/[SEP], padding with 0."""
+    model_max_length = 8
+
+    def __call__(self, texts, truncation=True, max_length=None):
+        ids = [[101] + [len(w) for w in t.split()][:max_length - 2] + [102] for t in texts]
+        return {"input_ids": ids}
+
+    def pad(self, features, return_tensors=None):
+        longest = max(len(ids) for ids in features["input_ids"])
+        return {"input_ids": np.array([ids + [0] * (longest - len(ids)) for ids in features["input_ids"]])}
+
+
+class FakeClassifier:
+    """Label 1 when the (padded) sequence is long, so results reveal the order."""
+    id2label = {0: "SHORT", 1: "LONG"}
+
+    def __init__(self):
+        self.tokenizer = FakeTokenizer()
+        self.batch_shapes = []
+
+    def logits(self, features):
+        ids = features["input_ids"]
+        self.batch_shapes.append(ids.shape)
+        real = (ids != 0).sum(axis=1)
+        return np.stack([6.0 - real, real - 6.0], axis=1)
+
+
+def test_plan_sorts_by_length_and_respects_the_budget():
+    batcher = TokenBudgetBatcher(FakeClassifier(), token_budget=12)
+    lengths = [8, 3, 3, 8, 4]
+    batches = batcher.plan(lengths)
+    assert sorted(i for b in batches for i in b) == list(range(5))
+    for batch in batches:
+        assert max(lengths[i] for i in batch) * len(batch) <= 12
+    assert batches[0] == [1, 2, 4]
+
+
+def test_results_keep_the_original_order_and_truncate_by_tokens():
+    classifier = FakeClassifier()
+    batcher = TokenBudgetBatcher(classifier, token_budget=16)
+    texts = ["a b c d e f g h i j", "hi", "one two", "w " * 30]
+    results = batcher(texts)
+
+    assert [r["label"] for r in results] == ["LONG", "SHORT", "SHORT", "LONG"]
+    # Long texts were cut at max_tokens, and never padded short ones
+    assert max(shape[1] for shape in classifier.batch_shapes) == 8
+    assert classifier.batch_shapes[0] == (2, 4)
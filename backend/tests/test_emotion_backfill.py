@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+from models import SentimentAnalysis
+from services.emotion_backfill import EmotionBackfill
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+
+class FakeSession:
+    """One request's session over a shared emotion column (id -> emotion)."""
+    def __init__(self, table, rows):
+        self.table = table
+        self.rows = rows
+
+    async def execute(self, statement):
+        return FakeResult(list(self.table.items()))
+
+    async def commit(self):
+        for analysis in self.rows:
+            if analysis.emotion is not None:
+                self.table[analysis.id] = analysis.emotion
+
+
+class FakeAnalyzer:
+    def __init__(self):
+        self.calls = []
+
+    async def batch_analyze_emotion(self, texts):
+        self.calls.append(texts)
+        await asyncio.sleep(0)
+        return [{"emotion": "joy"} for _ in texts]
+
+
+def request_rows(table):
+    rows = [SentimentAnalysis(id=i, emotion=table[i]) for i in sorted(table)]
+    return FakeSession(table, rows), [(a, f"text {a.id}") for a in rows]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_compute_each_emotion_once():
+    table = {1: None, 2: None, 3: "anger"}
+    backfill = EmotionBackfill(redis_client=None)
+    backfill._analyzer = analyzer = FakeAnalyzer()
+
+    (db_a, rows_a), (db_b, rows_b) = request_rows(table), request_rows(table)
+    filled = await asyncio.gather(backfill.fill(db_a, rows_a), backfill.fill(db_b, rows_b))
+
+    assert sorted(filled) == [0, 2]
+    assert analyzer.calls == [["text 1", "text 2"]]
+    assert table == {1: "joy", 2: "joy", 3: "anger"}
+    # The request that waited still returns the stored emotions
+    assert [a.emotion for a, _ in rows_b] == ["joy", "joy", "anger"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("model_type, expected", [("local", "local"), ("onnx", "local"), ("external", "external")])
+async def test_backfill_loads_only_what_the_api_can_run(monkeypatch, model_type, expected):
+    from services import sentiment_analyzer
+    built = []
+
+    class RecordingAnalyzer:
+        def __init__(self, model_type, cache=None, load_sentiment=True):
+            built.append((model_type, load_sentiment))
+
+    monkeypatch.setattr(sentiment_analyzer, "SentimentAnalyzer", RecordingAnalyzer)
+    monkeypatch.setenv("SENTIMENT_MODEL_TYPE", model_type)
+    backfill = EmotionBackfill(redis_client=None)
+    await backfill._get_analyzer()
+    await backfill._get_analyzer()
+    # Built once; the local emotion backfill never loads the sentiment model
+    assert built == [(expected, expected == "external")]
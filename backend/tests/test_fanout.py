@@ -0,0 +1,181 @@
+import asyncio
+import json
+
+import pytest
+from services.fanout import ConnectionManager, new_post_message, SLOW_CONSUMER_CLOSE_CODE
+from fakes import FakeRedis
+
+
+class FakeWebSocket:
+    def __init__(self, stalled=False):
+        self.sent = []
+        self.closed_with = None
+        # A stalled client never finishes a send, like a browser on a dead link
+        self.stalled = stalled
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        if self.stalled:
+            await asyncio.Event().wait()
+        self.sent.append(json.loads(text))
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+
+@pytest.mark.asyncio
+async def test_broadcast_reaches_every_client():
+    manager = ConnectionManager(queue_size=8)
+    a, b = FakeWebSocket(), FakeWebSocket()
+    await manager.connect(a)
+    await manager.connect(b)
+
+    await manager.broadcast({"type": "metrics_update", "data": {}})
+    await asyncio.sleep(0)
+
+    assert [m["type"] for m in a.sent] == ["connected", "metrics_update"]
+    assert [m["type"] for m in b.sent] == ["connected", "metrics_update"]
+    manager.disconnect(a)
+    manager.disconnect(b)
+    assert manager.active_connections == []
+
+
+@pytest.mark.asyncio
+async def test_slow_client_is_dropped_without_blocking_others():
+    manager = ConnectionManager(queue_size=2)
+    slow, fast = FakeWebSocket(stalled=True), FakeWebSocket()
+    await manager.connect(slow)
+    await manager.connect(fast)
+
+    for i in range(5):
+        await manager.broadcast({"type": "new_post", "n": i})
+        await asyncio.sleep(0)
+
+    assert slow not in manager.active_connections
+    assert slow.closed_with == SLOW_CONSUMER_CLOSE_CODE
+    assert manager.dropped == 1
+    assert [m.get("n") for m in fast.sent if m["type"] == "new_post"] == [0, 1, 2, 3, 4]
+    manager.disconnect(fast)
+
+
+def test_new_post_message_from_worker_event():
+    frame = new_post_message({
+        "post_id": "p1", "content": "x" * 150, "source": "reddit",
+        "sentiment": "negative", "confidence": 0.91, "emotion": None
+    })
+    assert frame["type"] == "new_post"
+    assert len(frame["data"]["content"]) == 100
+    assert frame["data"]["sentiment_label"] == "negative"
+    assert frame["data"]["emotion"] is None
+
+
+def _event(n, source="reddit", sentiment="negative", confidence=0.9):
+    return new_post_message({
+        "post_id": f"p{n}", "content": "text", "source": source,
+        "sentiment": sentiment, "confidence": confidence, "emotion": "anger"
+    })
+
+
+@pytest.mark.asyncio
+async def test_subscribed_client_gets_filtered_batches():
+    manager = ConnectionManager(queue_size=8, max_batch=2)
+    legacy, filtered = FakeWebSocket(), FakeWebSocket()
+    await manager.connect(legacy)
+    await manager.connect(filtered)
+    manager.handle_client_message(filtered, json.dumps({
+        "type": "subscribe", "filters": {"source": "reddit", "min_confidence": 0.8}
+    }))
+
+    manager.publish_event(_event(1))
+    manager.publish_event(_event(2, source="twitter"))
+    manager.publish_event(_event(3, confidence=0.5))
+    manager.publish_event(_event(4))
+    manager.publish_event(_event(5))
+    manager.flush()
+    await asyncio.sleep(0)
+
+    assert [m["data"]["post_id"] for m in legacy.sent if m["type"] == "new_post"] == ["p1", "p2", "p3", "p4", "p5"]
+    batches = [m for m in filtered.sent if m["type"] == "new_posts"]
+    assert len(batches) == 1
+    assert [e["post_id"] for e in batches[0]["data"]] == ["p4", "p5"]
+    assert batches[0]["dropped"] == 1
+    assert not any(m["type"] == "new_post" for m in filtered.sent)
+    manager.disconnect(legacy)
+    manager.disconnect(filtered)
+
+
+@pytest.mark.asyncio
+async def test_delta_metrics_only_send_changed_counters():
+    manager = ConnectionManager(queue_size=8)
+    ws = FakeWebSocket()
+    await manager.connect(ws)
+    manager.handle_client_message(ws, json.dumps({"type": "subscribe", "metrics": "delta"}))
+
+    first = {"last_minute": {"positive": 1, "total": 1}, "last_hour": {"positive": 5, "total": 5}}
+    second = {"last_minute": {"positive": 2, "total": 2}, "last_hour": {"positive": 5, "total": 5}}
+    await manager.broadcast_metrics(first)
+    await manager.broadcast_metrics(second)
+    await manager.broadcast_metrics(second)
+    await asyncio.sleep(0)
+
+    updates = [m for m in ws.sent if m["type"] == "metrics_update"]
+    assert len(updates) == 2
+    assert updates[0]["delta"] is False and updates[0]["data"] == first
+    assert updates[1]["delta"] is True
+    assert updates[1]["data"] == {"last_minute": {"positive": 2, "total": 2}}
+    manager.disconnect(ws)
+
+
+def event_log(count):
+    """The worker's event log stream with `count` events."""
+    redis = FakeRedis()
+    redis.streams["events:log"] = [
+        (f"1000-{n}", {"event": json.dumps({"post_id": f"p{n}", "content": "t", "sentiment": "neutral"})})
+        for n in range(count)
+    ]
+    return redis
+
+
+@pytest.mark.asyncio
+async def test_resume_replays_gap_then_live_without_duplicates():
+    log = event_log(5)
+    manager = ConnectionManager(queue_size=16)
+    ws = FakeWebSocket()
+    await manager.connect(ws)
+
+    # A live event that is also in the replayed range arrives mid-replay
+    original = log.xrange
+    async def xrange_with_live_event(*args, **kwargs):
+        log.xrange = original
+        manager.publish_event(new_post_message({"post_id": "p4", "content": "t", "sentiment": "neutral"}, "1000-4"))
+        manager.publish_event(new_post_message({"post_id": "p5", "content": "t", "sentiment": "neutral"}, "1000-5"))
+        return await original(*args, **kwargs)
+    log.xrange = xrange_with_live_event
+
+    await manager.resume(ws, log, "events:log", "1000-2")
+    await asyncio.sleep(0)
+
+    replay = next(m for m in ws.sent if m["type"] == "replay")
+    assert [e["event_id"] for e in replay["data"]] == ["1000-3", "1000-4"]
+    live = [m["data"]["event_id"] for m in ws.sent if m["type"] == "new_post"]
+    assert live == ["1000-5"]
+    manager.disconnect(ws)
+
+
+@pytest.mark.asyncio
+async def test_resume_sends_snapshot_when_gap_too_large():
+    log = event_log(10)
+    manager = ConnectionManager(queue_size=16, replay_limit=3)
+    ws = FakeWebSocket()
+    await manager.connect(ws)
+
+    await manager.resume(ws, log, "events:log", "1000-1")
+    await asyncio.sleep(0)
+
+    snapshot = next(m for m in ws.sent if m["type"] == "snapshot")
+    assert snapshot["event_id"] == "1000-9"
+    assert snapshot["data"]["recent"][0]["post_id"] == "p9"
+    assert not any(m["type"] == "replay" for m in ws.sent)
+    manager.disconnect(ws)
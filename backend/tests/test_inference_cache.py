@@ -0,0 +1,39 @@
+import pytest
+from services.inference_cache import InferenceCache
+from fakes import FakeRedis
+
+
+@pytest.mark.asyncio
+async def test_lru_hits_and_normalised_keys():
+    cache = InferenceCache(max_size=2)
+    await cache.set_many("m", ["I love it!"], [{"sentiment_label": "positive"}])
+
+    hits = await cache.get_many("m", ["  I love   it! ", "something else"])
+    assert hits[0] == {"sentiment_label": "positive"}
+    assert hits[1] is None
+    # Different model, different key
+    assert (await cache.get_many("other", ["I love it!"]))[0] is None
+    assert cache.counters["local_hits"] == 1
+    assert cache.counters["misses"] == 2
+
+
+@pytest.mark.asyncio
+async def test_lru_is_bounded():
+    cache = InferenceCache(max_size=2)
+    await cache.set_many("m", ["a", "b", "c"], [{"v": 1}, {"v": 2}, {"v": 3}])
+    assert cache.stats()["size"] == 2
+    assert (await cache.get_many("m", ["a"]))[0] is None
+
+
+@pytest.mark.asyncio
+async def test_redis_tier_is_shared_between_instances():
+    redis = FakeRedis()
+    first = InferenceCache(redis_client=redis)
+    second = InferenceCache(redis_client=redis)
+    await first.set_many("m", ["copypasta"], [{"emotion": "joy"}])
+
+    assert (await second.get_many("m", ["copypasta"]))[0] == {"emotion": "joy"}
+    assert second.counters["redis_hits"] == 1
+    # Promoted into the local tier
+    await second.get_many("m", ["copypasta"])
+    assert second.counters["local_hits"] == 1
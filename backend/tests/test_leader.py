@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+from services.leader import LeaderElection
+from fakes import FakeRedis
+
+
+class LeaseRedis(FakeRedis):
+    """The two compare-and-* lease scripts, on top of SET NX PX."""
+    def register_script(self, script):
+        async def run(keys, args):
+            self._check()
+            if self.data.get(keys[0]) != args[0]:
+                return 0
+            if "DEL" in script:
+                del self.data[keys[0]]
+            return 1
+        return run
+
+
+def election(redis, name, started, clock):
+    async def job():
+        started.append(name)
+        await asyncio.Event().wait()
+    return LeaderElection(redis, [job], key="leader", ttl=3, instance_id=name, clock=clock)
+
+
+@pytest.mark.asyncio
+async def test_one_leader_and_failover():
+    redis, started, now = LeaseRedis(), [], [0.0]
+    a = election(redis, "a", started, lambda: now[0])
+    b = election(redis, "b", started, lambda: now[0])
+
+    await a.step()
+    await b.step()
+    await asyncio.sleep(0)
+    assert a.is_leader and not b.is_leader
+    assert started == ["a"]
+
+    # a's lease expired (say it stalled): b takes over, a stops its jobs on the next renewal
+    del redis.data["leader"]
+    await b.step()
+    await a.step()
+    await asyncio.sleep(0)
+    assert b.is_leader and not a.is_leader
+    assert started == ["a", "b"]
+    b._stop_jobs()
+
+
+@pytest.mark.asyncio
+async def test_leader_steps_down_when_redis_is_unreachable_for_a_ttl():
+    redis, started, now = LeaseRedis(), [], [0.0]
+    a = election(redis, "a", started, lambda: now[0])
+    await a.step()
+    redis.down = True
+
+    now[0] = 1.0
+    await a.step()
+    assert a.is_leader
+    now[0] = 2.5
+    await a.step()
+    assert not a.is_leader
+
+
+@pytest.mark.asyncio
+async def test_run_releases_the_lease_on_shutdown():
+    redis, started, now = LeaseRedis(), [], [0.0]
+    a = election(redis, "a", started, lambda: now[0])
+    task = asyncio.create_task(a.run())
+    await asyncio.sleep(0.01)
+    assert redis.data == {"leader": "a"}
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert redis.data == {}
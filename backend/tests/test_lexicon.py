@@ -0,0 +1,35 @@
+import pytest
+from services.lexicon import LexiconScorer
+from services.sentiment_analyzer import SentimentAnalyzer
+from fakes import FakeEngine
+
+
+def test_lexicon_is_confident_on_unambiguous_posts():
+    scorer = LexiconScorer()
+    label, confidence = scorer.score("I absolutely love iPhone 16!")
+    assert label == "positive" and confidence >= 0.8
+
+    label, confidence = scorer.score("Terrible experience with Netflix.")
+    assert label == "negative" and confidence >= 0.8
+
+
+def test_lexicon_defers_on_weak_mixed_or_missing_evidence():
+    scorer = LexiconScorer()
+    assert scorer.score("Received ChatGPT today.") == ("neutral", 0.0)
+    assert scorer.score("It is good")[1] < 0.8
+    assert scorer.score("I love the screen but hate the battery")[1] < 0.8
+    assert scorer.score("not great")[0] == "negative"
+
+
+@pytest.mark.asyncio
+async def test_cascade_only_sends_doubtful_posts_to_the_model():
+    engine = FakeEngine()
+    analyzer = SentimentAnalyzer(model_type='local', engine=engine, cascade=True)
+    analyzer.cascade_min_confidence = 0.8
+
+    results = await analyzer.batch_analyze(["This Tesla Model 3 is amazing!", "Just tried Netflix.", ""])
+    assert results[0]["model_name"] == "lexicon-v1"
+    assert results[1]["model_name"] == "fake-sentiment"
+    assert results[2]["sentiment_label"] == "neutral"
+    assert engine.calls == [("sentiment", ["Just tried Netflix."])]
+    assert analyzer.stage_counts == {"lexicon": 1, "model": 1}
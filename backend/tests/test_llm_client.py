@@ -0,0 +1,69 @@
+import json
+import re
+
+import httpx
+import pytest
+from services.llm_client import LLMClient
+
+
+def stub_server(calls, fail_first=0):
+    """OpenAI-style stub: labels every numbered text 'positive', after `fail_first` 429s."""
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        if len(calls) <= fail_first:
+            return httpx.Response(429, headers={"Retry-After": "0"})
+        prompt = json.loads(request.content)["messages"][0]["content"]
+        ids = [int(i) for i in re.findall(r"^(\d+)\. ", prompt, re.M)]
+        content = json.dumps({"results": [{"id": i, "label": "positive", "confidence": 0.9} for i in ids]})
+        return httpx.Response(200, json={"choices": [{"message": {"content": content}}]})
+    return httpx.MockTransport(handler)
+
+
+@pytest.mark.asyncio
+async def test_packs_texts_into_few_requests():
+    calls = []
+    client = LLMClient(api_key="k", model="stub", batch_size=4, transport=stub_server(calls))
+
+    results = await client.classify("sentiment", [f"text {i}" for i in range(10)])
+
+    assert len(calls) == 3
+    assert len(results) == 10
+    assert all(r == {"sentiment_label": "positive", "confidence_score": 0.9, "model_name": "stub"} for r in results)
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_retries_after_429():
+    calls = []
+    client = LLMClient(api_key="k", model="stub", max_retries=2, transport=stub_server(calls, fail_first=2))
+
+    results = await client.classify("sentiment", ["great day"])
+
+    assert len(calls) == 3
+    assert client.counters["retries"] == 2
+    assert results[0]["sentiment_label"] == "positive"
+
+
+@pytest.mark.asyncio
+async def test_exhausted_retries_fall_back_per_task():
+    calls = []
+    client = LLMClient(api_key="k", model="stub", max_retries=1, transport=stub_server(calls, fail_first=5))
+
+    results = await client.classify("emotion", ["a", "b"])
+
+    assert len(calls) == 2
+    assert results == [{"emotion": "neutral", "confidence_score": 0.0, "model_name": "fallback"}] * 2
+
+
+def test_parse_drops_unknown_labels_and_ids():
+    client = LLMClient(api_key="k", model="stub")
+    content = json.dumps({"results": [
+        {"id": 2, "label": "NEGATIVE", "confidence": 1.7},
+        {"id": 9, "label": "positive"},
+        {"id": 1, "label": "ecstatic"},
+    ]})
+
+    results = client._parse("sentiment", content, 2)
+
+    assert results[0]["model_name"] == "fallback"
+    assert results[1] == {"sentiment_label": "negative", "confidence_score": 1.0, "model_name": "stub"}
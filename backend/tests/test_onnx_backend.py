@@ -0,0 +1,77 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+from services import onnx_backend
+from services.onnx_backend import OnnxTextClassifier
+from services.sentiment_analyzer import SentimentAnalyzer
+
+
+class FakeTokenizer:
+    def __call__(self, texts, **_):
+        return {"input_ids": np.array([[101, len(t), 102] for t in texts]), "attention_mask": np.ones((len(texts), 3))}
+
+
+class FakeSession:
+    """Logits favour label 2 for odd-length texts and label 0 otherwise."""
+    def __init__(self):
+        self.feeds = []
+
+    def run(self, outputs, feed):
+        self.feeds.append(feed)
+        odd = feed["input_ids"][:, 1] % 2
+        return [np.stack([3.0 * (1 - odd), np.zeros(len(odd)), 3.0 * odd], axis=1)]
+
+
+def make_classifier(quantize=True):
+    classifier = OnnxTextClassifier.__new__(OnnxTextClassifier)
+    classifier.model_id = "org/model"
+    classifier.quantize = quantize
+    classifier.max_length = 512
+    classifier.tokenizer = FakeTokenizer()
+    classifier.id2label = {0: "NEGATIVE", 1: "NEUTRAL", 2: "POSITIVE"}
+    classifier.session = FakeSession()
+    classifier.input_names = {"input_ids", "attention_mask"}
+    return classifier
+
+
+def test_classifier_maps_logits_to_pipeline_style_labels():
+    classifier = make_classifier()
+    results = classifier(["odd", "even", "x"], batch_size=2)
+    assert [r["label"] for r in results] == ["POSITIVE", "NEGATIVE", "POSITIVE"]
+    assert all(0.5 < r["score"] < 1.0 for r in results)
+    # Two batches, fed only with the graph's inputs, as int64
+    assert len(classifier.session.feeds) == 2
+    assert all(v.dtype == np.int64 for feed in classifier.session.feeds for v in feed.values())
+    assert classifier("odd") == results[:1]
+
+
+@pytest.mark.parametrize("model_type, quantize, expected", [
+    ("local", True, "org/model"),
+    ("onnx", True, "org/model-onnx-int8"),
+    ("onnx", False, "org/model-onnx"),
+])
+def test_backend_model_name_tells_backends_apart(model_type, quantize, expected):
+    analyzer = SentimentAnalyzer.__new__(SentimentAnalyzer)
+    analyzer.model_type = model_type
+    analyzer.onnx_quantize = quantize
+    assert analyzer._backend_model_name("org/model") == expected
+    if model_type == "onnx":
+        assert make_classifier(quantize).name == expected
+
+
+def test_failed_write_leaves_no_partial_model(tmp_path):
+    path = str(tmp_path / "model.onnx")
+
+    def broken(tmp):
+        with open(tmp, "w") as f:
+            f.write("half a model")
+        raise RuntimeError("export failed")
+
+    with pytest.raises(RuntimeError):
+        onnx_backend._write_atomically(path, broken)
+    assert os.listdir(tmp_path) == []
+
+    onnx_backend._write_atomically(path, lambda tmp: Path(tmp).write_text("model"))
+    assert os.listdir(tmp_path) == ["model.onnx"]
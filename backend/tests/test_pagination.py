@@ -0,0 +1,31 @@
+from datetime import datetime
+
+import pytest
+from services.pagination import encode_cursor, decode_cursor, InvalidCursor
+
+
+def test_cursor_round_trip_is_opaque_and_url_safe():
+    created_at = datetime(2024, 5, 1, 12, 30, 15, 250000)
+    cursor = encode_cursor(created_at, 42, 7)
+    assert all(c.isalnum() or c in "-_" for c in cursor)
+    assert decode_cursor(cursor) == (created_at, 42, 7)
+
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", encode_cursor(datetime(2024, 1, 1), 1, 1)[:-3]])
+def test_bad_cursor_is_rejected(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
+
+
+def test_keyset_seeks_on_the_post_index_columns():
+    from sqlalchemy.dialects import postgresql
+    from models import SocialMediaPost, SentimentAnalysis
+    from services.pagination import keyset_after
+
+    clause = keyset_after(SocialMediaPost.created_at, SocialMediaPost.id, SentimentAnalysis.id,
+                          (datetime(2024, 5, 1, 12), 42, 7))
+    sql = str(clause.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+    # The range condition covers exactly the columns of idx_created_at_id ...
+    assert "(social_media_posts.created_at, social_media_posts.id) <= ('2024-05-01 12:00:00', 42)" in sql
+    # ... and the analysis id is only a tie-break inside the boundary post
+    assert "(social_media_posts.created_at, social_media_posts.id) < ('2024-05-01 12:00:00', 42) OR sentiment_analysis.id < 7" in sql
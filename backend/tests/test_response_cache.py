@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+from services.response_cache import ResponseCache, data_version_key
+from fakes import FakeClock, FakeRedis
+
+
+def counting_compute(calls, delay=0.01):
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return {"n": len(calls)}
+    return compute
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_compute_once():
+    cache = ResponseCache(FakeRedis(), ttl=30, stale_ttl=600, min_age=1, clock=FakeClock(1000.0))
+    calls = []
+    compute = counting_compute(calls)
+    results = await asyncio.gather(*[cache.get("dist", {"hours": 24}, compute) for _ in range(5)])
+    assert calls == [1]
+    assert all(value == {"n": 1} and not cached for value, cached in results)
+    assert await cache.get("dist", {"hours": 24}, compute) == ({"n": 1}, True)
+
+
+@pytest.mark.asyncio
+async def test_version_bump_serves_stale_while_revalidating():
+    redis, clock = FakeRedis(), FakeClock(1000.0)
+    cache = ResponseCache(redis, ttl=30, stale_ttl=600, min_age=1, clock=clock)
+    calls = []
+    compute = counting_compute(calls)
+    await cache.get("posts", {"limit": 10}, compute, source="reddit")
+
+    # A write to another source leaves reddit's entry fresh
+    await redis.incr(data_version_key("twitter"))
+    clock.now += 5
+    assert await cache.get("posts", {"limit": 10}, compute, source="reddit") == ({"n": 1}, True)
+
+    await redis.incr(data_version_key("reddit"))
+    stale = await asyncio.gather(*[cache.get("posts", {"limit": 10}, compute, source="reddit") for _ in range(3)])
+    assert stale == [({"n": 1}, True)] * 3
+    await asyncio.sleep(0.05)
+    assert calls == [1, 1]
+    assert await cache.get("posts", {"limit": 10}, compute, source="reddit") == ({"n": 2}, True)
+
+
+@pytest.mark.asyncio
+async def test_recent_entry_absorbs_write_bursts():
+    redis, clock = FakeRedis(), FakeClock(1000.0)
+    cache = ResponseCache(redis, ttl=30, stale_ttl=600, min_age=2, clock=clock)
+    calls = []
+    compute = counting_compute(calls)
+    await cache.get("aggregate", {"period": "hour"}, compute)
+    for _ in range(3):
+        await redis.incr(data_version_key())
+        await cache.get("aggregate", {"period": "hour"}, compute)
+    assert calls == [1]
@@ -0,0 +1,56 @@
+import asyncio
+from datetime import datetime
+
+from services.rollups import truncate, rollup_rows, bucket_range, read_rollups
+
+
+def test_truncate_matches_date_trunc():
+    ts = datetime(2024, 5, 1, 13, 47, 21, 500)
+    assert truncate(ts, "minute") == datetime(2024, 5, 1, 13, 47)
+    assert truncate(ts, "hour") == datetime(2024, 5, 1, 13)
+    assert truncate(ts, "day") == datetime(2024, 5, 1)
+
+
+def test_rollup_rows_sum_per_bucket_source_and_label():
+    rows = rollup_rows([
+        (datetime(2024, 5, 1, 13, 1, 5), "reddit", "positive", 0.9),
+        (datetime(2024, 5, 1, 13, 1, 50), "reddit", "positive", 0.7),
+        (datetime(2024, 5, 1, 13, 2, 0), "reddit", "negative", 0.8),
+    ])
+    assert [(r["bucket"].minute, r["sentiment_label"], r["post_count"]) for r in rows["minute"]] == [
+        (1, "positive", 2), (2, "negative", 1)
+    ]
+    assert rows["hour"][0]["post_count"] == 1 and rows["hour"][1]["post_count"] == 2
+    assert abs(rows["day"][1]["confidence_sum"] - 1.6) < 1e-9
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+
+class FakeSession:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def execute(self, query):
+        return FakeResult(self.rows)
+
+
+def test_read_rollups_fills_empty_buckets():
+    session = FakeSession([
+        (datetime(2024, 5, 1, 10), "positive", 3, 2.7),
+        (datetime(2024, 5, 1, 10), "negative", 1, 0.5),
+        (datetime(2024, 5, 1, 12), "neutral", 2, 1.0),
+    ])
+    series = asyncio.run(read_rollups(session, "hour", datetime(2024, 5, 1, 10, 30), datetime(2024, 5, 1, 13, 5)))
+
+    assert [s["timestamp"] for s in series] == [b.isoformat() for b in bucket_range(
+        datetime(2024, 5, 1, 10), datetime(2024, 5, 1, 13), "hour")]
+    assert [s["total_count"] for s in series] == [4, 0, 2, 0]
+    assert series[0]["positive_percentage"] == 75.0
+    assert series[0]["average_confidence"] == 0.8
+    assert series[1]["average_confidence"] == 0.0
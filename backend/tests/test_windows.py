@@ -0,0 +1,45 @@
+from services.windows import SlidingWindowCounters
+from fakes import FakeClock
+
+
+def test_events_leave_each_window_on_time():
+    clock = FakeClock()
+    counters = SlidingWindowCounters({"last_minute": 60, "last_hour": 3600}, second_buckets=300, clock=clock)
+    counters.add("reddit", "positive")
+    counters.add("twitter", "NEGATIVE")
+    clock.now += 30
+    counters.add("reddit", "negative")
+
+    assert counters.counts("last_minute") == {"positive": 1, "negative": 2, "neutral": 0, "total": 3}
+    assert counters.counts("last_minute", source="reddit")["total"] == 2
+
+    clock.now += 31
+    assert counters.counts("last_minute") == {"positive": 0, "negative": 1, "neutral": 0, "total": 1}
+    assert counters.counts("last_hour")["total"] == 3
+
+    clock.now += 3600
+    assert counters.counts("last_hour")["total"] == 0
+    assert counters.counts("last_minute")["total"] == 0
+
+
+def test_late_and_future_events():
+    clock = FakeClock()
+    counters = SlidingWindowCounters({"alert": 300}, clock=clock)
+    counters.add("reddit", "negative")
+    # Out of order but still inside the window, and one from far outside it
+    counters.add("reddit", "negative", ts=clock.now - 120)
+    counters.add("reddit", "negative", ts=clock.now - 900)
+    # Clock skew: a post from the future counts as now
+    counters.add("reddit", "positive", ts=clock.now + 50)
+    assert counters.counts("alert") == {"positive": 1, "negative": 2, "neutral": 0, "total": 3}
+
+    clock.now += 200
+    assert counters.counts("alert")["negative"] == 1
+
+
+def test_record_event_uses_post_timestamp():
+    clock = FakeClock(now=86400 * 365 * 54.0)
+    counters = SlidingWindowCounters({"last_minute": 60}, clock=clock)
+    counters.record_event({"source": "reddit", "sentiment": "neutral", "created_at": "2000-01-01T00:00:00Z"})
+    counters.record_event({"source": "reddit", "sentiment": "neutral"})
+    assert counters.counts("last_minute")["neutral"] == 1
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { apiService } from '../services/api';
 import DistributionChart from './DistributionChart';
 import SentimentChart from './SentimentChart';
@@ -9,9 +9,61 @@ const Dashboard = () => {
   const [trendData, setTrendData] = useState([]);
   const [recentPosts, setRecentPosts] = useState([]);
   const [connectionStatus, setConnectionStatus] = useState('connecting');
+  // Id of the newest live event seen, sent on reconnect so the server replays the gap
+  const lastEventId = useRef(null);
 
   useEffect(() => {
     let socket;
+    let reconnectTimer;
+    let closed = false;
+
+    const addPosts = (posts) => {
+      setRecentPosts(prev => [...posts, ...prev].slice(0, 10));
+      setMetrics(prev => {
+        const next = { ...prev, total: prev.total + posts.length };
+        posts.forEach(p => { next[p.sentiment_label] = (next[p.sentiment_label] || 0) + 1; });
+        return next;
+      });
+    };
+
+    const handleMessage = (message) => {
+      if (message.type === 'connected') setConnectionStatus('connected');
+      // Single events from the unfiltered feed
+      if (message.type === 'new_post') {
+        if (message.data.event_id) lastEventId.current = message.data.event_id;
+        addPosts([message.data]);
+      }
+      // One batched frame per server tick, and missed events after a reconnect; newest last
+      if (message.type === 'new_posts' || message.type === 'replay') {
+        if (message.data.length) lastEventId.current = message.data[message.data.length - 1].event_id;
+        addPosts([...message.data].reverse());
+      }
+      // Gap too large to replay: latest posts (newest first) and metrics
+      if (message.type === 'snapshot') {
+        if (message.event_id) lastEventId.current = message.event_id;
+        setRecentPosts(message.data.recent);
+        if (message.data.metrics) setMetrics(prev => ({ ...prev, ...message.data.metrics.last_24_hours }));
+      }
+      // Delta updates only carry the counters that changed
+      if (message.type === 'metrics_update' && message.data.last_24_hours) {
+        setMetrics(prev => ({ ...prev, ...message.data.last_24_hours }));
+      }
+    };
+
+    const connect = () => {
+      socket = apiService.connectWebSocket(
+        handleMessage,
+        () => setConnectionStatus('disconnected'),
+        () => {
+          setConnectionStatus('disconnected');
+          // Resume from the last event instead of re-fetching everything
+          if (!closed) reconnectTimer = setTimeout(connect, 2000);
+        },
+        { filters: {}, metrics: 'delta' },
+        lastEventId.current
+      );
+    };
+
     const loadInitialData = async () => {
       try {
         const dist = await apiService.fetchDistribution(24);
@@ -35,28 +87,16 @@ const Dashboard = () => {
         setRecentPosts(posts.posts);
 
         // Small delay for WebSocket prevents race condition error
-        setTimeout(() => {
-          socket = apiService.connectWebSocket(
-            (message) => {
-              if (message.type === 'connected') setConnectionStatus('connected');
-              if (message.type === 'new_post') {
-                setRecentPosts(prev => [message.data, ...prev].slice(0, 10));
-                setMetrics(prev => ({
-                  ...prev,
-                  total: prev.total + 1,
-                  [message.data.sentiment_label]: (prev[message.data.sentiment_label] || 0) + 1
-                }));
-              }
-            },
-            () => setConnectionStatus('disconnected'),
-            () => setConnectionStatus('disconnected')
-          );
-        }, 500);
+        reconnectTimer = setTimeout(connect, 500);
       } catch (err) { console.error("Initial fetch failed", err); }
     };
 
     loadInitialData();
-    return () => { if (socket) socket.close(); };
+    return () => {
+      closed = true;
+      clearTimeout(reconnectTimer);
+      if (socket) socket.close();
+    };
   }, []);
 
   return (
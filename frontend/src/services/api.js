@@ -10,7 +10,14 @@ export const apiService = {
     fetchPosts: async (limit = 50, offset = 0, filters = {}) => {
         const params = new URLSearchParams({ limit, offset, ...filters });
         const response = await axios.get(`${API_BASE_URL}/posts?${params}`);
-        return response.data; // Expected structure: { posts: [], total: N }
+        return response.data; // Expected structure: { posts: [], total: N, next_cursor }
+    },
+
+    // Next page after a previous response's next_cursor (constant time at any depth)
+    fetchPostsAfter: async (cursor, limit = 50, filters = {}) => {
+        const params = new URLSearchParams({ limit, cursor, ...filters });
+        const response = await axios.get(`${API_BASE_URL}/posts?${params}`);
+        return response.data;
     },
 
     // 2. Get sentiment distribution (Pie Chart data)
@@ -26,9 +33,17 @@ export const apiService = {
     },
 
     // 4. Create WebSocket connection with callbacks
-    connectWebSocket: (onMessage, onError, onClose) => {
-        const socket = new WebSocket(WS_BASE_URL);
-        
+    // With a subscription the server filters events and batches them into
+    // one `new_posts` frame per tick; metrics: 'delta' only sends changed counters
+    // lastEventId resumes a dropped connection: the server replays what was missed
+    connectWebSocket: (onMessage, onError, onClose, subscription = null, lastEventId = null) => {
+        const url = lastEventId ? `${WS_BASE_URL}?last_event_id=${encodeURIComponent(lastEventId)}` : WS_BASE_URL;
+        const socket = new WebSocket(url);
+
+        if (subscription) {
+            socket.onopen = () => socket.send(JSON.stringify({ type: 'subscribe', ...subscription }));
+        }
+
         socket.onmessage = (event) => {
             const data = JSON.parse(event.data);
             onMessage(data);
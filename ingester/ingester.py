@@ -8,6 +8,7 @@ import redis.asyncio as redis
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from models import SocialMediaPost
+from sharding import StreamRouter
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -19,10 +20,15 @@ engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(bind=engine)
 
 class DataIngester:
-    def __init__(self, redis_client, stream_name: str, posts_per_minute: int = 60):
+    def __init__(self, redis_client, stream_name: str, posts_per_minute: int = 60, max_lag: int = None):
         self.redis = redis_client
         self.stream_name = stream_name
+        # Same STREAM_SHARD_MODE settings as the worker
+        self.router = StreamRouter(stream_name)
         self.sleep_interval = 60.0 / posts_per_minute
+        # Slow down once the workers report more undelivered posts than this (0 = never)
+        self.max_lag = max_lag if max_lag is not None else int(os.getenv("INGEST_MAX_LAG", 1000))
+        self.lag_key = f"sentistream:lag:{stream_name}"
         self.platforms = ["twitter", "reddit", "mastodon", "facebook"]
         self.products = ["iPhone 16", "Tesla Model 3", "ChatGPT", "Netflix", "Amazon Prime", "PlayStation 5"]
         self.authors = ["tech_enthusiast", "daily_driver", "critic_pro", "happy_buyer_22", "early_adopter"]
@@ -73,6 +79,19 @@ class DataIngester:
         finally:
             db.close()
 
+    async def throttle_factor(self) -> float:
+        """How much to stretch the publish interval, from the workers' lag report."""
+        if not self.max_lag:
+            return 1.0
+        try:
+            lag = int(await self.redis.hget(self.lag_key, "lag") or 0)
+        except Exception:
+            return 1.0
+        if lag <= self.max_lag:
+            return 1.0
+        # Proportional to the overshoot, capped so the feed never stops completely
+        return min(lag / self.max_lag, 10.0)
+
     async def start(self):
         logger.info("🚀 Ingester started. Saving to DB and publishing to Redis...")
         while True:
@@ -84,12 +103,15 @@ class DataIngester:
             if db_success:
                 # 2. Publish to Redis Stream
                 try:
-                    await self.redis.xadd(self.stream_name, post, id='*')
+                    await self.redis.xadd(self.router.stream_for(post), post, id='*')
                     logger.info(f"✅ Success: {post['post_id']}")
                 except Exception as e:
                     logger.error(f"Redis Error: {e}")
 
-            await asyncio.sleep(self.sleep_interval)
+            factor = await self.throttle_factor()
+            if factor > 1.0:
+                logger.warning(f"⏳ Workers are lagging, slowing down x{factor:.1f}")
+            await asyncio.sleep(self.sleep_interval * factor)
 
 async def main():
     client = redis.Redis(host=os.getenv("REDIS_HOST", "redis"), decode_responses=True)
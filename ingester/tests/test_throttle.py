@@ -0,0 +1,29 @@
+import pytest
+
+# ingester.py builds its (sync) engine on import
+pytest.importorskip("psycopg2")
+from ingester import DataIngester
+
+
+class FakeRedis:
+    def __init__(self, lag=None, down=False):
+        self.hashes = {"sentistream:lag:posts": {"lag": lag}} if lag is not None else {}
+        self.down = down
+
+    async def hget(self, key, field):
+        if self.down:
+            raise ConnectionError("redis down")
+        return self.hashes.get(key, {}).get(field)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("lag, factor", [(None, 1.0), (500, 1.0), (1000, 1.0), (2500, 2.5), (50000, 10.0)])
+async def test_publishing_slows_down_in_proportion_to_the_lag(lag, factor):
+    ingester = DataIngester(FakeRedis(lag), "posts", max_lag=1000)
+    assert await ingester.throttle_factor() == factor
+
+
+@pytest.mark.asyncio
+async def test_no_throttling_when_disabled_or_without_a_report():
+    assert await DataIngester(FakeRedis(50000), "posts", max_lag=0).throttle_factor() == 1.0
+    assert await DataIngester(FakeRedis(down=True), "posts", max_lag=1000).throttle_factor() == 1.0
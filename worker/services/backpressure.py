@@ -0,0 +1,118 @@
+import os
+import time
+import logging
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Hash holding the latest lag report for a stream, read by the ingester and /api/health
+LAG_KEY_PREFIX = "sentistream:lag:"
+
+
+def lag_key(stream_name: str) -> str:
+    return f"{LAG_KEY_PREFIX}{stream_name}"
+
+
+class AdaptiveBatchController:
+    """
+    Sizes the worker's micro-batches from the consumer group's backlog.
+
+    Every `check_interval` seconds it reads the group's lag (entries not yet
+    delivered, from XINFO GROUPS) and pending count (delivered but not
+    acked, from XPENDING), summed over the shard streams. Under backlog the batch size and flush interval
+    double towards their maximums so each model call and DB transaction
+    carries more messages; once the group has caught up they halve back
+    towards their minimums so a trickle is processed almost immediately.
+    The measurement is published to a Redis hash so producers and
+    operators can throttle on it.
+    """
+    def __init__(self, redis_client, stream_name: str, group_name: str,
+                 min_batch: int = None, max_batch: int = None,
+                 min_latency_ms: int = None, max_latency_ms: int = None,
+                 check_interval: float = None, report_ttl: int = 60,
+                 batch_size: int = None, latency_ms: int = None, streams: List[str] = None):
+        self.redis = redis_client
+        # Reports are keyed by the base stream name, the lag covers every shard
+        self.stream_name = stream_name
+        self.streams = streams or [stream_name]
+        self.group_name = group_name
+        self.min_batch = min_batch or int(os.getenv("WORKER_MIN_BATCH_SIZE", 8))
+        self.max_batch = max_batch or int(os.getenv("WORKER_MAX_BATCH_SIZE", 256))
+        self.min_latency_ms = min_latency_ms or int(os.getenv("WORKER_MIN_LATENCY_MS", 20))
+        self.max_latency_ms = max_latency_ms or int(os.getenv("WORKER_MAX_FLUSH_MS", 1000))
+        self.check_interval = check_interval if check_interval is not None else float(os.getenv("WORKER_LAG_CHECK_INTERVAL", 1.0))
+        # Reports expire so a dead worker does not keep producers throttled
+        self.report_ttl = report_ttl
+
+        # Starting point, clamped to the bounds; measurements move it from there
+        self.batch_size = max(self.min_batch, min(self.max_batch, batch_size or self.min_batch))
+        self.latency_ms = max(self.min_latency_ms, min(self.max_latency_ms, latency_ms or self.min_latency_ms))
+        self.lag: Optional[int] = None
+        self.pending: Optional[int] = None
+        self._last_check = 0.0
+
+    async def refresh(self, consumer_name: str = None) -> bool:
+        """Measure and adapt if `check_interval` has passed; returns whether it did."""
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return False
+        self._last_check = now
+
+        try:
+            self.lag, self.pending = await self.measure()
+        except Exception as e:
+            logger.warning(f"Lag check failed: {e}")
+            return False
+        self.adapt(self.lag)
+        await self.publish(consumer_name)
+        return True
+
+    async def measure(self):
+        """(lag, pending) for the consumer group, over all streams."""
+        total_lag, total_pending = 0, 0
+        for stream in self.streams:
+            lag = None
+            for group in await self.redis.xinfo_groups(stream):
+                if group.get("name") == self.group_name:
+                    lag = group.get("lag")
+                    break
+            if lag is None:
+                # Redis < 7 (or a trimmed stream) does not report lag; the
+                # stream length is an upper bound
+                lag = await self.redis.xlen(stream)
+
+            summary = await self.redis.xpending(stream, self.group_name)
+            total_lag += int(lag)
+            total_pending += int(summary.get("pending", 0) if summary else 0)
+        return total_lag, total_pending
+
+    def adapt(self, lag: int):
+        """Multiplicative increase under backlog, multiplicative decrease when caught up."""
+        if lag >= 2 * self.batch_size:
+            self.batch_size = min(self.max_batch, self.batch_size * 2)
+            self.latency_ms = min(self.max_latency_ms, self.latency_ms * 2)
+        elif lag <= self.batch_size // 4:
+            self.batch_size = max(self.min_batch, self.batch_size // 2)
+            self.latency_ms = max(self.min_latency_ms, self.latency_ms // 2)
+
+    async def publish(self, consumer_name: str = None):
+        key = lag_key(self.stream_name)
+        report = self.stats()
+        report["updated_at"] = time.time()
+        if consumer_name:
+            report["reported_by"] = consumer_name
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.hset(key, mapping=report)
+            pipe.expire(key, self.report_ttl)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Could not publish lag report: {e}")
+
+    def stats(self) -> Dict:
+        return {
+            "lag": self.lag if self.lag is not None else -1,
+            "pending": self.pending if self.pending is not None else -1,
+            "batch_size": self.batch_size,
+            "max_latency_ms": self.latency_ms,
+        }
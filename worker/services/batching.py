@@ -0,0 +1,78 @@
+import os
+import inspect
+from typing import List, Dict
+
+import numpy as np
+
+
+class TokenBudgetBatcher:
+    """
+    Length-bucketed dynamic batching for a text classifier (a HuggingFace
+    pipeline or an OnnxTextClassifier).
+
+    Texts are tokenised once and truncated to the model's max tokens, sorted
+    by token length and cut into batches whose padded size
+    (longest member x batch size) stays under a token budget. Short tweets
+    and long Reddit posts then stop paying for each other's padding.
+    Results come back in the original order.
+    """
+    def __init__(self, classifier, max_tokens: int = None, token_budget: int = None):
+        self.classifier = classifier
+        self.tokenizer = classifier.tokenizer
+        # model_max_length is a huge sentinel for some tokenizers
+        self.max_tokens = max_tokens or min(int(self.tokenizer.model_max_length), 512)
+        self.token_budget = token_budget or int(os.getenv("BATCH_TOKEN_BUDGET", 8192))
+
+        if hasattr(classifier, "logits"):
+            # OnnxTextClassifier takes numpy features directly
+            self.id2label = classifier.id2label
+            self.tensor_type = "np"
+            self._forward = classifier.logits
+        else:
+            model = classifier.model
+            self.id2label = model.config.id2label
+            self.tensor_type = "pt"
+            self._accepted = set(inspect.signature(model.forward).parameters)
+            self._forward = self._torch_forward
+
+    def _torch_forward(self, features) -> np.ndarray:
+        import torch
+        inputs = {k: v for k, v in features.items() if k in self._accepted}
+        with torch.inference_mode():
+            return self.classifier.model(**inputs).logits.float().numpy()
+
+    def plan(self, lengths: List[int]) -> List[List[int]]:
+        """Group indices into batches, shortest first, under the padded-token budget."""
+        batches, current, current_max = [], [], 0
+        for i in sorted(range(len(lengths)), key=lambda i: lengths[i]):
+            longest = max(current_max, lengths[i])
+            if current and longest * (len(current) + 1) > self.token_budget:
+                batches.append(current)
+                current, longest = [], lengths[i]
+            current.append(i)
+            current_max = longest
+        if current:
+            batches.append(current)
+        return batches
+
+    def __call__(self, texts: List[str]) -> List[Dict]:
+        if not texts:
+            return []
+
+        # Tokenise once, truncating by tokens instead of characters
+        encoded = self.tokenizer(list(texts), truncation=True, max_length=self.max_tokens)
+        keys = list(encoded.keys())
+        lengths = [len(ids) for ids in encoded["input_ids"]]
+
+        results = [None] * len(texts)
+        for batch in self.plan(lengths):
+            features = self.tokenizer.pad(
+                {k: [encoded[k][i] for i in batch] for k in keys}, return_tensors=self.tensor_type
+            )
+            logits = self._forward(features)
+            exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+            probs = exp / exp.sum(axis=-1, keepdims=True)
+            for i, row in zip(batch, probs):
+                idx = int(row.argmax())
+                results[i] = {"label": self.id2label[idx], "score": float(row[idx])}
+        return results
@@ -0,0 +1,67 @@
+import os
+import logging
+from typing import List
+
+from redis.exceptions import NoScriptError
+
+logger = logging.getLogger(__name__)
+
+# XADD the event to the capped log and PUBLISH it with the new entry id
+# spliced in, atomically, so every live event carries the id clients
+# resume from. ARGV[2] is a compact JSON object ('{...}').
+APPEND_SCRIPT = """
+local id = redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[1], '*', 'event', ARGV[2])
+redis.call('PUBLISH', ARGV[3], '{"event_id":"' .. id .. '",' .. string.sub(ARGV[2], 2))
+return id
+"""
+
+
+class EventLog:
+    """
+    Capped Redis stream that keeps the most recent live-feed events.
+
+    Pub/sub has no history, so the API replays this stream to dashboards
+    that reconnect with the id of the last event they saw. Set
+    EVENT_LOG_MAXLEN=0 to only publish.
+
+    The append script is loaded once (load()) and queued as EVALSHA on the
+    caller's pipeline, so appending adds no round trip of its own. If Redis
+    lost the script (restart, SCRIPT FLUSH), recover() reloads it and
+    re-sends the events that failed.
+    """
+    def __init__(self, redis_client, channel: str, stream: str = None, maxlen: int = None):
+        self.redis = redis_client
+        self.channel = channel
+        self.stream = stream or os.getenv("SENTIMENT_EVENTS_STREAM", f"{channel}:log")
+        self.maxlen = maxlen if maxlen is not None else int(os.getenv("EVENT_LOG_MAXLEN", 10000))
+        self.sha = None
+
+    async def load(self):
+        if self.maxlen > 0:
+            self.sha = await self.redis.script_load(APPEND_SCRIPT)
+
+    def append(self, pipe, payload: str):
+        """Queue one event on `pipe`, logged and published when the pipe executes."""
+        if self.maxlen <= 0:
+            pipe.publish(self.channel, payload)
+        elif self.sha is None:
+            # Not loaded yet: send the whole script, still within the pipe
+            pipe.eval(APPEND_SCRIPT, 1, self.stream, self.maxlen, payload, self.channel)
+        else:
+            pipe.evalsha(self.sha, 1, self.stream, self.maxlen, payload, self.channel)
+
+    async def recover(self, results: List, payloads: List[str]) -> List:
+        """
+        Given the pipe results of the appends (raise_on_error=False) and
+        their payloads, reload the script and append again the events that
+        failed with NOSCRIPT. Returns the remaining errors.
+        """
+        missing = [p for p, r in zip(payloads, results) if isinstance(r, NoScriptError)]
+        if missing:
+            logger.warning(f"Event log script missing, reloading it for {len(missing)} events")
+            await self.load()
+            pipe = self.redis.pipeline(transaction=False)
+            for payload in missing:
+                self.append(pipe, payload)
+            results = [r for r in results if not isinstance(r, NoScriptError)] + await pipe.execute(raise_on_error=False)
+        return [r for r in results if isinstance(r, Exception)]
@@ -0,0 +1,83 @@
+import os
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict
+
+logger = logging.getLogger(__name__)
+
+# One analyzer per replica process, created by _init_replica
+_replica_analyzer = None
+
+
+def _init_replica(torch_threads: int, model_type: str):
+    """Runs once in every pool process: pin the thread budget, then load the models."""
+    global _replica_analyzer
+    import torch
+    torch.set_num_threads(torch_threads)
+    torch.set_num_interop_threads(1)
+    # Same budget for ONNX Runtime sessions when model_type='onnx'
+    os.environ["ONNX_THREADS"] = str(torch_threads)
+
+    from services.sentiment_analyzer import SentimentAnalyzer
+    _replica_analyzer = SentimentAnalyzer(model_type=model_type)
+    logger.info(f"Inference replica {os.getpid()} ready with {torch_threads} torch threads")
+
+
+def _predict(task: str, texts: List[str]) -> List[Dict]:
+    if task == "sentiment":
+        return _replica_analyzer._predict_sentiment(texts)
+    return _replica_analyzer._predict_emotion(texts)
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+class InferenceEngine:
+    """
+    Runs N replicas of the local models in a process pool so inference never
+    blocks the worker's event loop and a single container can use every core.
+    """
+    def __init__(self, replicas: int = None, torch_threads: int = None, min_chunk: int = 8, model_type: str = 'local'):
+        cores = os.cpu_count() or 1
+        self.replicas = replicas or int(os.getenv("INFERENCE_REPLICAS", max(1, cores // 2)))
+        # Split the cores between replicas so they don't oversubscribe each other
+        self.torch_threads = torch_threads or int(os.getenv("INFERENCE_TORCH_THREADS", max(1, cores // self.replicas)))
+        # Smallest slice of a batch worth sending to its own replica
+        self.min_chunk = min_chunk
+
+        # 'spawn' so the replicas don't inherit the parent's event loop or sockets
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.replicas,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_replica,
+            initargs=(self.torch_threads, model_type)
+        )
+        logger.info(f"Inference engine: {self.replicas} replicas x {self.torch_threads} torch threads")
+
+    async def warmup(self):
+        """Start every replica (and load its models) before the first real batch."""
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(self.pool, _ping) for _ in range(self.replicas)])
+
+    async def predict(self, task: str, texts: List[str]) -> List[Dict]:
+        """Batched inference for 'sentiment' or 'emotion', results keep the input order."""
+        if not texts:
+            return []
+
+        # Spread a large batch across replicas, but keep each slice big
+        # enough that batching inside the replica still pays off
+        n_chunks = max(1, min(self.replicas, len(texts) // self.min_chunk))
+        size = -(-len(texts) // n_chunks)
+        chunks = [texts[i:i + size] for i in range(0, len(texts), size)]
+
+        loop = asyncio.get_running_loop()
+        parts = await asyncio.gather(*[
+            loop.run_in_executor(self.pool, _predict, task, chunk) for chunk in chunks
+        ])
+        return [r for part in parts for r in part]
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
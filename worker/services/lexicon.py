@@ -0,0 +1,83 @@
+import re
+from typing import Dict, Tuple
+
+# Word weights tuned for short product/social posts; positive > 0, negative < 0
+LEXICON = {
+    # Positive
+    "love": 3.0, "loved": 3.0, "loving": 2.5, "amazing": 3.0, "awesome": 3.0, "excellent": 3.0,
+    "fantastic": 3.0, "incredible": 3.0, "perfect": 3.0, "wonderful": 3.0, "brilliant": 3.0,
+    "outstanding": 3.0, "superb": 3.0, "best": 2.5, "great": 2.0, "recommend": 2.0,
+    "happy": 2.0, "enjoy": 2.0, "enjoyed": 2.0, "impressed": 2.0, "impressive": 2.0,
+    "beautiful": 2.0, "smooth": 1.5, "fast": 1.0, "good": 1.5, "nice": 1.5, "like": 1.0,
+    "liked": 1.0, "fun": 1.5, "glad": 1.5, "thanks": 1.0, "worth": 1.0,
+    # Negative
+    "hate": -3.0, "hated": -3.0, "terrible": -3.0, "awful": -3.0, "horrible": -3.0,
+    "worst": -3.0, "disgusting": -3.0, "useless": -2.5, "garbage": -2.5, "trash": -2.5,
+    "disappointed": -2.5, "disappointing": -2.5, "broken": -2.0, "bad": -2.0, "poor": -2.0,
+    "sucks": -2.5, "annoying": -2.0, "angry": -2.0, "frustrating": -2.0, "frustrated": -2.0,
+    "slow": -1.0, "buggy": -2.0, "crash": -2.0, "crashes": -2.0, "refund": -1.5,
+    "scam": -3.0, "overpriced": -2.0, "waste": -2.5, "fail": -2.0, "failed": -2.0,
+}
+
+INTENSIFIERS = {
+    "absolutely": 1.5, "extremely": 1.5, "incredibly": 1.5, "highly": 1.4, "totally": 1.3,
+    "very": 1.3, "really": 1.3, "so": 1.2, "super": 1.3, "truly": 1.3,
+}
+
+NEGATIONS = {"not", "no", "never", "dont", "don't", "doesnt", "doesn't", "isnt", "isn't",
+             "wasnt", "wasn't", "cant", "can't", "cannot", "wont", "won't", "hardly", "nothing"}
+
+TOKEN_RE = re.compile(r"[a-z']+")
+
+
+class LexiconScorer:
+    """
+    Fast pure-Python sentiment scorer used as the first stage of the model
+    cascade. It only has to be right when it is confident: mixed, negated
+    or weak evidence yields a low confidence so the transformer decides.
+    """
+    def __init__(self, strength_scale: float = 1.5, negation_window: int = 3):
+        # Raw score at which strength reaches 0.5
+        self.strength_scale = strength_scale
+        self.negation_window = negation_window
+
+    def score(self, text: str) -> Tuple[str, float]:
+        """Returns (label, confidence) with confidence in [0.5, 1.0], or ('neutral', 0.0) without evidence."""
+        tokens = TOKEN_RE.findall(str(text).lower())
+        pos_mass, neg_mass = 0.0, 0.0
+        for i, tok in enumerate(tokens):
+            weight = LEXICON.get(tok)
+            if weight is None:
+                continue
+
+            window = tokens[max(0, i - self.negation_window):i]
+            if i > 0 and tokens[i - 1] in INTENSIFIERS:
+                weight *= INTENSIFIERS[tokens[i - 1]]
+            if any(w in NEGATIONS for w in window):
+                # "not bad" is weakly positive, "not great" weakly negative
+                weight *= -0.5
+
+            # Contrast: the clause after "but" carries the sentiment
+            if "but" in tokens[i + 1:]:
+                weight *= 0.5
+
+            if weight > 0:
+                pos_mass += weight
+            else:
+                neg_mass -= weight
+
+        total = pos_mass + neg_mass
+        if total == 0:
+            return "neutral", 0.0
+
+        exclaim = 1.0 + 0.1 * min(str(text).count("!"), 3)
+        net = (pos_mass - neg_mass) * exclaim
+        # Unanimous evidence -> 1.0, perfectly mixed -> 0.0
+        dominance = abs(pos_mass - neg_mass) / total
+        strength = abs(net) / (abs(net) + self.strength_scale)
+        confidence = 0.5 + 0.5 * dominance * strength
+        return ("positive" if net > 0 else "negative"), round(confidence, 4)
+
+    def analyze(self, text: str) -> Dict:
+        label, confidence = self.score(text)
+        return {"sentiment_label": label, "confidence_score": confidence, "model_name": "lexicon-v1"}
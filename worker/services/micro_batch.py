@@ -0,0 +1,40 @@
+import time
+from typing import List
+
+
+class MicroBatchBuffer:
+    """
+    Messages read across XREADGROUP calls, waiting to be processed as one batch.
+
+    The batch is ready once `batch_size` messages are waiting or the
+    oldest one has waited `max_latency_ms`, so a slow trickle is not held
+    back by a full batch. The deadline is set by the first message added
+    to an empty buffer; wait_ms() tells the next read how long it may
+    block without overshooting it.
+    """
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.messages: List = []
+        self.deadline = 0.0
+
+    def __len__(self):
+        return len(self.messages)
+
+    def add(self, messages: List, max_latency_ms: int):
+        if messages and not self.messages:
+            self.deadline = self.clock() + max_latency_ms / 1000
+        self.messages.extend(messages)
+
+    def remaining_ms(self) -> int:
+        return int((self.deadline - self.clock()) * 1000)
+
+    def ready(self, batch_size: int) -> bool:
+        return bool(self.messages) and (len(self.messages) >= batch_size or self.remaining_ms() <= 0)
+
+    def wait_ms(self, block_ms: int) -> int:
+        """How long the next read may block: `block_ms` while empty, else until the deadline."""
+        return self.remaining_ms() if self.messages else block_ms
+
+    def take(self) -> List:
+        batch, self.messages = self.messages, []
+        return batch
@@ -0,0 +1,111 @@
+import os
+import time
+import logging
+from datetime import datetime
+from typing import List, Tuple, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class PendingReclaimer:
+    """
+    Recovers messages stuck in the consumer group's pending entries list.
+
+    Messages delivered to a consumer that crashed (or that failed and were
+    never acked) are taken over with XAUTOCLAIM once they have been idle
+    for `min_idle_ms`, and handed back to the worker for another attempt.
+    Every claim bumps the delivery count; messages delivered more than
+    `max_deliveries` times are copied to a dead-letter stream with their
+    failure metadata and acked, so a poison message cannot circulate
+    forever.
+    """
+    def __init__(self, redis_client, stream_name: str, group_name: str, consumer_name: str,
+                 min_idle_ms: int = None, max_deliveries: int = None, dead_letter_stream: str = None,
+                 interval: float = None, count: int = 100):
+        self.redis = redis_client
+        self.stream_name = stream_name
+        self.group_name = group_name
+        self.consumer_name = consumer_name
+        self.min_idle_ms = min_idle_ms or int(os.getenv("RECLAIM_MIN_IDLE_MS", 60000))
+        self.max_deliveries = max_deliveries or int(os.getenv("RECLAIM_MAX_DELIVERIES", 5))
+        self.dead_letter_stream = dead_letter_stream or os.getenv("DEAD_LETTER_STREAM", f"{stream_name}:dlq")
+        self.dead_letter_maxlen = int(os.getenv("DEAD_LETTER_MAXLEN", 10000))
+        self.interval = interval if interval is not None else float(os.getenv("RECLAIM_INTERVAL", 30))
+        # Most messages claimed per reclaim() call
+        self.count = count
+        # Consumers with nothing pending and idle this long are removed from the group
+        self.dead_consumer_idle_ms = int(os.getenv("DEAD_CONSUMER_IDLE_MS", 3600000))
+        self._last_run = 0.0
+        self.counters = {"reclaimed": 0, "dead_lettered": 0}
+
+    def due(self) -> bool:
+        return time.monotonic() - self._last_run >= self.interval
+
+    async def reclaim(self) -> List[Tuple[str, Dict]]:
+        """Claim idle pending messages; returns the ones to retry, dead-letters the rest."""
+        self._last_run = time.monotonic()
+        claimed, cursor = [], "0-0"
+        while len(claimed) < self.count:
+            response = await self.redis.xautoclaim(
+                self.stream_name, self.group_name, self.consumer_name,
+                min_idle_time=self.min_idle_ms, start_id=cursor, count=self.count - len(claimed)
+            )
+            cursor, messages = response[0], response[1]
+            # Redis 7 reports entries trimmed from the stream separately, Redis 6 returns them with no data
+            deleted = list(response[2]) if len(response) > 2 else []
+            deleted += [m_id for m_id, m_data in messages if m_data is None]
+            if deleted:
+                await self.redis.xack(self.stream_name, self.group_name, *deleted)
+            claimed.extend((m_id, m_data) for m_id, m_data in messages if m_data is not None)
+            if cursor in ("0-0", b"0-0"):
+                break
+
+        if not claimed:
+            return []
+
+        deliveries = await self._delivery_counts([m_id for m_id, _ in claimed])
+        retry, dead = [], []
+        for m_id, m_data in claimed:
+            (dead if deliveries.get(m_id, 0) > self.max_deliveries else retry).append((m_id, m_data))
+
+        if dead:
+            await self.dead_letter(dead, deliveries)
+        self.counters["reclaimed"] += len(retry)
+        logger.info(f"♻️ Reclaimed {len(retry)} pending messages, dead-lettered {len(dead)}")
+        return retry
+
+    async def _delivery_counts(self, ids: List[str]) -> Dict[str, int]:
+        """Delivery count of each claimed id, fetched in one pipelined round trip."""
+        pipe = self.redis.pipeline(transaction=False)
+        for m_id in ids:
+            pipe.xpending_range(self.stream_name, self.group_name, min=m_id, max=m_id, count=1)
+        counts = {}
+        for entries in await pipe.execute():
+            for e in entries:
+                counts[e["message_id"]] = e["times_delivered"]
+        return counts
+
+    async def dead_letter(self, messages: List[Tuple[str, Dict]], deliveries: Dict[str, int]):
+        """Move messages to the dead-letter stream and ack them in one round trip."""
+        pipe = self.redis.pipeline(transaction=True)
+        for m_id, m_data in messages:
+            pipe.xadd(self.dead_letter_stream, {
+                **m_data,
+                "original_id": m_id,
+                "delivery_count": deliveries.get(m_id, 0),
+                "consumer": self.consumer_name,
+                "dead_lettered_at": datetime.utcnow().isoformat() + 'Z'
+            }, maxlen=self.dead_letter_maxlen, approximate=True)
+        pipe.xack(self.stream_name, self.group_name, *[m_id for m_id, _ in messages])
+        await pipe.execute()
+        self.counters["dead_lettered"] += len(messages)
+        logger.warning(f"☠️ Moved {len(messages)} messages to {self.dead_letter_stream}")
+
+    async def prune_consumers(self):
+        """Delete consumers of crashed workers once their pending list is empty."""
+        for consumer in await self.redis.xinfo_consumers(self.stream_name, self.group_name):
+            name = consumer["name"]
+            if name != self.consumer_name and consumer["pending"] == 0 and consumer["idle"] > self.dead_consumer_idle_ms:
+                await self.redis.xgroup_delconsumer(self.stream_name, self.group_name, name)
+                logger.info(f"Removed idle consumer {name}")
+
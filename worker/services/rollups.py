@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select, func, insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from models import ROLLUP_MODELS, SocialMediaPost, SentimentAnalysis
+
+PERIOD_STEPS = {
+    "minute": timedelta(minutes=1),
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+}
+
+
+def truncate(ts: datetime, period: str) -> datetime:
+    """Python twin of Postgres date_trunc for the rollup periods."""
+    ts = ts.replace(second=0, microsecond=0)
+    if period in ("hour", "day"):
+        ts = ts.replace(minute=0)
+    if period == "day":
+        ts = ts.replace(hour=0)
+    return ts
+
+
+def rollup_rows(analyses: Iterable[Tuple[datetime, str, str, float]]) -> Dict[str, List[Dict]]:
+    """
+    (created_at, source, label, confidence) for every newly stored analysis
+    -> upsert rows per period, summed per (bucket, source, label) and sorted
+    by key so concurrent workers lock rows in the same order.
+    """
+    rows = {period: {} for period in ROLLUP_MODELS}
+    for created_at, source, label, confidence in analyses:
+        for period, buckets in rows.items():
+            key = (truncate(created_at, period), source, label)
+            count, conf_sum = buckets.get(key, (0, 0.0))
+            buckets[key] = (count + 1, conf_sum + (confidence or 0.0))
+    return {
+        period: [
+            {"bucket": b, "source": s, "sentiment_label": l, "post_count": c, "confidence_sum": cs}
+            for (b, s, l), (c, cs) in sorted(buckets.items())
+        ]
+        for period, buckets in rows.items() if buckets
+    }
+
+
+async def upsert_rollups(db_session, rows: Dict[str, List[Dict]]):
+    """Add the counts to the rollup tables, in the caller's transaction."""
+    for period, values in rows.items():
+        model = ROLLUP_MODELS[period]
+        stmt = pg_insert(model).values(values)
+        await db_session.execute(stmt.on_conflict_do_update(
+            index_elements=['bucket', 'source', 'sentiment_label'],
+            set_={
+                "post_count": model.post_count + stmt.excluded.post_count,
+                "confidence_sum": model.confidence_sum + stmt.excluded.confidence_sum,
+            }
+        ))
+
+
+def backfill_rollups(sync_conn) -> Dict[str, int]:
+    """
+    Build empty rollup tables from the existing history (for run_sync).
+    Tables that already hold rows are left alone, so this is safe to run on
+    every start; the table lock keeps two starting workers from both filling.
+    """
+    filled = {}
+    for period, model in ROLLUP_MODELS.items():
+        sync_conn.exec_driver_sql(f"LOCK TABLE {model.__tablename__} IN SHARE ROW EXCLUSIVE MODE")
+        if sync_conn.execute(select(model.bucket).limit(1)).first() is not None:
+            continue
+        bucket = func.date_trunc(period, SocialMediaPost.created_at)
+        history = (
+            select(
+                bucket, SocialMediaPost.source, SentimentAnalysis.sentiment_label,
+                func.count(SentimentAnalysis.id), func.coalesce(func.sum(SentimentAnalysis.confidence_score), 0.0)
+            )
+            .join(SentimentAnalysis, SocialMediaPost.post_id == SentimentAnalysis.post_id)
+            .group_by(bucket, SocialMediaPost.source, SentimentAnalysis.sentiment_label)
+        )
+        result = sync_conn.execute(insert(model).from_select(
+            ["bucket", "source", "sentiment_label", "post_count", "confidence_sum"], history
+        ))
+        filled[period] = result.rowcount
+    return filled
+
+
+def bucket_range(start: datetime, end: datetime, period: str) -> List[datetime]:
+    step = PERIOD_STEPS[period]
+    bucket, last = truncate(start, period), truncate(end, period)
+    buckets = []
+    while bucket <= last:
+        buckets.append(bucket)
+        bucket += step
+    return buckets
+
+
+async def read_rollups(db_session, period: str, start: datetime, end: datetime, source: Optional[str] = None) -> List[Dict]:
+    """
+    Trend series from the rollup table alone: one row per bucket between
+    start and end, empty buckets included with zero counts.
+    """
+    model = ROLLUP_MODELS[period]
+    query = (
+        select(model.bucket, model.sentiment_label, func.sum(model.post_count), func.sum(model.confidence_sum))
+        .where(model.bucket >= truncate(start, period), model.bucket <= end)
+        .group_by(model.bucket, model.sentiment_label)
+    )
+    if source:
+        query = query.where(model.source == source)
+
+    counts = {}
+    for bucket, label, count, conf_sum in (await db_session.execute(query)).all():
+        item = counts.setdefault(bucket, {"pos": 0, "neg": 0, "neu": 0, "conf_sum": 0.0, "count": 0})
+        if "pos" in label: item["pos"] += count
+        elif "neg" in label: item["neg"] += count
+        else: item["neu"] += count
+        item["count"] += count
+        item["conf_sum"] += conf_sum or 0.0
+
+    series = []
+    for bucket in bucket_range(start, end, period):
+        item = counts.get(bucket)
+        total = item["count"] if item else 0
+        series.append({
+            "timestamp": bucket.isoformat(),
+            "positive_count": item["pos"] if item else 0,
+            "negative_count": item["neg"] if item else 0,
+            "neutral_count": item["neu"] if item else 0,
+            "total_count": total,
+            "positive_percentage": round((item["pos"] / total) * 100, 2) if total else 0.0,
+            "average_confidence": round(item["conf_sum"] / total, 2) if total else 0.0,
+        })
+    return series
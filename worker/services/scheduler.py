@@ -0,0 +1,46 @@
+from typing import Dict
+
+
+class WeightedFairScheduler:
+    """
+    Deficit round robin over the shard streams.
+
+    Each round every stream earns credit in proportion to its weight and
+    may read as many messages as it has whole credits. A stream that
+    returns fewer messages than it asked for has caught up and loses its
+    banked credit, so an idle high-priority source does not build up a
+    burst allowance, while a flood on one source can only ever take its
+    weighted share of each batch while other sources have messages. Capacity
+    that idle streams leave unused goes to the backlogged ones (spare()), so
+    a single busy source still fills whole batches.
+    """
+    def __init__(self, weights: Dict[str, float]):
+        # stream key -> weight (> 0)
+        self.weights = {s: max(float(w), 0.01) for s, w in weights.items()}
+        self.deficits = {s: 0.0 for s in self.weights}
+
+    def quotas(self, capacity: int) -> Dict[str, int]:
+        """How many messages to request from each stream this round (at most ~capacity in total)."""
+        if capacity <= 0:
+            return {}
+        total = sum(self.weights.values())
+        quotas = {}
+        for stream, weight in self.weights.items():
+            self.deficits[stream] = min(self.deficits[stream] + capacity * weight / total, capacity)
+            if self.deficits[stream] >= 1:
+                quotas[stream] = int(self.deficits[stream])
+        return quotas
+
+    def spare(self, capacity: int, backlogged) -> Dict[str, int]:
+        """Split capacity the other streams left unused between the backlogged ones, by weight."""
+        backlogged = [s for s in backlogged if s in self.weights]
+        if capacity <= 0 or not backlogged:
+            return {}
+        total = sum(self.weights[s] for s in backlogged)
+        quotas = {s: int(capacity * self.weights[s] / total) for s in backlogged}
+        return {s: q for s, q in quotas.items() if q > 0}
+
+    def record(self, stream: str, requested: int, received: int):
+        self.deficits[stream] -= received
+        if received < requested:
+            self.deficits[stream] = 0.0
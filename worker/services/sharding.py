@@ -0,0 +1,57 @@
+import os
+import zlib
+from typing import Dict, List
+
+DEFAULT_SOURCES = "twitter,reddit,mastodon,facebook"
+
+
+def parse_weights(raw: str) -> Dict[str, float]:
+    """'reddit=3,mastodon=2' -> {'reddit': 3.0, 'mastodon': 2.0}"""
+    weights = {}
+    for part in (raw or "").split(","):
+        name, _, value = part.partition("=")
+        if name.strip() and value.strip():
+            weights[name.strip()] = float(value)
+    return weights
+
+
+class StreamRouter:
+    """
+    Maps posts onto the ingest stream keys (shared by the ingester and the worker).
+
+    STREAM_SHARD_MODE:
+      none   -> everything goes to `stream_name` (the default)
+      source -> one stream per source, `<stream>:<source>`; sources outside
+                STREAM_SOURCES share `<stream>:other`
+      hash   -> STREAM_SHARDS streams `<stream>:<n>`, by crc32 of the post_id
+    """
+    def __init__(self, stream_name: str, mode: str = None, shards: int = None, sources: List[str] = None):
+        self.stream_name = stream_name
+        self.mode = (mode or os.getenv("STREAM_SHARD_MODE", "none")).lower()
+        self.shards = shards or int(os.getenv("STREAM_SHARDS", 4))
+        self.sources = sources or [s.strip() for s in os.getenv("STREAM_SOURCES", DEFAULT_SOURCES).split(",") if s.strip()]
+        if self.mode not in ("none", "source", "hash"):
+            raise ValueError(f"Unknown STREAM_SHARD_MODE: {self.mode}")
+
+    def shard_names(self) -> List[str]:
+        """Shard suffixes, which are also the names priorities are configured by."""
+        if self.mode == "source":
+            return self.sources + ["other"]
+        if self.mode == "hash":
+            return [str(n) for n in range(self.shards)]
+        return []
+
+    def streams(self) -> Dict[str, str]:
+        """Stream key -> shard name for every shard."""
+        if self.mode == "none":
+            return {self.stream_name: "default"}
+        return {f"{self.stream_name}:{name}": name for name in self.shard_names()}
+
+    def stream_for(self, post: Dict) -> str:
+        if self.mode == "source":
+            source = post.get("source")
+            return f"{self.stream_name}:{source if source in self.sources else 'other'}"
+        if self.mode == "hash":
+            shard = zlib.crc32(str(post.get("post_id", "")).encode("utf-8")) % self.shards
+            return f"{self.stream_name}:{shard}"
+        return self.stream_name
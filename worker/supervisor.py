@@ -0,0 +1,132 @@
+import os
+import time
+import signal
+import socket
+import asyncio
+import logging
+import multiprocessing
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("Supervisor")
+
+
+def run_child(index: int, consumer_name: str, torch_threads: int):
+    """Entry point of one consumer process."""
+    os.environ["WORKER_CONSUMER_NAME"] = consumer_name
+    # Each child already is a replica with its own thread budget, so the
+    # models always run in-process; a per-child inference pool would split
+    # the cores once per child (see INFERENCE_REPLICAS in .env.example)
+    os.environ["INFERENCE_REPLICAS"] = "0"
+    os.environ["ONNX_THREADS"] = str(torch_threads)
+    import torch
+    torch.set_num_threads(torch_threads)
+    torch.set_num_interop_threads(1)
+
+    import worker
+    worker.logger.info(f"Child {index} ({consumer_name}) using {torch_threads} torch threads")
+    asyncio.run(worker.main())
+
+
+class WorkerSupervisor:
+    """
+    Runs N SentimentWorker processes in the same consumer group.
+
+    Child i is always called `worker_{hostname}_{i}`, so a restarted child
+    re-uses its predecessor's name (and its pending entries). Cores are
+    split evenly into per-child torch thread budgets, and each child runs
+    its models in-process (INFERENCE_REPLICAS is ignored). Children that exit
+    unexpectedly are restarted with exponential backoff; on SIGTERM or
+    SIGINT every child is asked to drain (finish and ack its in-flight
+    batch) and is killed only if it overruns `drain_timeout`.
+    """
+    def __init__(self, processes: int = None, torch_threads: int = None, drain_timeout: float = None,
+                 process_factory=None, clock=time.monotonic, sleep=time.sleep):
+        cores = os.cpu_count() or 1
+        self.processes = processes or int(os.getenv("WORKER_PROCESSES", max(1, cores // 2)))
+        self.torch_threads = torch_threads or int(os.getenv("WORKER_TORCH_THREADS", max(1, cores // self.processes)))
+        self.drain_timeout = drain_timeout or float(os.getenv("WORKER_DRAIN_TIMEOUT", 30))
+        self.hostname = os.getenv("WORKER_HOSTNAME", socket.gethostname())
+        # 'spawn' so every child loads its own models and connections
+        self.ctx = multiprocessing.get_context("spawn")
+        # Seams for tests: how children are created, and the time source
+        self.process_factory = process_factory or self.ctx.Process
+        self.clock = clock
+        self.sleep = sleep
+        self.children = {}
+        self.restarts = {i: 0 for i in range(self.processes)}
+        self.next_start = {i: 0.0 for i in range(self.processes)}
+        self._stopping = False
+
+    def consumer_name(self, index: int) -> str:
+        return f"worker_{self.hostname}_{index}"
+
+    def start_child(self, index: int):
+        proc = self.process_factory(
+            target=run_child, args=(index, self.consumer_name(index), self.torch_threads),
+            name=self.consumer_name(index), daemon=False
+        )
+        proc.start()
+        self.children[index] = (proc, self.clock())
+        logger.info(f"Started {proc.name} (pid {proc.pid})")
+
+    def stop(self, signum=None, frame=None):
+        # Ctrl-C also reaches the children directly; they drain on SIGINT too
+        self._stopping = True
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        # Create the schema once instead of racing N children on it
+        import worker
+        asyncio.run(worker.init_schema())
+
+        self.supervise()
+
+    def supervise(self):
+        """Start every child, keep them running until stop(), then drain."""
+        logger.info(f"🚀 Supervising {self.processes} workers x {self.torch_threads} torch threads")
+        for i in range(self.processes):
+            self.start_child(i)
+
+        while not self._stopping:
+            self.check_children()
+            self.sleep(0.5)
+
+        self.drain()
+
+    def check_children(self):
+        """Reap children that exited and restart them once their backoff has passed."""
+        for i in range(self.processes):
+            proc, started = self.children.get(i, (None, 0.0))
+            if proc is not None and proc.is_alive():
+                continue
+            if proc is not None:
+                proc.join()
+                logger.error(f"❌ {proc.name} exited with code {proc.exitcode}")
+                # A child that ran for a while gets a fresh backoff
+                self.restarts[i] = 0 if self.clock() - started > 60 else self.restarts[i] + 1
+                self.next_start[i] = self.clock() + min(30.0, 2 ** self.restarts[i] - 1)
+                self.children.pop(i)
+            if self.clock() >= self.next_start[i]:
+                self.start_child(i)
+
+    def drain(self):
+        logger.info("🛑 Draining workers...")
+        for proc, _ in self.children.values():
+            if proc.is_alive():
+                # SIGTERM: the child finishes and acks its in-flight batch
+                proc.terminate()
+
+        deadline = self.clock() + self.drain_timeout
+        for proc, _ in self.children.values():
+            proc.join(max(0.0, deadline - self.clock()))
+            if proc.is_alive():
+                logger.warning(f"{proc.name} did not drain in {self.drain_timeout}s, killing it")
+                proc.kill()
+                proc.join()
+        logger.info("👋 All workers stopped.")
+
+
+if __name__ == "__main__":
+    WorkerSupervisor().run()
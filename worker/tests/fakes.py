@@ -0,0 +1,200 @@
+"""In-memory doubles shared by the tests: just enough of redis.asyncio, a clock and an inference engine."""
+import hashlib
+
+import pytest
+from redis.exceptions import NoScriptError
+
+
+def parse_id(entry_id: str):
+    ms, _, seq = entry_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+class FakeClock:
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class FakeEngine:
+    """
+    Stands in for InferenceEngine: texts containing 'good' are positive,
+    'bad' negative, anything else neutral; every emotion is joy.
+    Records each (task, texts) call.
+    """
+    replicas = 1
+
+    def __init__(self):
+        self.calls = []
+
+    async def warmup(self):
+        pass
+
+    async def predict(self, task, texts):
+        self.calls.append((task, list(texts)))
+        if task == "emotion":
+            return [{"emotion": "joy", "confidence_score": 0.8, "model_name": "fake-emotion"} for _ in texts]
+        return [
+            {
+                "sentiment_label": "positive" if "good" in t else "negative" if "bad" in t else "neutral",
+                "confidence_score": 0.9,
+                "model_name": "fake-sentiment"
+            } for t in texts
+        ]
+
+
+class FakePipeline:
+    """Queues any FakeRedis command and runs them in order on execute()."""
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        method = getattr(self.redis, name)
+
+        def queue(*args, **kwargs):
+            self.calls.append((name, method, args, kwargs))
+            return self
+        return queue
+
+    @property
+    def commands(self):
+        return [(name, args) for name, _, args, _ in self.calls]
+
+    async def execute(self, raise_on_error=True):
+        self.redis.round_trips += 1
+        calls, self.calls = self.calls, []
+        results = []
+        for _, method, args, kwargs in calls:
+            try:
+                results.append(await method(*args, **kwargs))
+            except Exception as e:
+                if raise_on_error:
+                    raise
+                results.append(e)
+        return results
+
+
+class FakeRedis:
+    """
+    Strings, hashes and streams in dicts, PUBLISH into a list; no expiry.
+    Every command fails with ConnectionError while `down` is set. Scripts
+    run on real Lua through lupa (tests using them skip without it).
+    """
+    def __init__(self):
+        self.data = {}
+        self.hashes = {}
+        self.streams = {}
+        self.published = []
+        self.acked = []
+        self.scripts = {}
+        self.seq = 0
+        self.ttls = {}
+        self.round_trips = 0
+        self.down = False
+
+    def _check(self):
+        if self.down:
+            raise ConnectionError("redis down")
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def get(self, key):
+        self._check()
+        return self.data.get(key)
+
+    async def mget(self, keys, *more):
+        self._check()
+        keys = list(keys) if isinstance(keys, (list, tuple)) else [keys]
+        return [self.data.get(k) for k in keys + list(more)]
+
+    async def set(self, key, value, nx=False, px=None, ex=None):
+        self._check()
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    async def delete(self, *keys):
+        self._check()
+        return sum(self.data.pop(k, None) is not None for k in keys)
+
+    async def incr(self, key):
+        self._check()
+        self.data[key] = str(int(self.data.get(key, 0)) + 1)
+        return int(self.data[key])
+
+    async def expire(self, key, ttl):
+        self.ttls[key] = ttl
+
+    async def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update(mapping)
+
+    async def hget(self, key, field):
+        self._check()
+        return self.hashes.get(key, {}).get(field)
+
+    async def publish(self, channel, message):
+        return self._publish(channel, message)
+
+    def _publish(self, channel, message):
+        self.published.append((channel, message))
+        return 1
+
+    async def xadd(self, stream, fields, id="*", maxlen=None, approximate=True):
+        return self._xadd(stream, fields, maxlen)
+
+    def _xadd(self, stream, fields, maxlen=None):
+        entries = self.streams.setdefault(stream, [])
+        self.seq += 1
+        entry_id = f"{self.seq}-0"
+        entries.append((entry_id, dict(fields)))
+        if maxlen is not None:
+            del entries[:max(0, len(entries) - maxlen)]
+        return entry_id
+
+    async def xack(self, stream, group, *ids):
+        self._check()
+        self.acked.extend((stream, m_id) for m_id in ids)
+        return len(ids)
+
+    async def xrange(self, stream, min="-", max="+", count=None):
+        entries = self.streams.get(stream, [])
+        if min.startswith("("):
+            entries = [e for e in entries if parse_id(e[0]) > parse_id(min[1:])]
+        elif min != "-":
+            entries = [e for e in entries if parse_id(e[0]) >= parse_id(min)]
+        return entries[:count]
+
+    async def script_load(self, script):
+        self.round_trips += 1
+        sha = hashlib.sha1(script.encode("utf-8")).hexdigest()
+        self.scripts[sha] = script
+        return sha
+
+    async def evalsha(self, sha, numkeys, *keys_and_args):
+        if sha not in self.scripts:
+            raise NoScriptError("NOSCRIPT No matching script")
+        return await self.eval(self.scripts[sha], numkeys, *keys_and_args)
+
+    async def eval(self, script, numkeys, *keys_and_args):
+        lupa = pytest.importorskip("lupa")
+        lua = lupa.LuaRuntime(unpack_returned_tuples=True)
+        commands = {"XADD": self._lua_xadd, "PUBLISH": self._publish}
+        lua.globals().redis = lua.table(call=lambda name, *a: commands[name](*a))
+        lua.globals().KEYS = lua.table(*keys_and_args[:numkeys])
+        # Redis hands every argument to the script as a string
+        lua.globals().ARGV = lua.table(*[str(a) for a in keys_and_args[numkeys:]])
+        return lua.execute(script)
+
+    def _lua_xadd(self, stream, *args):
+        # XADD key [MAXLEN [~] n] * field value ...
+        maxlen = None
+        if args[0] == "MAXLEN":
+            approximate = args[1] == "~"
+            maxlen = int(args[2] if approximate else args[1])
+            args = args[3 if approximate else 2:]
+        return self._xadd(stream, dict(zip(args[1::2], args[2::2])), maxlen)
@@ -0,0 +1,71 @@
+import pytest
+from services.backpressure import AdaptiveBatchController, lag_key
+from fakes import FakeRedis
+
+
+class GroupRedis(FakeRedis):
+    """XINFO GROUPS lag, XLEN and the XPENDING summary per stream."""
+    def __init__(self, groups, lengths=None, pending=None):
+        super().__init__()
+        self.groups = groups
+        self.lengths = lengths or {}
+        self.pending_counts = pending or {}
+
+    async def xinfo_groups(self, stream):
+        return self.groups.get(stream, [])
+
+    async def xlen(self, stream):
+        return self.lengths.get(stream, 0)
+
+    async def xpending(self, stream, group):
+        return {"pending": self.pending_counts.get(stream, 0)}
+
+
+def controller(redis=None, **kwargs):
+    options = dict(min_batch=8, max_batch=64, min_latency_ms=20, max_latency_ms=160, check_interval=0)
+    options.update(kwargs)
+    return AdaptiveBatchController(redis, "posts", "group", **options)
+
+
+def test_batches_grow_under_lag_and_shrink_when_caught_up():
+    c = controller()
+    assert (c.batch_size, c.latency_ms) == (8, 20)
+    c.adapt(16)
+    assert (c.batch_size, c.latency_ms) == (16, 40)
+    # Some lag, but not enough to double again or to shrink: unchanged
+    c.adapt(10)
+    assert (c.batch_size, c.latency_ms) == (16, 40)
+    c.adapt(4)
+    assert (c.batch_size, c.latency_ms) == (8, 20)
+
+
+def test_batch_size_and_latency_stay_within_bounds():
+    c = controller()
+    for _ in range(10):
+        c.adapt(100000)
+    assert (c.batch_size, c.latency_ms) == (64, 160)
+    for _ in range(10):
+        c.adapt(0)
+    assert (c.batch_size, c.latency_ms) == (8, 20)
+    # Starting values outside the bounds are clamped as well
+    assert controller(batch_size=1000, latency_ms=1).batch_size == 64
+    assert controller(batch_size=1000, latency_ms=1).latency_ms == 20
+
+
+@pytest.mark.asyncio
+async def test_lag_is_summed_over_shards_and_reported():
+    redis = GroupRedis(
+        groups={"posts:a": [{"name": "other", "lag": 999}, {"name": "group", "lag": 100}]},
+        # Redis < 7 reports no lag for posts:b: its length is used instead
+        lengths={"posts:b": 30},
+        pending={"posts:a": 5, "posts:b": 2},
+    )
+    c = controller(redis, streams=["posts:a", "posts:b"])
+    assert await c.refresh("worker_1")
+    assert (c.lag, c.pending, c.batch_size) == (130, 7, 16)
+
+    report = redis.hashes[lag_key("posts")]
+    assert report["lag"] == 130 and report["pending"] == 7
+    assert report["batch_size"] == 16 and report["reported_by"] == "worker_1"
+    # The report expires, so a dead worker cannot keep the ingester throttled
+    assert redis.ttls[lag_key("posts")] == c.report_ttl
@@ -0,0 +1,77 @@
+import json
+
+import pytest
+from services.event_log import EventLog, APPEND_SCRIPT
+from fakes import FakeRedis
+
+
+def payload(post_id):
+    return json.dumps({"type": "new_post", "post_id": post_id}, separators=(",", ":"))
+
+
+async def append_all(redis, log, payloads):
+    pipe = redis.pipeline(transaction=False)
+    for p in payloads:
+        log.append(pipe, p)
+    return await log.recover(await pipe.execute(raise_on_error=False), payloads)
+
+
+@pytest.mark.asyncio
+async def test_events_are_logged_and_published_with_their_entry_id():
+    redis = FakeRedis()
+    log = EventLog(redis, "sentiment_updates", stream="events", maxlen=100)
+    await log.load()
+    assert await append_all(redis, log, [payload("p1"), payload("p2")]) == []
+
+    assert [fields["event"] for _, fields in redis.streams["events"]] == [payload("p1"), payload("p2")]
+    ids = [entry_id for entry_id, _ in redis.streams["events"]]
+    messages = [json.loads(m) for channel, m in redis.published if channel == "sentiment_updates"]
+    assert [m["event_id"] for m in messages] == ids
+    assert [m["post_id"] for m in messages] == ["p1", "p2"]
+    assert all(m["type"] == "new_post" for m in messages)
+    # SCRIPT LOAD once, then the events only cost the caller's pipeline
+    assert redis.round_trips == 2
+
+
+@pytest.mark.asyncio
+async def test_log_is_capped_at_maxlen():
+    redis = FakeRedis()
+    log = EventLog(redis, "sentiment_updates", stream="events", maxlen=3)
+    await log.load()
+    await append_all(redis, log, [payload(f"p{i}") for i in range(10)])
+    assert [json.loads(f["event"])["post_id"] for _, f in redis.streams["events"]] == ["p7", "p8", "p9"]
+    assert len(redis.published) == 10
+
+
+@pytest.mark.asyncio
+async def test_a_flushed_script_is_reloaded_and_the_events_resent():
+    redis = FakeRedis()
+    log = EventLog(redis, "sentiment_updates", stream="events", maxlen=100)
+    await log.load()
+    redis.scripts.clear()  # SCRIPT FLUSH or a Redis restart
+    assert await append_all(redis, log, [payload("p1"), payload("p2")]) == []
+    assert [json.loads(m)["post_id"] for _, m in redis.published] == ["p1", "p2"]
+    assert log.sha in redis.scripts
+
+
+@pytest.mark.asyncio
+async def test_appending_before_load_sends_the_script_inline():
+    redis = FakeRedis()
+    log = EventLog(redis, "sentiment_updates", stream="events", maxlen=100)
+    pipe = redis.pipeline(transaction=False)
+    log.append(pipe, payload("p1"))
+    assert pipe.commands[0][0] == "eval" and pipe.commands[0][1][0] == APPEND_SCRIPT
+    await pipe.execute()
+    assert len(redis.streams["events"]) == 1
+
+
+@pytest.mark.asyncio
+async def test_maxlen_zero_only_publishes(monkeypatch):
+    monkeypatch.setenv("EVENT_LOG_MAXLEN", "0")
+    redis = FakeRedis()
+    log = EventLog(redis, "sentiment_updates")
+    await log.load()
+    assert log.sha is None
+    await append_all(redis, log, [payload("p1")])
+    assert redis.published == [("sentiment_updates", payload("p1"))]
+    assert redis.streams == {}
@@ -0,0 +1,37 @@
+from services.micro_batch import MicroBatchBuffer
+from fakes import FakeClock
+
+
+def test_a_full_batch_is_ready_before_the_deadline():
+    clock = FakeClock()
+    buffer = MicroBatchBuffer(clock)
+    buffer.add(["a", "b"], max_latency_ms=250)
+    assert not buffer.ready(3)
+    buffer.add(["c"], max_latency_ms=250)
+    assert buffer.ready(3)
+    assert buffer.take() == ["a", "b", "c"] and len(buffer) == 0
+
+
+def test_a_partial_batch_is_ready_once_the_oldest_message_waited_long_enough():
+    clock = FakeClock()
+    buffer = MicroBatchBuffer(clock)
+    buffer.add(["a"], max_latency_ms=250)
+    clock.now += 0.1
+    # Later messages do not push the deadline back
+    buffer.add(["b"], max_latency_ms=250)
+    assert not buffer.ready(10) and buffer.wait_ms(5000) == 150
+    clock.now += 0.15
+    assert buffer.ready(10)
+    assert buffer.take() == ["a", "b"]
+
+
+def test_an_empty_buffer_blocks_for_the_full_read_timeout():
+    clock = FakeClock()
+    buffer = MicroBatchBuffer(clock)
+    assert not buffer.ready(1) and buffer.wait_ms(5000) == 5000
+    # An empty read starts no deadline
+    buffer.add([], max_latency_ms=250)
+    clock.now += 10
+    assert not buffer.ready(1)
+    buffer.add(["a"], max_latency_ms=250)
+    assert buffer.wait_ms(5000) == 250
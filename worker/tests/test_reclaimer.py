@@ -0,0 +1,84 @@
+import pytest
+from services.reclaimer import PendingReclaimer
+from fakes import FakeRedis
+
+
+class PendingRedis(FakeRedis):
+    """One stream's pending entries list: id -> [data, consumer, idle ms, deliveries]."""
+    def __init__(self, pending, consumers=()):
+        super().__init__()
+        self.pending = pending
+        self.consumers = list(consumers)
+        self.deleted_consumers = []
+
+    async def xautoclaim(self, stream, group, consumer, min_idle_time, start_id, count):
+        claimed = []
+        for m_id, entry in sorted(self.pending.items()):
+            if m_id > start_id and entry[2] >= min_idle_time and len(claimed) < count:
+                entry[1:4] = [consumer, 0, entry[3] + 1]
+                claimed.append((m_id, entry[0]))
+        return ["0-0", claimed, []]
+
+    async def xpending_range(self, stream, group, min, max, count):
+        entry = self.pending.get(min)
+        return [{"message_id": min, "times_delivered": entry[3]}] if entry else []
+
+    async def xack(self, stream, group, *ids):
+        for m_id in ids:
+            self.pending.pop(m_id, None)
+        return await super().xack(stream, group, *ids)
+
+    async def xinfo_consumers(self, stream, group):
+        return self.consumers
+
+    async def xgroup_delconsumer(self, stream, group, name):
+        self.deleted_consumers.append(name)
+
+
+def reclaimer(redis):
+    return PendingReclaimer(redis, "posts", "group", "worker_b", min_idle_ms=1000, max_deliveries=3,
+                            dead_letter_stream="posts:dlq", interval=0)
+
+
+@pytest.mark.asyncio
+async def test_idle_messages_below_the_limit_are_retried():
+    redis = PendingRedis({
+        "1-0": [{"content": "a"}, "worker_a", 5000, 1],
+        "2-0": [{"content": "b"}, "worker_a", 10, 1],  # not idle long enough
+    })
+    retry = await reclaimer(redis).reclaim()
+    assert retry == [("1-0", {"content": "a"})]
+    assert redis.pending["1-0"][1] == "worker_b"
+    assert redis.acked == [] and redis.streams == {}
+
+
+@pytest.mark.asyncio
+async def test_messages_over_the_limit_move_to_the_dead_letter_stream():
+    redis = PendingRedis({
+        "1-0": [{"content": "poison"}, "worker_a", 5000, 3],
+        "2-0": [{"content": "ok"}, "worker_a", 5000, 2],
+    })
+    r = reclaimer(redis)
+    retry = await r.reclaim()
+
+    assert retry == [("2-0", {"content": "ok"})]
+    [(_, dead)] = redis.streams["posts:dlq"]
+    assert dead["content"] == "poison" and dead["original_id"] == "1-0"
+    assert dead["delivery_count"] == 4 and dead["consumer"] == "worker_b"
+    # Acked on the source stream, so it is never delivered again
+    assert redis.acked == [("posts", "1-0")] and "1-0" not in redis.pending
+    assert r.counters == {"reclaimed": 1, "dead_lettered": 1}
+
+
+@pytest.mark.asyncio
+async def test_only_idle_consumers_without_pending_entries_are_removed():
+    redis = PendingRedis({}, consumers=[
+        {"name": "worker_dead", "pending": 0, "idle": 7200000},
+        {"name": "worker_busy", "pending": 2, "idle": 7200000},
+        {"name": "worker_recent", "pending": 0, "idle": 1000},
+        {"name": "worker_b", "pending": 0, "idle": 7200000},
+    ])
+    r = reclaimer(redis)
+    r.dead_consumer_idle_ms = 3600000
+    await r.prune_consumers()
+    assert redis.deleted_consumers == ["worker_dead"]
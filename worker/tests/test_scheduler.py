@@ -0,0 +1,52 @@
+from services.scheduler import WeightedFairScheduler
+
+
+def test_quotas_follow_the_priority_weights():
+    scheduler = WeightedFairScheduler({"posts:reddit": 3, "posts:twitter": 1})
+    assert scheduler.quotas(32) == {"posts:reddit": 24, "posts:twitter": 8}
+    assert scheduler.quotas(0) == {}
+
+
+def test_a_flood_only_gets_its_share_while_others_have_messages():
+    scheduler = WeightedFairScheduler({"flood": 1, "quiet": 1})
+    served = {"flood": 0, "quiet": 0}
+    for _ in range(10):
+        for stream, quota in scheduler.quotas(10).items():
+            # Both streams are backlogged and return everything they ask for
+            scheduler.record(stream, quota, quota)
+            served[stream] += quota
+    assert served == {"flood": 50, "quiet": 50}
+
+
+def test_spare_capacity_goes_to_backlogged_streams_by_weight():
+    scheduler = WeightedFairScheduler({"a": 2, "b": 1, "idle": 1})
+    assert scheduler.spare(9, ["a", "b"]) == {"a": 6, "b": 3}
+    # Unknown or no backlogged streams, or nothing left over
+    assert scheduler.spare(9, ["other"]) == {}
+    assert scheduler.spare(0, ["a"]) == {}
+    # Shares that round down to nothing are left out
+    assert scheduler.spare(1, ["a", "b"]) == {}
+
+
+def test_fractional_credit_carries_over_between_rounds():
+    scheduler = WeightedFairScheduler({"a": 1, "b": 2})
+    # 4 / 3 and 8 / 3 credits: one and two whole messages
+    assert scheduler.quotas(4) == {"a": 1, "b": 2}
+    scheduler.record("a", 1, 1)
+    scheduler.record("b", 2, 2)
+    # The leftover thirds add up to one more message for each stream
+    assert scheduler.quotas(4) == {"a": 1, "b": 3}
+
+
+def test_caught_up_streams_lose_their_banked_credit():
+    scheduler = WeightedFairScheduler({"a": 1, "b": 1})
+    scheduler.quotas(3)
+    scheduler.record("a", 1, 1)
+    # b returned less than requested: it is idle and must not bank a burst
+    scheduler.record("b", 1, 0)
+    assert scheduler.deficits["b"] == 0.0
+    assert scheduler.deficits["a"] == 0.5
+    # Credit never exceeds one round's capacity either
+    for _ in range(5):
+        scheduler.quotas(3)
+    assert scheduler.deficits["a"] <= 3
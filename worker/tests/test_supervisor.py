@@ -0,0 +1,104 @@
+import itertools
+
+from supervisor import WorkerSupervisor
+from fakes import FakeClock
+
+
+class FakeProcess:
+    """multiprocessing.Process double: exits when told to, and drains on SIGTERM unless `stuck`."""
+    pids = itertools.count(100)
+
+    def __init__(self, target, args, name, daemon):
+        self.name = name
+        self.pid = None
+        self.exitcode = None
+        self.alive = False
+        self.stuck = False
+        self.signals = []
+
+    def start(self):
+        self.pid = next(self.pids)
+        self.alive = True
+
+    def is_alive(self):
+        return self.alive
+
+    def join(self, timeout=None):
+        pass
+
+    def exit(self, code=1):
+        self.alive, self.exitcode = False, code
+
+    def terminate(self):
+        self.signals.append("SIGTERM")
+        if not self.stuck:
+            self.exit(0)
+
+    def kill(self):
+        self.signals.append("SIGKILL")
+        self.exit(-9)
+
+
+def supervisor(processes=1, clock=None, sleep=None, stuck=()):
+    started = []
+
+    def factory(**kwargs):
+        started.append(FakeProcess(**kwargs))
+        started[-1].stuck = started[-1].name in stuck
+        return started[-1]
+    sup = WorkerSupervisor(processes=processes, torch_threads=1, drain_timeout=5, process_factory=factory,
+                           clock=clock or FakeClock(0.0), sleep=sleep or (lambda seconds: None))
+    sup.hostname = "host"
+    return sup, started
+
+
+def test_crashing_children_restart_with_capped_exponential_backoff():
+    clock = FakeClock(0.0)
+    sup, started = supervisor(clock=clock)
+    sup.start_child(0)
+
+    delays = []
+    for _ in range(6):
+        started[-1].exit(1)
+        sup.check_children()
+        delay = sup.next_start[0] - clock.now
+        delays.append(delay)
+        # Not restarted before the backoff has passed...
+        clock.now += delay - 0.5
+        sup.check_children()
+        assert not started[-1].is_alive()
+        # ...and restarted, under the same consumer name, once it has
+        clock.now += 0.5
+        sup.check_children()
+        assert started[-1].is_alive() and started[-1].name == "worker_host_0"
+    assert delays == [1, 3, 7, 15, 30, 30]
+    assert len(started) == 7
+
+
+def test_a_child_that_ran_a_minute_restarts_at_once():
+    clock = FakeClock(0.0)
+    sup, started = supervisor(clock=clock)
+    sup.start_child(0)
+    sup.restarts[0] = 4
+
+    clock.now += 61
+    started[-1].exit(1)
+    sup.check_children()
+    assert sup.restarts[0] == 0
+    assert len(started) == 2 and started[-1].is_alive()
+
+
+def test_shutdown_terminates_every_child_and_kills_the_stuck_ones():
+    ticks = []
+
+    def sleep(seconds):
+        ticks.append(seconds)
+        if len(ticks) == 2:
+            sup.stop()  # SIGTERM to the supervisor
+    sup, started = supervisor(processes=3, sleep=sleep, stuck=["worker_host_1"])
+
+    sup.supervise()
+    assert ticks == [0.5, 0.5]
+    assert [p.signals for p in started] == [["SIGTERM"], ["SIGTERM", "SIGKILL"], ["SIGTERM"]]
+    assert not any(p.is_alive() for p in started)
+
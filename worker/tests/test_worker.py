@@ -0,0 +1,216 @@
+import os
+import json
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+# worker.py builds its (lazy) async engine at import time
+os.environ.setdefault("DATABASE_URL", "postgresql://sentistream@localhost/sentistream")
+import worker as worker_module
+from worker import SentimentWorker, DATA_VERSION_KEY, create_unique_analysis_index
+from fakes import FakeRedis, FakeEngine
+
+
+class AckRedis(FakeRedis):
+    """Also records every XACK call with all its ids."""
+    def __init__(self):
+        super().__init__()
+        self.xack_calls = []
+
+    async def xack(self, stream, group, *ids):
+        self.xack_calls.append((stream, ids))
+        return await super().xack(stream, group, *ids)
+
+
+def message(post_id, content, source="reddit"):
+    return {"post_id": post_id, "content": content, "source": source, "created_at": "2024-01-01T00:00:00Z"}
+
+
+async def make_worker(redis, saved=None, fail_save=False):
+    """A worker on a fake engine whose save_batch reports `saved` as newly inserted."""
+    worker = SentimentWorker(redis, None, "posts", "group", engine=FakeEngine())
+    worker.saved_batches = []
+
+    async def save_batch(records):
+        if fail_save:
+            raise RuntimeError("database unavailable")
+        worker.saved_batches.append(records)
+        return [post_data["post_id"] for post_data, _ in records] if saved is None else saved
+    worker.save_batch = save_batch
+    await worker.event_log.load()
+    return worker
+
+
+def batch():
+    return [
+        ("posts:a", "1-0", message("p1", "a good day at the beach", "reddit")),
+        ("posts:b", "1-0", message("p2", "a bad day at the office", "twitter")),
+        ("posts:a", "2-0", message("p3", "good news everyone, really", "reddit")),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_a_batch_is_acked_once_per_stream_in_one_round_trip():
+    redis = AckRedis()
+    worker = await make_worker(redis)
+    assert await worker.process_batch(batch())
+
+    assert sorted(redis.xack_calls) == [("posts:a", ("1-0", "2-0")), ("posts:b", ("1-0",))]
+    # SCRIPT LOAD in setup, then acks, events and versions share one pipeline
+    assert redis.round_trips == 2
+    [records] = worker.saved_batches
+    assert [analysis["sentiment_label"] for _, analysis in records] == ["positive", "negative", "positive"]
+
+
+@pytest.mark.asyncio
+async def test_only_newly_inserted_posts_are_published_and_logged():
+    redis = AckRedis()
+    # p2 was redelivered: its analysis already existed
+    worker = await make_worker(redis, saved=["p1", "p3"])
+    assert await worker.process_batch(batch())
+
+    events = [json.loads(m) for _, m in redis.published]
+    assert [e["post_id"] for e in events] == ["p1", "p3"]
+    assert [e["sentiment"] for e in events] == ["positive", "positive"]
+    logged = redis.streams[worker.event_log.stream]
+    assert [e["event_id"] for e in events] == [entry_id for entry_id, _ in logged]
+    # Every message is acked, the redelivered one included
+    assert len(redis.acked) == 3
+
+
+@pytest.mark.asyncio
+async def test_data_versions_are_bumped_for_the_new_sources_only():
+    redis = AckRedis()
+    worker = await make_worker(redis, saved=["p1", "p3"])
+    await worker.process_batch(batch())
+    assert redis.data == {DATA_VERSION_KEY: "1", f"{DATA_VERSION_KEY}:reddit": "1"}
+
+
+@pytest.mark.asyncio
+async def test_a_batch_of_redeliveries_bumps_and_publishes_nothing():
+    redis = AckRedis()
+    worker = await make_worker(redis, saved=[])
+    assert await worker.process_batch(batch())
+    assert redis.published == [] and redis.data == {}
+    assert len(redis.acked) == 3
+
+
+@pytest.mark.asyncio
+async def test_a_failed_save_leaves_the_messages_pending():
+    redis = AckRedis()
+    worker = await make_worker(redis, fail_save=True)
+    assert not await worker.process_batch(batch())
+    assert redis.acked == [] and redis.published == [] and redis.data == {}
+    # Nothing reached Redis after the script load
+    assert redis.round_trips == 1
+
+
+@pytest.mark.asyncio
+async def test_stop_drains_the_buffer_without_reading_again():
+    redis = AckRedis()
+    worker = await make_worker(redis)
+    reads = []
+
+    async def read(capacity, block):
+        reads.append((capacity, block))
+        # SIGTERM arrives while a partial batch is buffered
+        worker.stop()
+        return batch()
+    worker.read = read
+
+    await worker.run(batch_size=10, block_ms=5000, max_latency_ms=60000)
+    assert reads == [(10, 5000)]
+    assert len(redis.acked) == 3 and len(redis.published) == 3
+
+
+class SchemaConnection:
+    """Sync connection double for create_unique_analysis_index: records SQL, reports `deleted` rows."""
+    def __init__(self, deleted=0):
+        self.statements = []
+        self.deleted = deleted
+
+    def execute(self, statement, params=None):
+        self.statements.append(str(statement.compile(dialect=postgresql.dialect())))
+        return SimpleNamespace(rowcount=self.deleted)
+
+
+def with_indexes(monkeypatch, names):
+    inspector = SimpleNamespace(get_indexes=lambda table: [{"name": name} for name in names])
+    monkeypatch.setattr(worker_module, "inspect", lambda conn: inspector)
+
+
+def test_duplicates_are_removed_before_the_unique_index_under_the_schema_lock(monkeypatch):
+    with_indexes(monkeypatch, ["idx_created_at_id"])
+    conn = SchemaConnection(deleted=4)
+    assert create_unique_analysis_index(conn) == 4
+    lock, dedupe, index = conn.statements
+    assert lock.startswith("SELECT pg_advisory_xact_lock")
+    assert dedupe.strip().startswith("DELETE FROM sentiment_analysis AS older")
+    assert index.startswith("CREATE UNIQUE INDEX IF NOT EXISTS uq_analysis_post_model")
+
+
+def test_a_worker_starting_after_the_migration_only_takes_the_lock(monkeypatch):
+    with_indexes(monkeypatch, ["idx_created_at_id", "uq_analysis_post_model"])
+    conn = SchemaConnection()
+    assert create_unique_analysis_index(conn) == 0
+    assert len(conn.statements) == 1 and "pg_advisory_xact_lock" in conn.statements[0]
+
+
+class FakeSession:
+    """AsyncSession double whose analysis INSERT ... RETURNING reports `new` (post_id, model_name) rows."""
+    def __init__(self, new):
+        self.new = new
+        self.statements = []
+        self.committed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement):
+        self.statements.append(str(statement.compile(dialect=postgresql.dialect())))
+        return SimpleNamespace(all=lambda: list(self.new))
+
+    async def commit(self):
+        self.committed = True
+
+    async def rollback(self):
+        pass
+
+
+async def saving_worker(redis, session):
+    worker = SentimentWorker(redis, lambda: session, "posts", "group", engine=FakeEngine())
+    await worker.event_log.load()
+    return worker
+
+
+@pytest.mark.asyncio
+async def test_a_redelivered_post_is_treated_as_already_inserted():
+    redis = AckRedis()
+    # p2's analysis hit the (post_id, model_name) conflict, so RETURNING left it out
+    session = FakeSession(new=[("p1", "fake-sentiment"), ("p3", "fake-sentiment")])
+    worker = await saving_worker(redis, session)
+    assert await worker.process_batch(batch())
+
+    posts, analyses, *rollups = session.statements
+    assert "ON CONFLICT (post_id) DO NOTHING" in posts
+    assert "ON CONFLICT (post_id, model_name) DO NOTHING RETURNING" in analyses
+    assert len(rollups) == 3 and session.committed
+    assert [json.loads(m)["post_id"] for _, m in redis.published] == ["p1", "p3"]
+    assert len(redis.acked) == 3
+
+
+@pytest.mark.asyncio
+async def test_a_fully_redelivered_batch_is_acked_without_rollups_or_events():
+    redis = AckRedis()
+    session = FakeSession(new=[])
+    worker = await saving_worker(redis, session)
+    assert await worker.process_batch(batch())
+
+    # The two inserts only: nothing new to count in the rollups
+    assert len(session.statements) == 2 and session.committed
+    assert redis.published == [] and redis.data == {}
+    assert len(redis.acked) == 3
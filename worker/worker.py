@@ -1,159 +1,424 @@
 import os
+import json
+import signal
 import asyncio
 import logging
 from datetime import datetime
 from redis.asyncio import Redis
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import inspect, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.schema import CreateIndex
 from services.sentiment_analyzer import SentimentAnalyzer
-from models import SocialMediaPost, SentimentAnalysis
+from services.inference_engine import InferenceEngine
+from services.inference_cache import InferenceCache
+from services.backpressure import AdaptiveBatchController
+from services.reclaimer import PendingReclaimer
+from services.sharding import StreamRouter, parse_weights
+from services.scheduler import WeightedFairScheduler
+from services.event_log import EventLog
+from services.micro_batch import MicroBatchBuffer
+from services.rollups import rollup_rows, upsert_rollups, backfill_rollups
+from models import SocialMediaPost, SentimentAnalysis, uq_analysis_post_model, idx_created_at_id
+from database import create_db_engine, create_session_maker
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("Worker")
 
-DATABASE_URL = os.getenv("DATABASE_URL")
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(bind=engine)
+# Pub/sub channel the API's WebSocket fan-out listens on
+EVENTS_CHANNEL = os.getenv("SENTIMENT_EVENTS_CHANNEL", "sentiment_events")
+
+# Bumped after every batch with new results; the API's response cache keys on it
+DATA_VERSION_KEY = os.getenv("DATA_VERSION_KEY", "sentistream:data_version")
+
+# Async (asyncpg) engine, pool configured through DB_POOL_* (see database.py)
+engine = create_db_engine()
+SessionLocal = create_session_maker(engine)
+
+def parse_created_at(raw):
+    """Stream messages carry ISO timestamps with a trailing 'Z'; fall back to now."""
+    if raw:
+        try:
+            return datetime.fromisoformat(str(raw).replace('Z', ''))
+        except ValueError:
+            pass
+    return datetime.utcnow()
+
+def event_payload(post_data, analysis):
+    """Compact JSON event for the live feed; the dashboard shows at most 100 chars."""
+    return json.dumps({
+        "post_id": post_data['post_id'],
+        "content": str(post_data.get('content', ''))[:100],
+        "source": post_data.get('source', 'unknown'),
+        "sentiment": analysis['sentiment_label'],
+        "confidence": analysis['confidence_score'],
+        "emotion": analysis.get('emotion'),
+        "created_at": post_data.get('created_at'),
+    }, separators=(",", ":"))
+
+async def save_posts_and_analyses(db_session, records):
+    """
+    Persist a whole batch of (post_data, analysis) pairs, where analysis is an
+    SentimentAnalyzer.analyze_full record, in
+    one transaction: a multi-row INSERT ... ON CONFLICT DO NOTHING for the
+    posts and one for the analysis rows. Redelivered messages hit the
+    conflicts and become no-ops. The new analyses are added to the minute,
+    hour and day rollups in the same transaction, so the trend counts match
+    the rows exactly. Returns the post_ids whose analysis was new.
+    """
+    now = datetime.utcnow()
+    posts, analyses = {}, {}
+    for post_data, analysis in records:
+        post_id = post_data['post_id']
+        posts[post_id] = {
+            "post_id": post_id,
+            "source": post_data.get('source', 'unknown'),
+            "content": post_data['content'],
+            "author": post_data.get('author', 'anonymous'),
+            "created_at": parse_created_at(post_data.get('created_at')),
+            "ingested_at": now
+        }
+        model_name = analysis.get('model_name') or "static_rule"
+        analyses[(post_id, model_name)] = {
+            "post_id": post_id,
+            "model_name": model_name,
+            "sentiment_label": analysis.get('sentiment_label') or 'neutral',
+            "confidence_score": analysis.get('confidence_score') or 0.0,
+            # None when EMOTION_POLICY skipped the post, the API fills it in on demand
+            "emotion": analysis.get('emotion'),
+            "analyzed_at": now
+        }
+    if not posts:
+        return []
 
-# FIX 1: Remove 'async' from this function
-def save_post_and_analysis(db_session, post_data, sentiment_result, emotion_result):
     try:
-        existing_post = db_session.query(SocialMediaPost).filter_by(post_id=post_data['post_id']).first()
-        
-        if existing_post:
-            existing_post.ingested_at = datetime.utcnow()
-            post_record = existing_post
-        else:
-            # FIX: Ensure created_at is NEVER None
-            created_at = post_data.get('created_at')
-            if created_at is None:
-                created_at = datetime.utcnow()
-
-            post_record = SocialMediaPost(
-                post_id=post_data['post_id'],
-                source=post_data.get('source', 'unknown'),
-                content=post_data['content'],
-                author=post_data.get('author', 'anonymous'),
-                created_at=created_at # Now it's guaranteed to have a value!
-            )
-            db_session.add(post_record)
-        
-        db_session.flush()
-
-        analysis_record = SentimentAnalysis(
-            post_id=post_data['post_id'],
-            model_name=sentiment_result['model_name'],
-            sentiment_label=sentiment_result['sentiment_label'],
-            confidence_score=sentiment_result['confidence_score'],
-            emotion=emotion_result['emotion']
+        # The ingester usually inserted the post already, leave it untouched
+        await db_session.execute(
+            pg_insert(SocialMediaPost).values(list(posts.values()))
+            .on_conflict_do_nothing(index_elements=['post_id'])
         )
-        db_session.add(analysis_record)
-        db_session.commit()
-        return post_record.id, analysis_record.id
+        inserted = (await db_session.execute(
+            pg_insert(SentimentAnalysis).values(list(analyses.values()))
+            .on_conflict_do_nothing(index_elements=['post_id', 'model_name'])
+            .returning(SentimentAnalysis.post_id, SentimentAnalysis.model_name)
+        )).all()
+        if inserted:
+            # Bucketed by the post's created_at, like the aggregate endpoint
+            await upsert_rollups(db_session, rollup_rows(
+                (posts[post_id]["created_at"], posts[post_id]["source"],
+                 analyses[(post_id, model_name)]["sentiment_label"], analyses[(post_id, model_name)]["confidence_score"])
+                for post_id, model_name in inserted
+            ))
+        await db_session.commit()
+        return [post_id for post_id, _ in inserted]
     except Exception as e:
-        db_session.rollback()
+        await db_session.rollback()
         logger.error(f"Database Save Error: {e}")
         raise e
 
 class SentimentWorker:
-    def __init__(self, redis_client, db_session_maker, stream_name, consumer_group):
+    def __init__(self, redis_client, db_session_maker, stream_name, consumer_group, engine=None, cache=None, model_type='local', controller=None, reclaim=False, router=None, priorities=None):
         self.redis = redis_client
+        # Live feed: published on EVENTS_CHANNEL and kept in a capped stream for replay
+        self.event_log = EventLog(redis_client, EVENTS_CHANNEL)
         self.SessionLocal = db_session_maker
         self.stream_name = stream_name
         self.group_name = consumer_group
-        self.consumer_name = f"worker_{os.getpid()}"
-        self.analyzer = SentimentAnalyzer(model_type='local')
+        # Shard streams (just stream_name unless STREAM_SHARD_MODE is set),
+        # read in proportion to their per-shard priorities
+        self.router = router or StreamRouter(stream_name)
+        shards = self.router.streams()
+        self.streams = list(shards)
+        priorities = priorities if priorities is not None else parse_weights(os.getenv("STREAM_PRIORITIES", ""))
+        self.scheduler = WeightedFairScheduler({stream: priorities.get(name, 1.0) for stream, name in shards.items()})
+        # The supervisor gives each child a stable name, so a restarted
+        # child picks up its predecessor's pending messages
+        self.consumer_name = os.getenv("WORKER_CONSUMER_NAME") or f"worker_{os.getpid()}"
+        # With an InferenceEngine the models run in its process pool and the
+        # loop stays free for Redis reads and acks
+        self.engine = engine
+        self.cache = cache
+        self.analyzer = SentimentAnalyzer(model_type=model_type, engine=engine, cache=cache)
+        # Optional AdaptiveBatchController: batch size and flush interval
+        # follow the consumer group's lag instead of the run() arguments
+        self.controller = controller
+        # Optional PendingReclaimer: takes over messages left pending by
+        # crashed consumers and dead-letters the ones that keep failing
+        self.reclaimers = [
+            PendingReclaimer(redis_client, stream, consumer_group, self.consumer_name) for stream in self.streams
+        ] if reclaim else []
+        self._stopping = False
+
+    def stop(self):
+        """Ask run() to finish the in-flight batch and return (SIGTERM handler)."""
+        if not self._stopping:
+            logger.info(f"🛑 {self.consumer_name} draining...")
+        self._stopping = True
 
     async def setup(self):
+        await self.event_log.load()
+        for stream in self.streams:
+            try:
+                await self.redis.xgroup_create(stream, self.group_name, id="0", mkstream=True)
+            except Exception:
+                logger.info(f"Consumer group ready on {stream}.")
+
+    async def process_message(self, message_id, message_data, stream=None):
+        """Single-message entry point, kept for callers outside the run loop."""
+        await self.process_batch([(stream or self.stream_name, message_id, message_data)])
+
+    async def process_batch(self, messages):
+        """Analyse a list of (stream, message_id, message_data) tuples with one
+        fused analyzer call, then save and ack them. Returns False when the
+        batch was left pending."""
+        messages = [(stream, m_id, m_data) for stream, m_id, m_data in messages if m_data]
+        if not messages:
+            return True
+
+        # 1. Run the AI analysis once for the whole batch (both models concurrently)
+        texts = [m_data.get('content', '') for _, _, m_data in messages]
         try:
-            await self.redis.xgroup_create(self.stream_name, self.group_name, id="0", mkstream=True)
-        except Exception:
-            logger.info("Consumer group ready.")
+            analyses = await self.analyzer.analyze_full(texts)
+        except Exception as e:
+            # Nothing gets acked, so the messages stay pending for a retry
+            logger.error(f"❌ Batch inference failed for {len(messages)} messages: {e}")
+            return False
 
-# Inside worker/worker.py
+        # 2. Map results back to message ids and save the whole batch in one
+        # transaction on the async engine, so the loop keeps reading meanwhile
+        records = [(message_data, analysis) for (_, _, message_data), analysis in zip(messages, analyses)]
+        try:
+            inserted = set(await self.save_batch(records))
+        except Exception as e:
+            logger.error(f"❌ Error saving batch of {len(messages)} messages: {e}")
+            return False
 
-    async def process_message(self, message_id, message_data):
-        # This is where we add the "with" block to create a private DB session
-        # for THIS specific message. This prevents the "Different Loop" error.
-        with self.SessionLocal() as db: 
-            try:
-                # 1. Run your AI analysis
-                sentiment = await self.analyzer.analyze_sentiment(message_data['content'])
-                emotion = await self.analyzer.analyze_emotion(message_data['content'])
-
-                # 2. Use the 'db' session we just created to save the data
-                # We use the executor to keep the database work from blocking the loop
-                loop = asyncio.get_running_loop()
-                await loop.run_in_executor(
-                    None, 
-                    self.save_to_db,  # This is a helper function we define below
-                    db, 
-                    message_data, 
-                    sentiment, 
-                    emotion
-                )
-
-                # 3. Tell Redis we are done
-                await self.redis.xack(self.stream_name, self.group_name, message_id)
-                logger.info(f"✅ Processed: {message_data.get('post_id')}")
-                
-            except Exception as e:
-                logger.error(f"❌ Error processing {message_id}: {e}")
-                db.rollback() # Rollback if something fails
-    # --- ADD IT HERE ---
-    def save_to_db(self, db, data, sentiment, emotion):
-        """Safe database save that handles different AI return formats"""
-        from models import SocialMediaPost, SentimentAnalysis
-        from datetime import datetime
-        
-        # 1. Save or Update the Post
-        post = SocialMediaPost(
-            post_id=data['post_id'],
-            source=data.get('source', 'unknown'),
-            content=data['content'],
-            author=data.get('author', 'unknown'),
-            created_at=datetime.utcnow()
-        )
-        db.merge(post) 
-        
-        # 2. Extract AI results safely (The fix for the 'label' error)
-        # We try all possible keys used by HuggingFace pipelines
-        label = sentiment.get('label') or sentiment.get('sentiment_label') or 'neutral'
-        score = sentiment.get('score') or sentiment.get('confidence_score') or 0.0
-        emo = emotion.get('label') or emotion.get('emotion') or 'neutral'
-
-        # 3. Save the Analysis
-        analysis = SentimentAnalysis(
-            post_id=data['post_id'],
-            model_name="distilbert-sst2",
-            sentiment_label=label,
-            confidence_score=score,
-            emotion=emo
+        # 3. Ack the batch (one XACK per shard stream), publish the new
+        # results to the live feed and its replay log (EVALSHA of the
+        # preloaded append script) and bump the data versions, all in one
+        # round trip. Redelivered messages whose analysis already existed
+        # are not published again.
+        by_stream = {}
+        for stream, m_id, _ in messages:
+            by_stream.setdefault(stream, []).append(m_id)
+        pipe = self.redis.pipeline(transaction=False)
+        for stream, ids in by_stream.items():
+            pipe.xack(stream, self.group_name, *ids)
+        sources, events = set(), []
+        for post_data, analysis in records:
+            if post_data.get('post_id') in inserted:
+                inserted.discard(post_data['post_id'])
+                sources.add(post_data.get('source', 'unknown'))
+                events.append(event_payload(post_data, analysis))
+                self.event_log.append(pipe, events[-1])
+        if sources:
+            # New data: cached API responses for everything and for these sources are now stale
+            pipe.incr(DATA_VERSION_KEY)
+            for source in sources:
+                pipe.incr(f"{DATA_VERSION_KEY}:{source}")
+        results = await pipe.execute(raise_on_error=False)
+        n_acks, n_events = len(by_stream), len(events)
+        acks, appended, versions = results[:n_acks], results[n_acks:n_acks + n_events], results[n_acks + n_events:]
+        errors = [r for r in acks + versions if isinstance(r, Exception)]
+        errors += await self.event_log.recover(appended, events)
+        if errors:
+            raise errors[0]
+        stats = ""
+        if self.cache is not None:
+            stats += f" | cache {self.cache.stats()}"
+        if self.analyzer.cascade:
+            stats += f" | stages {self.analyzer.stage_counts}"
+        if self.controller is not None:
+            stats += f" | lag {self.controller.stats()}"
+        logger.info(f"✅ Processed batch of {len(messages)} messages{stats}")
+        return True
+
+    async def process_reclaimed(self, batch_size):
+        """Retry messages reclaimed from the pending list. A failing batch is
+        retried one message at a time, so only the poison message itself
+        stays pending and moves towards the dead-letter stream."""
+        for reclaimer in self.reclaimers:
+            claimed = [(reclaimer.stream_name, m_id, m_data) for m_id, m_data in await reclaimer.reclaim()]
+            for i in range(0, len(claimed), batch_size):
+                batch = claimed[i:i + batch_size]
+                if not await self.process_batch(batch) and len(batch) > 1:
+                    for message in batch:
+                        await self.process_batch([message])
+            await reclaimer.prune_consumers()
+
+    async def read(self, capacity, block):
+        """Read up to about `capacity` new messages as (stream, id, data) tuples.
+
+        A single stream is read with one blocking XREADGROUP. Shards get
+        their weighted quotas in one pipelined non-blocking read; only if
+        that finds nothing does it block on all shards at once.
+        """
+        if len(self.streams) == 1:
+            response = await self.redis.xreadgroup(
+                self.group_name, self.consumer_name, {self.streams[0]: ">"}, count=capacity, block=block
+            )
+            return [(stream, m_id, m_data) for stream, msgs in response or [] for m_id, m_data in msgs]
+
+        messages, backlogged = [], []
+        for stream, quota, msgs in await self._read_quotas(self.scheduler.quotas(capacity)):
+            self.scheduler.record(stream, quota, len(msgs))
+            if len(msgs) == quota:
+                backlogged.append(stream)
+            messages.extend(msgs)
+        # Hand what idle shards left over to the ones that still have messages
+        for _, _, msgs in await self._read_quotas(self.scheduler.spare(capacity - len(messages), backlogged)):
+            messages.extend(msgs)
+        if messages or not block:
+            return messages
+
+        # Everything is idle: wait for the first message on any shard
+        response = await self.redis.xreadgroup(
+            self.group_name, self.consumer_name, {stream: ">" for stream in self.streams},
+            count=max(1, capacity // len(self.streams)), block=block
         )
-        db.add(analysis)
-        db.commit()
+        return [(stream, m_id, m_data) for stream, msgs in response or [] for m_id, m_data in msgs]
+
+    async def _read_quotas(self, quotas):
+        """One pipelined non-blocking XREADGROUP per stream: [(stream, quota, messages)]."""
+        if not quotas:
+            return []
+        pipe = self.redis.pipeline(transaction=False)
+        for stream, quota in quotas.items():
+            pipe.xreadgroup(self.group_name, self.consumer_name, {stream: ">"}, count=quota)
+        return [
+            (stream, quota, [(stream, m_id, m_data) for _, msgs in response or [] for m_id, m_data in msgs])
+            for (stream, quota), response in zip(quotas.items(), await pipe.execute())
+        ]
 
-    async def run(self, batch_size=10, block_ms=5000):
+    async def save_batch(self, records):
+        """Bulk, idempotent save of one batch using a private DB session."""
+        async with self.SessionLocal() as db:
+            return await save_posts_and_analyses(db, records)
+
+    async def run(self, batch_size=10, block_ms=5000, max_latency_ms=250):
+        """Consume the stream in micro-batches.
+
+        Messages are buffered across XREADGROUP calls until either
+        `batch_size` are waiting or the oldest one has waited
+        `max_latency_ms`, so a slow trickle is not held back by a full batch.
+        With a controller both limits are re-read from it every iteration.
+        After stop() no new messages are read; the buffer is processed and
+        acked before returning.
+        """
         await self.setup()
+        if self.engine is not None:
+            await self.engine.warmup()
         logger.info(f"🚀 {self.consumer_name} ready.")
-        while True:
+        buffer = MicroBatchBuffer()
+        while not self._stopping:
             try:
-                messages = await self.redis.xreadgroup(
-                    self.group_name, self.consumer_name, {self.stream_name: ">"}, 
-                    count=batch_size, block=block_ms
-                )
-                if not messages: continue
-                for _, msgs in messages:
-                    tasks = [self.process_message(m_id, m_data) for m_id, m_data in msgs]
-                    await asyncio.gather(*tasks)
+                if self.controller is not None:
+                    await self.controller.refresh(self.consumer_name)
+                    batch_size, max_latency_ms = self.controller.batch_size, self.controller.latency_ms
+                if self.reclaimers and not buffer and self.reclaimers[0].due():
+                    await self.process_reclaimed(batch_size)
+                if buffer.ready(batch_size):
+                    await self.process_batch(buffer.take())
+                    continue
+                messages = await self.read(batch_size - len(buffer), buffer.wait_ms(block_ms))
+                buffer.add(messages, max_latency_ms)
             except Exception as e:
                 logger.error(f"Loop error: {e}")
                 await asyncio.sleep(2)
 
-if __name__ == "__main__":
+        if buffer:
+            await self.process_batch(buffer.take())
+        logger.info(f"👋 {self.consumer_name} stopped.")
+
+# Keeps the newest analysis of every (post_id, model_name) pair
+DEDUPE_ANALYSES_SQL = f"""
+DELETE FROM {SentimentAnalysis.__tablename__} AS older
+USING {SentimentAnalysis.__tablename__} AS newer
+WHERE older.post_id = newer.post_id AND older.model_name = newer.model_name AND older.id < newer.id
+"""
+
+# Transaction-scoped advisory lock serializing schema changes across worker starts
+SCHEMA_LOCK_KEY = 0x5E4715
+
+def create_unique_analysis_index(sync_conn) -> int:
+    """
+    Add uq_analysis_post_model to a database created before it existed.
+    Databases written by the old per-row inserts can hold duplicate
+    analyses, which would make the index fail; they are removed first,
+    in the same transaction. Workers starting together queue on
+    SCHEMA_LOCK_KEY until that transaction commits, so only the first one
+    dedupes and the others find the index in place. Returns the number of
+    rows deleted.
+    """
+    sync_conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": SCHEMA_LOCK_KEY})
+    existing = inspect(sync_conn).get_indexes(SentimentAnalysis.__tablename__)
+    if any(ix["name"] == uq_analysis_post_model.name for ix in existing):
+        return 0
+    removed = sync_conn.execute(text(DEDUPE_ANALYSES_SQL)).rowcount
+    sync_conn.execute(CreateIndex(uq_analysis_post_model, if_not_exists=True))
+    return removed
+
+async def init_schema():
     from models import Base
-    Base.metadata.create_all(bind=engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    # create_all skips tables that already exist, so add the idempotency
+    # and pagination indexes separately on older databases. Every batch
+    # insert relies on ON CONFLICT (post_id, model_name), so failing to
+    # create the unique index stops the worker here instead of at runtime.
+    async with engine.begin() as conn:
+        removed = await conn.run_sync(create_unique_analysis_index)
+    if removed:
+        logger.warning(f"🧹 Removed {removed} duplicate analyses before adding {uq_analysis_post_model.name}")
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(lambda sync_conn: idx_created_at_id.create(bind=sync_conn, checkfirst=True))
+    except Exception as e:
+        logger.error(f"Could not create index {idx_created_at_id.name}: {e}")
+    # Rollup tables created just now start from the existing history
+    async with engine.begin() as conn:
+        filled = await conn.run_sync(backfill_rollups)
+    if filled:
+        logger.info(f"📊 Backfilled rollups: {filled}")
+    # The pooled connections belong to this event loop, main() runs in another
+    await engine.dispose()
 
+async def main():
     redis_conn = Redis(host=os.getenv("REDIS_HOST", "redis"), port=6379, decode_responses=True)
-    worker = SentimentWorker(redis_conn, SessionLocal, os.getenv("REDIS_STREAM_NAME", "social_posts_stream"), "sentiment_workers")
-    asyncio.run(worker.run())
\ No newline at end of file
+    # INFERENCE_REPLICAS=0 keeps the models in this process (thread executor)
+    # 'local' (PyTorch) or 'onnx'; check parity first with: python -m services.onnx_backend
+    model_type = os.getenv("SENTIMENT_MODEL_TYPE", "local")
+    # Only local models run in replicas, the external API needs none
+    use_engine = model_type.lower() in ("local", "onnx") and os.getenv("INFERENCE_REPLICAS", "") != "0"
+    inference_engine = InferenceEngine(model_type=model_type) if use_engine else None
+    inference_cache = InferenceCache(redis_conn) if os.getenv("INFERENCE_CACHE", "1") != "0" else None
+    stream_name = os.getenv("REDIS_STREAM_NAME", "social_posts_stream")
+    # STREAM_SHARD_MODE / STREAM_SHARDS / STREAM_SOURCES must match the ingester
+    router = StreamRouter(stream_name)
+    batch_size = int(os.getenv("WORKER_BATCH_SIZE", 32))
+    max_latency_ms = int(os.getenv("WORKER_MAX_LATENCY_MS", 250))
+    # WORKER_ADAPTIVE_BATCHING=0 pins the batch size and flush interval above
+    controller = AdaptiveBatchController(
+        redis_conn, stream_name, "sentiment_workers", batch_size=batch_size, latency_ms=max_latency_ms,
+        streams=list(router.streams())
+    ) if os.getenv("WORKER_ADAPTIVE_BATCHING", "1") != "0" else None
+    worker = SentimentWorker(
+        redis_conn, SessionLocal, stream_name, "sentiment_workers",
+        engine=inference_engine, cache=inference_cache, model_type=model_type, controller=controller,
+        # RECLAIM_PENDING=0 leaves other consumers' pending messages alone
+        reclaim=os.getenv("RECLAIM_PENDING", "1") != "0", router=router
+    )
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, worker.stop)
+    try:
+        await worker.run(batch_size=batch_size, max_latency_ms=max_latency_ms)
+    finally:
+        if inference_engine is not None:
+            inference_engine.shutdown()
+        await redis_conn.aclose()
+        await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(init_schema())
+    asyncio.run(main())